@@ -0,0 +1,169 @@
+"""
+Semantic answer cache for the LLM agent.
+Stores final verbose/avatar answers keyed by the embedding of the normalized standalone
+question, and invalidates entries when the documents they were grounded on change.
+"""
+
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List
+import numpy as np
+from vector_store import embeddings, register_write_listener
+from tracing import register_stats
+
+# Configuration
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000))
+
+MODE_TAG_PATTERN = re.compile(r"^\s*\[MODE:\s*([A-Z_]+)\]\s*", re.IGNORECASE)
+
+
+def split_mode_tag(question: str):
+    """Split an optional leading [MODE: ...] tag from a question"""
+    match = MODE_TAG_PATTERN.match(question or "")
+    if not match:
+        return None, (question or "")
+    return match.group(1).upper(), question[match.end():]
+
+
+def normalize_question(question: str) -> str:
+    """Normalize a question for cache keys (case, whitespace, trailing punctuation)"""
+    text = (question or "").lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip("?!. ")
+
+
+class SemanticAnswerCache:
+    """Bounded LRU cache of final answers with similarity lookup, TTL and document invalidation"""
+
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl_seconds: int = ANSWER_CACHE_TTL_SECONDS,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        embed_fn=None
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.embed_fn = embed_fn or embeddings.embed_query
+        self._entries: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, question: str):
+        """Build the (mode, normalized text) key for a question"""
+        mode, text = split_mode_tag(question)
+        return (mode, normalize_question(text))
+
+    def _embed(self, text: str, embedding=None) -> np.ndarray:
+        """Embed text (unless its embedding is given) and L2-normalize it so a dot product is the cosine similarity"""
+        vector = np.asarray(self.embed_fn(text) if embedding is None else embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expire(self, now: float):
+        """Drop entries older than the TTL (caller holds the lock)"""
+        expired = [key for key, entry in self._entries.items() if now - entry["created_at"] > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+
+    def lookup(self, question: str, embedding=None) -> Optional[Dict[str, Any]]:
+        """Return the cached answer for a question, or None on a miss (embedding: the question's, when already computed)"""
+        key = self._key(question)
+        if not key[1]:
+            return None
+        now = time.time()
+
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return {"verbose": entry["verbose"], "avatar": entry["avatar"], "similarity": 1.0, "key": key}
+            candidates = [(k, e) for k, e in self._entries.items() if k[0] == key[0]]
+
+        if not candidates:
+            self.misses += 1
+            return None
+
+        query_vector = self._embed(key[1], embedding)
+        matrix = np.stack([entry["embedding"] for _, entry in candidates])
+        scores = matrix @ query_vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            self.misses += 1
+            return None
+
+        best_key, best_entry = candidates[best]
+        with self._lock:
+            if best_key not in self._entries:
+                # Invalidated while we were scoring
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+        return {"verbose": best_entry["verbose"], "avatar": best_entry["avatar"], "similarity": float(scores[best]), "key": best_key}
+
+    def store(self, question: str, verbose: str, avatar: Optional[str], doc_ids: List[str] = None, embedding=None):
+        """Cache a final answer with the document IDs it was grounded on, returns its key (None if not cached)"""
+        key = self._key(question)
+        if not key[1] or not verbose:
+            return None
+        entry = {
+            "embedding": self._embed(key[1], embedding),
+            "verbose": verbose,
+            "avatar": avatar,
+            "doc_ids": set(doc_ids or []),
+            "created_at": time.time()
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return key
+
+    def fill_avatar(self, key, avatar: str):
+        """Set the avatar text of an entry cached without one (avatar generated later or skipped)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["avatar"] is None:
+                entry["avatar"] = avatar
+
+    def invalidate_document(self, doc_id: Optional[str], action: str = "delete") -> int:
+        """Drop entries grounded on a document; additions also drop ungrounded entries"""
+        with self._lock:
+            stale = [
+                key for key, entry in self._entries.items()
+                if (doc_id is not None and doc_id in entry["doc_ids"])
+                or (action == "add" and not entry["doc_ids"])
+                or (doc_id is None)
+            ]
+            for key in stale:
+                del self._entries[key]
+        if stale:
+            print(f"Answer cache: invalidated {len(stale)} entries after {action} of doc_id: {doc_id}")
+        return len(stale)
+
+    def clear(self):
+        """Remove every cached answer"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache size and hit/miss counters"""
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# Shared cache instance, invalidated on every vector store write
+answer_cache = SemanticAnswerCache()
+register_write_listener(answer_cache.invalidate_document)
+register_stats("answer_cache", answer_cache.stats)
@@ -4,21 +4,56 @@ Provides JWT token-based authentication, password hashing, and role-based access
 """
 
 import os
-import json
+import time
+import asyncio
 import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 import yaml
+from prometheus_client import Counter, Histogram
+from user_store import SQLiteUserStore, USERS_FILE, USERS_DB_PATH
+from ldap_backend import LDAPBackend, LDAPUnavailable, AUTH_BACKEND
+from tracing import register_stats
 
 # Configuration
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-this-in-production")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60))
+# bcrypt runs on its own thread pool (it releases the GIL, so workers run in parallel up to the CPU count)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", 64))
+# Verified tokens are cached per worker; changes made through another worker are seen after at most the TTL
+TOKEN_CACHE_ENABLED = os.getenv("TOKEN_CACHE_ENABLED", "true").lower() == "true"
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", 10000))
+TOKEN_CACHE_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", 300))
+# Stored as the password hash of users provisioned from the directory (they cannot log in locally)
+DIRECTORY_PASSWORD = "!ldap"
+
+PASSWORD_HASH_QUEUE_WAIT = Histogram(
+    "vega_password_hash_queue_wait_seconds",
+    "Time bcrypt operations wait for a password hashing worker",
+    ["operation"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10)
+)
+PASSWORD_HASH_SECONDS = Histogram(
+    "vega_password_hash_seconds",
+    "bcrypt hash/verify duration on a password hashing worker",
+    ["operation"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2)
+)
+PASSWORD_HASH_REJECTIONS = Counter(
+    "vega_password_hash_rejections_total",
+    "bcrypt operations rejected because the password hashing queue was full",
+    ["operation"]
+)
 
 # Password hashing context
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -27,6 +62,148 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
 
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification on a dedicated bounded thread pool, so logins never block
+    the event loop. At most max_queue operations wait for a worker; more are rejected with HTTP 503.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_queue: int = PASSWORD_HASH_MAX_QUEUE):
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.rejected = 0
+
+    def _run(self, operation: str, fn, args: tuple, submitted: float):
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        started = time.perf_counter()
+        PASSWORD_HASH_QUEUE_WAIT.labels(operation).observe(started - submitted)
+        try:
+            return fn(*args)
+        finally:
+            PASSWORD_HASH_SECONDS.labels(operation).observe(time.perf_counter() - started)
+            with self._lock:
+                self.running -= 1
+
+    async def _submit(self, operation: str, fn, *args):
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                PASSWORD_HASH_REJECTIONS.labels(operation).inc()
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many logins in progress, please retry shortly",
+                    headers={"Retry-After": "1"}
+                )
+            self.queued += 1
+        future = self._executor.submit(self._run, operation, fn, args, time.perf_counter())
+        # A job cancelled while waiting (client gone) never reaches _run, so its queue slot is given back here
+        future.add_done_callback(self._release_cancelled)
+        return await asyncio.wrap_future(future)
+
+    def _release_cancelled(self, future):
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    async def hash(self, password: str) -> str:
+        """bcrypt hash of a password"""
+        return await self._submit("hash", pwd_context.hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """Check a password against its bcrypt hash"""
+        return await self._submit("verify", pwd_context.verify, plain_password, hashed_password)
+
+    def stats(self) -> Dict[str, int]:
+        """Return queued, running and rejected operation counts"""
+        with self._lock:
+            return {"queued": self.queued, "running": self.running, "rejected": self.rejected}
+
+
+# Shared hasher instance
+password_hasher = PasswordHasher()
+register_stats("password_hasher", password_hasher.stats)
+
+
+class TokenCache:
+    """Bounded LRU cache of verified JWT → User principal, each entry expiring no later than the token's exp"""
+
+    def __init__(
+        self,
+        max_entries: int = TOKEN_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = TOKEN_CACHE_TTL_SECONDS,
+        enabled: bool = TOKEN_CACHE_ENABLED
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # token -> (principal, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional["User"]:
+        """Cached principal of a token verified earlier, or None (the returned User is shared, do not modify it)"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and entry[1] > time.time():
+                self._entries.move_to_end(token)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[token]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, principal: "User", exp: Optional[float]):
+        """Cache a verified token's principal until min(exp, now + TTL)"""
+        if not self.enabled:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+        with self._lock:
+            self._entries[token] = (principal, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, username: str) -> int:
+        """Drop every cached token of a user (after the user was updated or deleted)"""
+        with self._lock:
+            stale = [token for token, (principal, _) in self._entries.items() if principal.username == username]
+            for token in stale:
+                del self._entries[token]
+        return len(stale)
+
+    def clear(self):
+        """Remove every cached token"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache size, hit/miss counters and the hit rate"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+# Shared token cache instance, invalidated by UserManager.update_user/delete_user
+token_cache = TokenCache()
+register_stats("token_cache", token_cache.stats)
+
+
 class User(BaseModel):
     """User model for authentication"""
     username: str
@@ -65,29 +242,33 @@ class Token(BaseModel):
 
 
 class UserManager:
-    """Manages users with secure password hashing and file-based storage"""
+    """
+    Manages users with secure password hashing and SQLite storage (see user_store.py).
+    With an LDAP backend, logins are checked against the directory first; local accounts are used for
+    users the directory does not know and while it is unavailable.
+    """
     
-    def __init__(self, users_file: str = "users.json"):
+    def __init__(self, users_file: str = USERS_FILE, db_path: str = USERS_DB_PATH, ldap: Optional[LDAPBackend] = None):
         self.users_file = users_file
-        self.users_db = self._load_users()
+        self.store = SQLiteUserStore(db_path)
+        self.ldap = ldap
+        self._load_users()
     
-    def _load_users(self) -> Dict[str, UserInDB]:
-        """Load users from file or create default admin user"""
+    def _load_users(self):
+        """Import users.json into an empty store, or create the default users"""
+        if self.store.count():
+            return
         if os.path.exists(self.users_file):
             try:
-                with open(self.users_file, 'r') as f:
-                    users_data = json.load(f)
-                    users = {}
-                    for username, user_data in users_data.items():
-                        users[username] = UserInDB(**user_data)
-                    return users
+                imported = self.store.import_json(self.users_file)
+                print(f"Imported {imported} users from {self.users_file} into {self.store.db_path}")
+                return
             except Exception as e:
-                print(f"Error loading users file: {e}")
+                print(f"Error importing users file: {e}")
         
         # Create default admin user if no users file exists
-        default_users = self._create_default_users()
-        self._save_users(default_users)
-        return default_users
+        for user in self._create_default_users().values():
+            self.store.insert(user.dict())
     
     def _create_default_users(self) -> Dict[str, UserInDB]:
         """Create default users from config.yaml or hardcoded defaults"""
@@ -132,23 +313,6 @@ class UserManager:
         
         return default_users
     
-    def _save_users(self, users: Dict[str, UserInDB]):
-        """Save users to file"""
-        try:
-            users_data = {}
-            for username, user in users.items():
-                users_data[username] = user.dict()
-                # Convert datetime objects to ISO format strings
-                if users_data[username].get("created_at"):
-                    users_data[username]["created_at"] = users_data[username]["created_at"].isoformat()
-                if users_data[username].get("last_login"):
-                    users_data[username]["last_login"] = users_data[username]["last_login"].isoformat()
-            
-            with open(self.users_file, 'w') as f:
-                json.dump(users_data, f, indent=2)
-        except Exception as e:
-            print(f"Error saving users: {e}")
-    
     def hash_password(self, password: str) -> str:
         """Hash a password using bcrypt"""
         return pwd_context.hash(password)
@@ -159,17 +323,11 @@ class UserManager:
     
     def get_user(self, username: str) -> Optional[UserInDB]:
         """Get user by username"""
-        return self.users_db.get(username)
+        user_data = self.store.get(username)
+        return UserInDB(**user_data) if user_data else None
     
-    def create_user(self, user_data: UserCreate) -> UserInDB:
-        """Create a new user"""
-        if user_data.username in self.users_db:
-            raise HTTPException(
-                status_code=400,
-                detail="Username already exists"
-            )
-        
-        hashed_password = self.hash_password(user_data.password)
+    def _insert_new_user(self, user_data: UserCreate, hashed_password: str) -> UserInDB:
+        """Store a new user with an already hashed password"""
         new_user = UserInDB(
             username=user_data.username,
             email=user_data.email,
@@ -179,26 +337,113 @@ class UserManager:
             created_at=datetime.now()
         )
         
-        self.users_db[user_data.username] = new_user
-        self._save_users(self.users_db)
+        # The primary key makes the existence check and the insert one atomic step
+        if not self.store.insert(new_user.dict()):
+            raise HTTPException(
+                status_code=400,
+                detail="Username already exists"
+            )
         return new_user
     
+    def create_user(self, user_data: UserCreate) -> UserInDB:
+        """Create a new user"""
+        return self._insert_new_user(user_data, self.hash_password(user_data.password))
+    
+    async def acreate_user(self, user_data: UserCreate) -> UserInDB:
+        """Non-blocking create_user: the password is hashed on the password hashing pool"""
+        return self._insert_new_user(user_data, await password_hasher.hash(user_data.password))
+    
+    def _record_login(self, user: UserInDB) -> UserInDB:
+        """Update last login (buffered, written by the store's periodic flush)"""
+        user.last_login = datetime.now()
+        self.store.record_login(user.username, user.last_login)
+        return user
+    
+    def _sync_directory_user(self, username: str, entry: Dict[str, Any]) -> Optional[UserInDB]:
+        """
+        Create or refresh the local record of a directory user (email and role follow the directory).
+        Returns None, changing nothing, when the name belongs to a local account.
+        """
+        user = self.get_user(username)
+        if user is None:
+            user = UserInDB(
+                username=username,
+                email=entry["email"],
+                role=entry["role"],
+                hashed_password=DIRECTORY_PASSWORD,
+                is_active=True,
+                created_at=datetime.now()
+            )
+            if self.store.insert(user.dict()):
+                return user
+            # Created by a concurrent login (or a local account created meanwhile)
+            user = self.get_user(username)
+        if user.hashed_password != DIRECTORY_PASSWORD:
+            print(f"Directory user {username} matches a local account, keeping the local account")
+            return None
+        changes = {key: entry[key] for key in ("email", "role") if getattr(user, key) != entry[key]}
+        if changes:
+            return self.update_user(username, **changes) or user
+        return user
+    
+    def _authenticate_directory(self, username: str, password: str) -> Tuple[bool, Optional[UserInDB]]:
+        """
+        Directory login (blocking): (True, user or None) when the directory decided, (False, None) when it
+        does not know the user or is unavailable, so local accounts are checked instead.
+        Local accounts take precedence: a directory entry with the same name never logs in as them.
+        """
+        if self._get_local_user(username):
+            return False, None
+        try:
+            result, entry = self.ldap.authenticate(username, password)
+        except LDAPUnavailable as e:
+            print(f"LDAP unavailable, checking local accounts: {e}")
+            return False, None
+        if result == "not_found":
+            return False, None
+        if result == "invalid":
+            return True, None
+        user = self._sync_directory_user(username, entry)
+        if user is None:
+            return False, None
+        return True, user if user.is_active else None
+    
+    def _get_local_user(self, username: str) -> Optional[UserInDB]:
+        """User with a local password (directory-provisioned users have none)"""
+        user = self.get_user(username)
+        return user if user and user.hashed_password != DIRECTORY_PASSWORD else None
+    
     def authenticate_user(self, username: str, password: str) -> Optional[UserInDB]:
         """Authenticate user credentials"""
-        user = self.get_user(username)
+        if self.ldap:
+            decided, user = self._authenticate_directory(username, password)
+            if decided:
+                return self._record_login(user) if user else None
+        
+        user = self._get_local_user(username)
         if not user:
             return None
         if not self.verify_password(password, user.hashed_password):
             return None
         if not user.is_active:
             return None
+        return self._record_login(user)
+    
+    async def aauthenticate_user(self, username: str, password: str) -> Optional[UserInDB]:
+        """Non-blocking authenticate_user: bcrypt runs on the password hashing pool, LDAP calls in a worker thread"""
+        if self.ldap:
+            decided, user = await asyncio.to_thread(self._authenticate_directory, username, password)
+            if decided:
+                return self._record_login(user) if user else None
         
-        # Update last login
-        user.last_login = datetime.now()
-        self.users_db[username] = user
-        self._save_users(self.users_db)
-        
-        return user
+        user = self._get_local_user(username)
+        if not user:
+            return None
+        if not await password_hasher.verify(password, user.hashed_password):
+            return None
+        if not user.is_active:
+            return None
+        return self._record_login(user)
     
     def update_user(self, username: str, **kwargs) -> Optional[UserInDB]:
         """Update user information"""
@@ -206,39 +451,39 @@ class UserManager:
         if not user:
             return None
         
-        for key, value in kwargs.items():
-            if hasattr(user, key):
-                setattr(user, key, value)
-        
-        self.users_db[username] = user
-        self._save_users(self.users_db)
-        return user
+        changes = {key: value for key, value in kwargs.items() if hasattr(user, key) and key != "username"}
+        user = UserInDB(**{**user.dict(), **changes})
+        updated = self.store.update(username, {key: getattr(user, key) for key in changes})
+        token_cache.invalidate_user(username)
+        return user if updated else None
     
     def delete_user(self, username: str) -> bool:
         """Delete a user"""
-        if username in self.users_db:
-            del self.users_db[username]
-            self._save_users(self.users_db)
-            return True
-        return False
+        deleted = self.store.delete(username)
+        token_cache.invalidate_user(username)
+        return deleted
     
     def list_users(self) -> List[User]:
         """List all users (without password hashes)"""
         return [
             User(
-                username=user.username,
-                email=user.email,
-                role=user.role,
-                is_active=user.is_active,
-                created_at=user.created_at,
-                last_login=user.last_login
+                username=user_data["username"],
+                email=user_data["email"],
+                role=user_data["role"],
+                is_active=user_data["is_active"],
+                created_at=user_data["created_at"],
+                last_login=user_data["last_login"]
             )
-            for user in self.users_db.values()
+            for user_data in self.store.list()
         ]
 
 
-# Initialize user manager
-user_manager = UserManager()
+# Initialize user manager (AUTH_BACKEND=ldap adds directory logins, see ldap_backend.py)
+ldap_backend = LDAPBackend.from_config() if AUTH_BACKEND == "ldap" else None
+user_manager = UserManager(ldap=ldap_backend)
+register_stats("user_store", user_manager.store.stats)
+if ldap_backend:
+    register_stats("ldap", ldap_backend.stats)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -255,7 +500,12 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
-    """Get current user from JWT token"""
+    """Get current user from JWT token (verified tokens are served from token_cache)"""
+    token = credentials.credentials
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
+    
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -263,7 +513,6 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     )
     
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
@@ -275,7 +524,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     if user is None:
         raise credentials_exception
     
-    return User(
+    principal = User(
         username=user.username,
         email=user.email,
         role=user.role,
@@ -283,6 +532,8 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         created_at=user.created_at,
         last_login=user.last_login
     )
+    token_cache.put(token, principal, payload.get("exp"))
+    return principal
 
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
@@ -0,0 +1,89 @@
+"""
+Deferred avatar text store.
+Avatar (text-to-speech) rephrases are generated in the background after the verbose answer
+is returned, and clients fetch them later by response ID.
+"""
+
+import os
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Awaitable
+
+# Configuration
+AVATAR_STORE_MAX_ENTRIES = int(os.getenv("AVATAR_STORE_MAX_ENTRIES", 1000))
+AVATAR_STORE_TTL_SECONDS = int(os.getenv("AVATAR_STORE_TTL_SECONDS", 600))
+
+
+class DeferredAvatarStore:
+    """Bounded, TTL-limited map of response ID -> background avatar generation"""
+
+    def __init__(self, max_entries: int = AVATAR_STORE_MAX_ENTRIES, ttl_seconds: int = AVATAR_STORE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def _new_entry(self, owner: Optional[str]) -> str:
+        """Create an entry and evict expired/oldest ones, returns its response ID"""
+        now = time.time()
+        while self._entries:
+            oldest_id, oldest = next(iter(self._entries.items()))
+            if len(self._entries) < self.max_entries and now - oldest["created_at"] <= self.ttl_seconds:
+                break
+            if oldest["task"] is not None and not oldest["task"].done():
+                oldest["task"].cancel()
+            del self._entries[oldest_id]
+
+        response_id = uuid.uuid4().hex
+        self._entries[response_id] = {
+            "owner": owner,
+            "created_at": now,
+            "status": "pending",
+            "avatar": None,
+            "task": None
+        }
+        return response_id
+
+    def submit(self, generation: Awaitable[str], owner: Optional[str] = None) -> str:
+        """Start generating avatar text in the background, returns the response ID to fetch it with"""
+        response_id = self._new_entry(owner)
+        entry = self._entries[response_id]
+
+        async def run():
+            try:
+                entry["avatar"] = await generation
+                entry["status"] = "ready"
+            except asyncio.CancelledError:
+                entry["status"] = "error"
+                raise
+            except Exception as e:
+                print(f"Error generating deferred avatar text for {response_id}: {str(e)}")
+                entry["status"] = "error"
+
+        entry["task"] = asyncio.create_task(run())
+        return response_id
+
+    def put(self, avatar_text: str, owner: Optional[str] = None) -> str:
+        """Store avatar text that is already available (e.g. from the answer cache)"""
+        response_id = self._new_entry(owner)
+        self._entries[response_id].update(status="ready", avatar=avatar_text)
+        return response_id
+
+    async def get(self, response_id: str, owner: Optional[str] = None, wait_seconds: float = 0) -> Optional[Dict[str, Any]]:
+        """Return {"status", "avatar"} for a response ID, waiting up to wait_seconds for a pending one"""
+        entry = self._entries.get(response_id)
+        if entry is None or (owner is not None and entry["owner"] != owner):
+            return None
+        if time.time() - entry["created_at"] > self.ttl_seconds:
+            del self._entries[response_id]
+            return None
+
+        task = entry["task"]
+        if entry["status"] == "pending" and task is not None and wait_seconds > 0:
+            await asyncio.wait({task}, timeout=wait_seconds)
+        return {"status": entry["status"], "avatar": entry["avatar"]}
+
+
+# Shared store instance
+avatar_store = DeferredAvatarStore()
@@ -1,9 +1,14 @@
 import os
-from typing import List, Dict
-from langchain.chains import ConversationalRetrievalChain
+import asyncio
+from typing import List
 from langchain.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
-from vector_store import vector_store
+from retrieval_cache import retrieval_cache
+from query_log import query_log
+from context_builder import assemble_context
+from llm_client import get_async_client, ResilientAsyncClient, OVERLOAD_ERRORS
+from model_cascade import create_for_stage, condense_check, check_not_empty
+from session_store import SESSION_SUMMARY_KEY
+from tracing import stage, log
 from dotenv import load_dotenv
 
 # === Load credentials from .env file (place it with OPENAI_API_KEY=<your-api-key> within the agenbotc folder)===
@@ -17,12 +22,8 @@ OPENAI_TOKEN = os.getenv('OPENAI_API_KEY')
 if not OPENAI_TOKEN:
     raise ValueError("OPENAI_API_KEY is not set. Please check your .env file or environment variables.")
 
-# Initialize LLM
-llm = ChatOpenAI(
-    model="gpt-4o-mini", 
-    temperature=0.1,
-    api_key=OPENAI_TOKEN
-)
+# Shared async client for the answer path (aget_chatbot_response; per-stage models, see model_cascade.py)
+async_client = get_async_client(OPENAI_TOKEN)
 
 # Custom prompt template for formatted responses
 CONDENSE_QUESTION_PROMPT = PromptTemplate.from_template("""
@@ -96,23 +97,17 @@ Answer:
 
 
 
-qa_chain = ConversationalRetrievalChain.from_llm(
-    llm=llm,
-    retriever=vector_store.as_retriever(
-        search_type="mmr", 
-        search_kwargs={"k": 8, "fetch_k": 24, "lambda_mult": 0.5}
-    ),
-    return_source_documents=True,
-    condense_question_prompt=CONDENSE_QUESTION_PROMPT,
-    combine_docs_chain_kwargs={"prompt": QA_PROMPT},
-    verbose=True
-)
+RETRIEVAL_SEARCH_KWARGS = {"k": 8, "fetch_k": 24, "lambda_mult": 0.5}
 
 
 def format_chat_history(history):
     """Format chat history dict for LLM consumption"""
     formatted_history = []
     if history and isinstance(history, dict):
+        # A running summary of older turns goes first, as its own pair
+        # (server-side sessions roll older turns into it, see session_store.py)
+        if history.get(SESSION_SUMMARY_KEY):
+            formatted_history.append(("Summarize our earlier conversation.", history[SESSION_SUMMARY_KEY]))
         # Convert dict format {"User_message_1": "...", "AI_message_1": "..."} to tuple format
         # Group messages by number and create conversation pairs
         messages = {}
@@ -128,37 +123,110 @@ def format_chat_history(history):
                     messages[msg_num] = {}
                 messages[msg_num]['answer'] = value
         
-        # Convert to the format expected by ConversationalRetrievalChain
+        # Convert to (question, answer) pairs
         for msg_num in sorted(messages.keys(), key=int):
             if 'question' in messages[msg_num] and 'answer' in messages[msg_num]:
                 formatted_history.append((messages[msg_num]['question'], messages[msg_num]['answer']))
         
-        print(f"\n\n$$$$$$$$$$$$$$Formatted chat history: {formatted_history}")
+        log(f"\n\n$$$$$$$$$$$$$$Formatted chat history: {formatted_history}")
     return formatted_history
 
-def get_chatbot_response(question: str, history: dict = None):
-    """Generate a response based on the question and chat history"""
+def format_history_for_prompt(history) -> str:
+    """Compact plain-text rendering of a chat history dict for prompts (instead of str(dict))"""
+    lines = []
+    if history and isinstance(history, dict) and history.get(SESSION_SUMMARY_KEY):
+        lines.append(f"Summary of earlier conversation: {history[SESSION_SUMMARY_KEY]}")
+    for question, answer in format_chat_history(history):
+        if question == "Summarize our earlier conversation.":
+            continue
+        lines.append(f"User: {question}")
+        lines.append(f"Assistant: {answer}")
+    return "\n".join(lines)
+
+def extract_doc_ids(docs) -> List[str]:
+    """Return the unique doc_ids of retrieved documents, in retrieval order"""
+    doc_ids = []
+    for doc in docs:
+        doc_id = doc.metadata.get("doc_id") if doc.metadata else None
+        if doc_id and doc_id not in doc_ids:
+            doc_ids.append(doc_id)
+    return doc_ids
+
+def retrieve_documents(question: str):
+    """Retrieve the context chunks for an already standalone question (uncompressed, see build_qa_prompt)"""
+    # Logged (anonymized) so the next deploy can warm the caches with the most frequent questions
+    query_log.record(question)
+    return retrieval_cache.retrieve(question, **RETRIEVAL_SEARCH_KWARGS)
+
+def build_qa_prompt(question: str, docs) -> str:
+    """Fill QA_PROMPT with the retrieved chunks, compressed to the context token budget"""
+    passages, _ = assemble_context(question, docs)
+    context = "\n\n".join(doc.page_content for doc in passages)
+    return QA_PROMPT.format(context=context, question=question)
+
+def format_chat_history_text(chat_history) -> str:
+    """Render (question, answer) pairs for the condense prompt (as LangChain's ConversationalRetrievalChain did)"""
+    return "".join(f"\nHuman: {human}\nAssistant: {ai}" for human, ai in chat_history)
+
+async def aget_chatbot_response(question: str, history: dict = None, client: ResilientAsyncClient = None):
+    """
+    Answer a question from the knowledge base with its chat history.
+    Condense and QA run on the async OpenAI client, retrieval (local embedding + Chroma search)
+    runs in a worker thread, so the event loop keeps serving other requests meanwhile.
+    """
     if history is None:
         history = {}
+    client = client or async_client
     
     chat_history = format_chat_history(history)
     
     try:
-        # Get response from the language model
-        result = qa_chain({"question": question, "chat_history": chat_history})
+        # Condense the follow-up into a standalone question (skipped without history)
+        standalone_question = question
+        if chat_history:
+            with stage("condense"):
+                condense_response = await create_for_stage(
+                    "condense",
+                    client,
+                    check=condense_check(question),
+                    temperature=0.1,
+                    messages=[{
+                        "role": "user",
+                        "content": CONDENSE_QUESTION_PROMPT.format(
+                            chat_history=format_chat_history_text(chat_history),
+                            question=question
+                        )
+                    }]
+                )
+            standalone_question = condense_response.choices[0].message.content.strip()
         
-        # Clean and format the answer
-        answer = result["answer"].strip()
+        with stage("retrieval"):
+            docs = await asyncio.to_thread(retrieve_documents, standalone_question)
         
-        response = {
-            "answer": answer
-        }
+        # Context compression tokenizes every sentence, keep it off the event loop too
+        with stage("context"):
+            qa_prompt = await asyncio.to_thread(build_qa_prompt, standalone_question, docs)
         
-        return response
+        with stage("qa"):
+            qa_response = await create_for_stage(
+                "qa",
+                client,
+                check=check_not_empty,
+                temperature=0.1,
+                messages=[{"role": "user", "content": qa_prompt}]
+            )
         
+        return {
+            "answer": qa_response.choices[0].message.content.strip(),
+            "doc_ids": extract_doc_ids(docs)
+        }
+        
+    except OVERLOAD_ERRORS:
+        # Let the agent answer "busy" instead of grounding a final answer on an apology
+        raise
     except Exception as e:
-        print(f"\n$$$$$$$$$$$$$$$Error in chatbot response: {str(e)}")
+        log(f"\n$$$$$$$$$$$$$$$Error in async chatbot response: {str(e)}")
         return {
             "answer": "I apologize, but I encountered an error while processing your question. Please try rephrasing your question or check if you have uploaded relevant documents to the knowledge base.",
             "avatar": "I'm sorry, I encountered an error while processing your question. Please try asking again."
-        }
\ No newline at end of file
+        }
@@ -0,0 +1,71 @@
+"""
+Single-flight request coalescing.
+Concurrent calls with the same key share one in-flight execution and all receive its result,
+so a burst of identical questions costs one pipeline run. The run's LLM usage is billed to the
+leader's user as it happens and to each follower's user when they receive the shared result.
+"""
+
+import json
+import asyncio
+import hashlib
+from typing import Dict, Any, Awaitable, Callable, List, Tuple
+from answer_cache import normalize_question
+from usage_meter import usage_meter, collect_usage
+
+
+def coalesce_key(question: str, history: dict = None, *extra) -> str:
+    """Key for a question plus an equivalent chat history (normalized text, key order ignored)"""
+    normalized_history = {key: normalize_question(str(value)) for key, value in (history or {}).items()}
+    payload = json.dumps([normalize_question(question), normalized_history, list(extra)], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """Shares one in-flight asyncio task between concurrent callers with the same key"""
+
+    def __init__(self):
+        self._inflight: Dict[str, Tuple[asyncio.Task, List[int]]] = {}  # key -> (task, its LLM usage)
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn() once per key among concurrent callers; every caller gets its result or exception"""
+        inflight = self._inflight.get(key)
+        follower = inflight is not None
+        if follower:
+            task, usage = inflight
+            self.coalesced += 1
+        else:
+            usage = [0, 0, 0]
+            task = asyncio.ensure_future(self._run(fn, usage))
+            self._inflight[key] = (task, usage)
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+            self.executions += 1
+        # A cancelled caller (client disconnect) must not cancel the run shared with the others
+        result = await asyncio.shield(task)
+        if follower:
+            usage_meter.record_shared(usage)
+        return result
+
+    @staticmethod
+    async def _run(fn: Callable[[], Awaitable[Any]], usage: List[int]) -> Any:
+        """Run fn() in the task's own context, totalling its LLM usage for the followers"""
+        collected = collect_usage()
+        try:
+            return await fn()
+        finally:
+            usage[:] = collected
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key, (None,))[0] is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved so failed runs without waiters don't log warnings
+
+    def in_flight(self) -> int:
+        """Number of distinct executions currently running"""
+        return len(self._inflight)
+
+    def stats(self) -> Dict[str, int]:
+        """Return execution/coalescing counters"""
+        return {"executions": self.executions, "coalesced": self.coalesced, "in_flight": self.in_flight()}
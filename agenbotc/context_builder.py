@@ -0,0 +1,186 @@
+"""
+Token-budgeted context assembly for the QA prompt.
+Retrieved chunks overlap (the splitter repeats up to 200 characters between neighbours) and often
+come from the same document, so before they are stuffed into QA_PROMPT they are:
+  1. merged when they are neighbours in the same document (shared text is kept once),
+  2. deduplicated when one passage is contained in another,
+  3. trimmed to the token budget by dropping the sentences least related to the question.
+"""
+
+import os
+import re
+from typing import List, Dict, Any, Tuple
+from langchain_core.documents import Document
+from prometheus_client import Counter, Histogram
+from session_store import count_tokens
+from tracing import log
+
+# Configuration
+CONTEXT_COMPRESSION_ENABLED = os.getenv("CONTEXT_COMPRESSION_ENABLED", "true").lower() == "true"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1500))
+CONTEXT_MIN_OVERLAP_CHARS = int(os.getenv("CONTEXT_MIN_OVERLAP_CHARS", 20))
+CONTEXT_MAX_OVERLAP_CHARS = int(os.getenv("CONTEXT_MAX_OVERLAP_CHARS", 400))  # ingestion uses chunk_overlap=200
+
+CONTEXT_TOKENS = Histogram(
+    "vega_context_tokens",
+    "QA context size per request before and after compression",
+    ["kind"],
+    buckets=(100, 250, 500, 750, 1000, 1500, 2000, 3000, 4000, 6000)
+)
+CONTEXT_TOKENS_SAVED = Counter(
+    "vega_context_tokens_saved_total",
+    "Prompt tokens removed from QA contexts by merging, deduplication and trimming",
+    ["step"]
+)
+
+# Captures the separators so kept sentences are rejoined with their original line breaks
+SENTENCE_SPLIT_PATTERN = re.compile(r"((?<=[.!?])\s+|\n+)")
+WORD_PATTERN = re.compile(r"[a-z0-9_.\-/:]+")
+# Ports, error codes, config keys, paths/URLs and versions are what answers quote verbatim
+ENTITY_PATTERN = re.compile(r"\b\d{2,5}\b|[A-Za-z]+[-_]\d+|\w+\.\w+\.\w+|/\w+|https?://|\bv?\d+\.\d+")
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "be", "to", "of", "in", "on", "for", "and", "or", "with",
+    "how", "what", "why", "do", "does", "i", "we", "my", "our", "can", "it", "this", "that", "from",
+    "mode", "explain", "howto", "command_only", "snippet_only", "value_only"
+}
+
+
+def _overlap(first: str, second: str) -> int:
+    """Length of the longest suffix of first that is a prefix of second (0 below CONTEXT_MIN_OVERLAP_CHARS)"""
+    if len(second) < CONTEXT_MIN_OVERLAP_CHARS:
+        return 0
+    tail = first[-CONTEXT_MAX_OVERLAP_CHARS:]
+    probe = second[:CONTEXT_MIN_OVERLAP_CHARS]
+    start = tail.find(probe)
+    while start != -1:
+        if second.startswith(tail[start:]):
+            return len(tail) - start
+        start = tail.find(probe, start + 1)
+    return 0
+
+
+def _terms(text: str) -> set:
+    return {word for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS and len(word) > 1}
+
+
+def merge_passages(docs: List[Document]) -> List[Document]:
+    """Merge neighbouring chunks of the same document and drop contained duplicates, in retrieval order"""
+    passages = []  # {"text", "metadata", "first", "last"} (first/last chunk_index, None when unknown)
+    for doc in docs:
+        text = doc.page_content.strip()
+        if not text:
+            continue
+        metadata = doc.metadata or {}
+        doc_id = metadata.get("doc_id")
+        index = metadata.get("chunk_index")
+        last_index = metadata.get("last_chunk_index", index)
+        merged = False
+        for passage in passages:
+            if doc_id is None or passage["metadata"].get("doc_id") != doc_id:
+                continue
+            if text in passage["text"]:
+                merged = True
+            elif passage["text"] in text:
+                passage["text"] = text
+                merged = True
+            else:
+                after = _overlap(passage["text"], text)
+                before = _overlap(text, passage["text"])
+                if after and after >= before:
+                    passage["text"] = passage["text"] + text[after:]
+                    merged = True
+                elif before:
+                    passage["text"] = text + passage["text"][before:]
+                    merged = True
+                elif index is not None and passage["last"] is not None and index == passage["last"] + 1:
+                    passage["text"] = passage["text"] + "\n" + text
+                    merged = True
+                elif index is not None and passage["first"] is not None and last_index == passage["first"] - 1:
+                    passage["text"] = text + "\n" + passage["text"]
+                    merged = True
+            if merged:
+                if index is not None and passage["first"] is not None:
+                    passage["first"] = min(passage["first"], index)
+                    passage["last"] = max(passage["last"], last_index)
+                break
+        if not merged:
+            passages.append({"text": text, "metadata": dict(metadata), "first": index, "last": last_index})
+
+    result = []
+    for passage in passages:
+        metadata = dict(passage["metadata"])
+        if passage["first"] is not None:
+            metadata["chunk_index"] = passage["first"]
+            metadata["last_chunk_index"] = passage["last"]
+        result.append(Document(page_content=passage["text"], metadata=metadata))
+    # A merge can make two earlier passages neighbours of each other, repeat until stable
+    if len(result) < len([doc for doc in docs if doc.page_content.strip()]):
+        return merge_passages(result)
+    return result
+
+
+def trim_to_budget(question: str, passages: List[Document], token_budget: int) -> List[Document]:
+    """Drop the sentences least related to the question until the passages fit the token budget"""
+    question_terms = _terms(question)
+    sentences = []  # (passage index, position, text + separator, tokens, score)
+    for index, passage in enumerate(passages):
+        parts = SENTENCE_SPLIT_PATTERN.split(passage.page_content)
+        for position in range(0, len(parts), 2):
+            sentence = parts[position]
+            separator = parts[position + 1] if position + 1 < len(parts) else ""
+            if not sentence.strip():
+                continue
+            terms = _terms(sentence)
+            score = len(terms & question_terms) / (len(question_terms) or 1)
+            score += 0.25 if ENTITY_PATTERN.search(sentence) else 0
+            # Passages retrieved earlier are more relevant overall
+            score -= 0.02 * index
+            sentences.append((index, position, sentence + separator, count_tokens(sentence), score))
+
+    total = sum(sentence[3] for sentence in sentences)
+    dropped = set()
+    for sentence in sorted(sentences, key=lambda item: item[4]):
+        if total <= token_budget:
+            break
+        dropped.add((sentence[0], sentence[1]))
+        total -= sentence[3]
+
+    trimmed = []
+    for index, passage in enumerate(passages):
+        kept = [text for i, position, text, _, _ in sentences if i == index and (i, position) not in dropped]
+        if kept:
+            trimmed.append(Document(page_content="".join(kept).strip(), metadata=passage.metadata))
+    return trimmed
+
+
+def _context_tokens(docs: List[Document]) -> int:
+    return count_tokens("\n\n".join(doc.page_content for doc in docs))
+
+
+def assemble_context(question: str, docs: List[Document], token_budget: int = CONTEXT_TOKEN_BUDGET) -> Tuple[List[Document], Dict[str, Any]]:
+    """
+    Compress retrieved chunks into passages for the QA prompt.
+    Returns (passages, stats) with stats {"tokens_before", "tokens_after", "saved_by_merge", "saved_by_trim"}.
+    """
+    tokens_before = _context_tokens(docs)
+    if not CONTEXT_COMPRESSION_ENABLED or not docs:
+        return docs, {"tokens_before": tokens_before, "tokens_after": tokens_before, "saved_by_merge": 0, "saved_by_trim": 0}
+
+    passages = merge_passages(docs)
+    tokens_merged = _context_tokens(passages)
+    if tokens_merged > token_budget:
+        passages = trim_to_budget(question, passages, token_budget)
+    tokens_after = _context_tokens(passages)
+
+    stats = {
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "saved_by_merge": max(0, tokens_before - tokens_merged),
+        "saved_by_trim": max(0, tokens_merged - tokens_after)
+    }
+    CONTEXT_TOKENS.labels("before").observe(tokens_before)
+    CONTEXT_TOKENS.labels("after").observe(tokens_after)
+    CONTEXT_TOKENS_SAVED.labels("merge").inc(stats["saved_by_merge"])
+    CONTEXT_TOKENS_SAVED.labels("trim").inc(stats["saved_by_trim"])
+    log(f"Context assembly: {len(docs)} chunks → {len(passages)} passages, {tokens_before} → {tokens_after} tokens")
+    return passages, stats
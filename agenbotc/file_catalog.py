@@ -0,0 +1,206 @@
+"""
+SQLite catalog of uploaded files (the records behind /files).
+Each file is a row keyed by its doc ID, with indexes on uploader and upload date, so listing a user's
+files is an index range scan in upload order and adding or deleting a file is one atomic statement
+(safe with several uvicorn workers) instead of a re-read and rewrite of the whole files.json.
+Listings are paged with an opaque cursor (the last row's upload date and ID, newest first), so a page
+costs one index seek plus page-size rows whatever the size of the catalog.
+On first start an empty catalog imports the existing agenbotc/files.json (the file is left untouched).
+
+Migrate explicitly:
+    python agenbotc/file_catalog.py --import agenbotc/files.json
+"""
+
+import os
+import json
+import base64
+import sqlite3
+import argparse
+import threading
+from typing import Optional, Dict, Any, List, Tuple
+
+# Configuration
+FILES_JSON_PATH = os.getenv("FILES_JSON_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "files.json"))  # legacy store
+FILES_DB_PATH = os.getenv("FILES_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "files.db"))
+FILES_PAGE_SIZE = int(os.getenv("FILES_PAGE_SIZE", 50))
+FILES_MAX_PAGE_SIZE = int(os.getenv("FILES_MAX_PAGE_SIZE", 500))
+
+# Record key (as returned by the API) -> column
+FIELDS = {
+    "id": "id",
+    "name": "name",
+    "type": "type",
+    "size": "size",
+    "status": "status",
+    "uploadDate": "upload_date",
+    "lastModified": "last_modified",
+    "uploadedBy": "uploaded_by",
+    "url": "url"
+}
+COLUMNS = tuple(FIELDS.values())
+
+
+def _to_row(record: Dict[str, Any]) -> tuple:
+    return tuple(None if record.get(key) is None else str(record[key]) for key in FIELDS)
+
+
+def _from_row(row: tuple) -> Dict[str, Any]:
+    return dict(zip(FIELDS, row))
+
+
+def encode_cursor(record: Dict[str, Any]) -> str:
+    """Opaque cursor pointing after this record in the newest-first order"""
+    return base64.urlsafe_b64encode(json.dumps([record["uploadDate"], record["id"]]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """(upload date, ID) of a cursor, ValueError when it is malformed"""
+    try:
+        upload_date, file_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(upload_date, str) or not isinstance(file_id, str):
+        raise ValueError("Invalid cursor")
+    return upload_date, file_id
+
+
+class SQLiteFileCatalog:
+    """File records with indexed per-user listings and atomic per-file writes"""
+
+    def __init__(self, db_path: str = FILES_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread (FastAPI runs sync endpoints in a thread pool)"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def _init_db(self):
+        with self._connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    id TEXT PRIMARY KEY,
+                    name TEXT,
+                    type TEXT,
+                    size TEXT,
+                    status TEXT,
+                    upload_date TEXT,
+                    last_modified TEXT,
+                    uploaded_by TEXT,
+                    url TEXT
+                ) WITHOUT ROWID
+            """)
+            # The primary key (id) ends every index entry, so (upload_date, id) order comes from these too
+            connection.execute("CREATE INDEX IF NOT EXISTS files_by_uploader ON files (uploaded_by, upload_date)")
+            connection.execute("CREATE INDEX IF NOT EXISTS files_by_uploader_type ON files (uploaded_by, type, upload_date)")
+            connection.execute("CREATE INDEX IF NOT EXISTS files_by_uploader_status ON files (uploaded_by, status, upload_date)")
+            connection.execute("CREATE INDEX IF NOT EXISTS files_by_uploader_name ON files (uploaded_by, name COLLATE NOCASE)")
+            connection.execute("CREATE INDEX IF NOT EXISTS files_by_upload_date ON files (upload_date)")
+
+    def count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def get(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """File record by ID, or None"""
+        row = self._connect().execute(f"SELECT {', '.join(COLUMNS)} FROM files WHERE id = ?", (file_id,)).fetchone()
+        return _from_row(row) if row else None
+
+    def add(self, record: Dict[str, Any]):
+        """Insert a file record (replacing a record with the same ID)"""
+        with self._connect() as connection:
+            connection.execute(f"INSERT OR REPLACE INTO files ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", _to_row(record))
+
+    def list_by_user(self, username: str) -> List[Dict[str, Any]]:
+        """Files uploaded by a user, newest first"""
+        rows = self._connect().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM files WHERE uploaded_by = ? ORDER BY upload_date DESC, id DESC",
+            (username,)
+        ).fetchall()
+        return [_from_row(row) for row in rows]
+
+    def list_page(
+        self,
+        username: str,
+        limit: int = FILES_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        file_type: Optional[str] = None,
+        status: Optional[str] = None,
+        name_prefix: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        One page of a user's files, newest first (ties by ID), optionally filtered by type, status and
+        name prefix (case-insensitive). Returns (records, next cursor or None on the last page);
+        raises ValueError for a malformed cursor.
+        """
+        conditions, params = ["uploaded_by = ?"], [username]
+        if file_type:
+            conditions.append("type = ?")
+            params.append(file_type.upper())
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        if name_prefix:
+            # A NOCASE range (not LIKE) so the prefix is a seek on files_by_uploader_name
+            conditions.append("name >= ? COLLATE NOCASE AND name < ? COLLATE NOCASE")
+            params.extend([name_prefix, name_prefix + "\U0010ffff"])
+        if cursor:
+            # Keyset seek: a range condition on the index, not an OFFSET scan
+            conditions.append("(upload_date, id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+        limit = max(1, min(limit, FILES_MAX_PAGE_SIZE))
+        rows = self._connect().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM files WHERE {' AND '.join(conditions)} ORDER BY upload_date DESC, id DESC LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+        records = [_from_row(row) for row in rows[:limit]]
+        return records, encode_cursor(records[-1]) if len(rows) > limit else None
+
+    def delete(self, file_id: str, username: str) -> bool:
+        """Remove a file record owned by username, False when there is none"""
+        with self._connect() as connection:
+            cursor = connection.execute("DELETE FROM files WHERE id = ? AND uploaded_by = ?", (file_id, username))
+        return cursor.rowcount > 0
+
+    def import_json(self, files_json: str = FILES_JSON_PATH) -> int:
+        """Import records from a files.json file (existing IDs are kept), returns the number imported"""
+        with open(files_json, "r") as f:
+            files_data = json.load(f)
+        # Records without an upload date sort last (cursors compare dates, which must not be NULL)
+        rows = [
+            _to_row({**record, "id": record.get("id") or file_id, "uploadDate": record.get("uploadDate") or ""})
+            for file_id, record in files_data.items()
+        ]
+        with self._connect() as connection:
+            before = connection.total_changes
+            connection.executemany(f"INSERT OR IGNORE INTO files ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+            return connection.total_changes - before
+
+    def import_legacy(self, files_json: str = FILES_JSON_PATH):
+        """Import files.json into an empty catalog (first start after the switch)"""
+        if not os.path.exists(files_json) or self.count() > 0:
+            return
+        try:
+            print(f"Imported {self.import_json(files_json)} file records from {files_json} into {self.db_path}")
+        except Exception as e:
+            print(f"Error importing file records from {files_json}: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of file records"""
+        return {"files": self.count()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the SQLite file catalog")
+    parser.add_argument("--import", dest="import_file", metavar="FILES_JSON", help="Import records from a files.json file")
+    parser.add_argument("--db", default=FILES_DB_PATH, help="Database path (FILES_DB_PATH)")
+    args = parser.parse_args()
+    catalog = SQLiteFileCatalog(args.db)
+    if args.import_file:
+        print(f"Imported {catalog.import_json(args.import_file)} file records from {args.import_file} into {args.db}")
+    print(f"{catalog.count()} file records in {args.db}")
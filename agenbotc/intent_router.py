@@ -0,0 +1,219 @@
+"""
+Local intent router.
+Decides on the CPU, before any remote call, whether a message is casual (greeting, thanks, small talk)
+or a technical IAM question, so clear cases can skip the LLM routing call:
+  1. rules: whole-message greeting/thanks/goodbye patterns (answered with a canned reply)
+     and IAM/Authenion keywords (technical, sent straight to the knowledge base search with the
+     [MODE: EXPLAIN]/[MODE: HOWTO] tag the question rewrite would add);
+  2. optionally (INTENT_EMBEDDING_ENABLED, off until its margin is measured) a nearest-centroid
+     classifier on the MiniLM embeddings the vector store already loads.
+Anything in between, and messages where the LLM has to pick a tool (Tomcat/server status) or an
+exact-output mode, returns intent None and goes through the LLM router as before.
+See benchmarks/intent_router_eval.py for the accuracy/latency trade-off.
+"""
+
+import os
+import re
+import threading
+from typing import Optional, Dict, Any
+import numpy as np
+from prometheus_client import Counter
+from vector_store import embeddings
+
+# Configuration
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "true").lower() == "true"
+# Embedding layer: off until benchmarks/intent_router_eval.py --llm has measured a safe margin
+# (a wrong "casual" decision gets the casual prompt, which declines technical questions)
+INTENT_EMBEDDING_ENABLED = os.getenv("INTENT_EMBEDDING_ENABLED", "false").lower() == "true"
+# Minimum cosine difference between the two class centroids for an embedding decision
+INTENT_EMBEDDING_MARGIN = float(os.getenv("INTENT_EMBEDDING_MARGIN", 0.15))
+INTENT_MAX_CASUAL_WORDS = int(os.getenv("INTENT_MAX_CASUAL_WORDS", 8))
+
+INTENT_DECISIONS = Counter(
+    "vega_intent_decisions_total",
+    "Local intent router decisions (intent none → LLM router)",
+    ["intent", "source"]
+)
+
+# Whole-message small talk, answered without any LLM call
+CANNED_REPLIES = [
+    (
+        re.compile(r"^(hi|hello|hey|hiya|howdy|greetings|good (morning|afternoon|evening|day))( there| vega| team)?$"),
+        "Hi, I'm Vega, your Authenion and IAM assistant. How can I help you today?"
+    ),
+    (
+        re.compile(r"^((ok|okay|great|cool|perfect|awesome|nice|got it)[, ]*)?(thanks|thank you|thx|ty|many thanks|cheers)( (so|very) much| a lot| vega)?$"),
+        "You're welcome! Let me know if there's anything else I can help with on Authenion or IAM."
+    ),
+    (
+        re.compile(r"^(bye|goodbye|good bye|see you|see ya|cya|talk (to you )?later)( vega)?$"),
+        "Goodbye! Reach out anytime you need help with Authenion or IAM."
+    ),
+    (
+        re.compile(r"^(ok|okay|great|cool|perfect|awesome|nice|got it|sounds good|that works|that helps)$"),
+        "Glad that helps! Ask me anything else about Authenion or IAM."
+    ),
+]
+
+# Vocabulary that only shows up in IAM/Authenion support questions
+TECHNICAL_PATTERN = re.compile(
+    r"\b(authenion|iam|sso|saml|oidc|oauth2?|openid|ldap|kerberos|mfa|2fa|otp|totp|rbac|abac|scim|jwt|jwks|"
+    r"token|tokens|certificate|certificates|cert|keystore|truststore|tls|ssl|idp|federation|"
+    r"session|sessions|cookie|redirect|endpoint|api|sdk|error|errors|exception|timeout|"
+    r"install|installation|upgrade|configure|configuration|config|integrate|integration|"
+    r"password|passwords|login|logout|authentication|authorization|provisioning|directory|"
+    r"policy|policies|role|roles|claim|claims|scope|scopes|client id|client secret|port|[45]\d\d)\b"
+)
+
+# The LLM router adds [MODE: ...] tags for these, so they are left to it
+EXPLICIT_MODE_PATTERN = re.compile(r"\b(exact|only|just)\b.*\b(command|snippet|value|config block)\b|\b(command|snippet) only\b")
+
+# Server status questions: the LLM router chooses between its tools (check_tomcat_status) for these
+TOOL_SELECTION_PATTERN = re.compile(
+    r"\btomcat\b|\b(server|service|instance|app|application)\b.*\b(up|down|running|status|health|healthy|reachable|alive|online|offline)\b|"
+    r"\b(is|are)\b.*\b(up|down|running|reachable|online|offline)\b$"
+)
+
+# Mode tags the question rewrite (CONDENSE_QUESTION_PROMPT in chatbot.py) adds for these
+EXPLAIN_PATTERN = re.compile(r"^(what is|what are|what's|explain|overview|describe|how does|how do .+ work|why)\b|\b(benefits|use cases|difference between)\b")
+HOWTO_PATTERN = re.compile(r"^(how to|how do i|how can i|how should i|steps to)\b|\b(configure|set up|setup|integrate|install)\b")
+
+CASUAL_EXAMPLES = [
+    "hello, how are you doing today?",
+    "good morning vega",
+    "thanks a lot, that was helpful",
+    "thank you so much for your help",
+    "who are you?",
+    "what is your name?",
+    "what can you do?",
+    "nice to meet you",
+    "you are awesome",
+    "have a great day",
+    "how's it going?",
+    "that's all for now, bye",
+    "ok cool, thanks",
+    "are you a robot?",
+    "tell me a joke",
+    "I appreciate the help",
+    "great job",
+    "see you tomorrow",
+]
+
+TECHNICAL_EXAMPLES = [
+    "how do I configure SAML single sign-on in Authenion?",
+    "how to set up OIDC with an external identity provider",
+    "what is the difference between RBAC and ABAC?",
+    "the login page shows a redirect loop after upgrade",
+    "how can I reset a user's password from the admin console?",
+    "where do I change the session timeout?",
+    "how do I enable multi-factor authentication for all users?",
+    "LDAP bind fails with invalid credentials",
+    "how to rotate the signing certificate",
+    "what port does the server use by default?",
+    "how to install Authenion on Linux",
+    "configure SCIM provisioning for Azure AD",
+    "what claims are included in the ID token?",
+    "the server returns 500 internal error on startup",
+    "how do I integrate Authenion with Kerberos?",
+    "what does error code AUTH-401 mean?",
+    "how do refresh tokens expire?",
+    "how do I add a new application to the directory?",
+]
+
+
+def normalize_message(message: str) -> str:
+    """Lowercase, collapse whitespace and strip surrounding punctuation/emoji"""
+    text = re.sub(r"\s+", " ", (message or "").lower()).strip()
+    return re.sub(r"^[^\w]+|[^\w]+$", "", text)
+
+
+def mode_tag(message: str) -> Optional[str]:
+    """[MODE: ...] tag the question rewrite would add to a standalone question (None when it adds none)"""
+    text = normalize_message(message)
+    if HOWTO_PATTERN.search(text) and not text.startswith(("what", "why", "explain")):
+        return "HOWTO"
+    if EXPLAIN_PATTERN.search(text):
+        return "EXPLAIN"
+    return None
+
+
+class IntentRouter:
+    """Rules + nearest-centroid embedding classifier for casual vs technical messages"""
+
+    def __init__(self, embed_documents=None, margin: float = INTENT_EMBEDDING_MARGIN, use_embeddings: bool = INTENT_EMBEDDING_ENABLED):
+        self.embed_documents = embed_documents or embeddings.embed_documents
+        self.margin = margin
+        self.use_embeddings = use_embeddings
+        self._centroids = None
+        self._lock = threading.Lock()
+
+    def _normalized(self, vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return matrix / norms
+
+    def _get_centroids(self) -> np.ndarray:
+        """Class centroids (casual, technical), embedded once on first use"""
+        if self._centroids is None:
+            with self._lock:
+                if self._centroids is None:
+                    casual = self._normalized(self.embed_documents(CASUAL_EXAMPLES)).mean(axis=0)
+                    technical = self._normalized(self.embed_documents(TECHNICAL_EXAMPLES)).mean(axis=0)
+                    self._centroids = self._normalized([casual, technical])
+        return self._centroids
+
+    def warm_up(self):
+        """Embed the example centroids ahead of the first request"""
+        if self.use_embeddings:
+            self._get_centroids()
+
+    def classify_rules(self, message: str) -> Optional[Dict[str, Any]]:
+        """Rule-based decision, or None when no rule is conclusive"""
+        text = normalize_message(message)
+        if not text:
+            return None
+        if len(text.split()) <= INTENT_MAX_CASUAL_WORDS:
+            for pattern, reply in CANNED_REPLIES:
+                if pattern.match(text):
+                    return {"intent": "casual", "source": "rule", "score": 1.0, "reply": reply}
+        if EXPLICIT_MODE_PATTERN.search(text) or TOOL_SELECTION_PATTERN.search(text):
+            return {"intent": None, "source": "rule", "score": 0.0, "reply": None}
+        if TECHNICAL_PATTERN.search(text):
+            return {"intent": "technical", "source": "rule", "score": 1.0, "reply": None}
+        return None
+
+    def classify_embedding(self, message: str) -> Dict[str, Any]:
+        """Centroid decision: score is cos(technical) - cos(casual); inside ±margin the intent is None"""
+        vector = self._normalized(self.embed_documents([normalize_message(message)]))[0]
+        casual_similarity, technical_similarity = self._get_centroids() @ vector
+        score = float(technical_similarity - casual_similarity)
+        if score >= self.margin:
+            intent = "technical"
+        elif score <= -self.margin:
+            intent = "casual"
+        else:
+            intent = None
+        return {"intent": intent, "source": "embedding", "score": score, "reply": None}
+
+    def classify(self, message: str) -> Dict[str, Any]:
+        """
+        Classify a user message.
+        Returns {"intent": "casual" | "technical" | None, "source": "rule" | "embedding",
+        "score", "reply" (canned reply for whole-message small talk, else None)}.
+        """
+        decision = self.classify_rules(message)
+        if decision is None and not self.use_embeddings:
+            decision = {"intent": None, "source": "rule", "score": 0.0, "reply": None}
+        elif decision is None:
+            try:
+                decision = self.classify_embedding(message)
+            except Exception as e:
+                print(f"Error in intent embedding classifier: {str(e)}")
+                decision = {"intent": None, "source": "embedding", "score": 0.0, "reply": None}
+        INTENT_DECISIONS.labels(decision["intent"] or "none", decision["source"]).inc()
+        return decision
+
+
+# Shared router instance
+intent_router = IntentRouter()
@@ -0,0 +1,360 @@
+"""
+LDAP authentication backend (PingDirectory) for UserManager.
+Logins look the user up with a pool of persistent connections bound as the service account
+(ldap.bind_dn), then verify the password by rebinding a connection from a second pool as the user's DN.
+The user's DN, email and role (from group membership, ldap.group_roles) are cached for a short TTL,
+and usernames the directory does not know for a shorter one, in a bounded LRU; passwords are never
+cached. Connect/receive timeouts bound every directory call, and a circuit breaker fails logins fast
+(UserManager then falls back to local accounts) after repeated directory errors.
+
+Settings come from the ldap section of config.yaml (see _load_ldap_config for the optional keys);
+LDAP_HOST, LDAP_PORT, LDAP_BIND_DN and LDAP_BIND_PASSWORD override the file.
+"""
+
+import os
+import time
+import queue
+import threading
+import contextlib
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple, List
+import yaml
+from ldap3 import Server, Connection, SYNC
+from ldap3.core.exceptions import LDAPException, LDAPBindError
+from ldap3.utils.conv import escape_filter_chars
+from prometheus_client import Counter, Histogram
+
+# Configuration
+AUTH_BACKEND = os.getenv("AUTH_BACKEND", "local")  # local | ldap
+LDAP_POOL_SIZE = int(os.getenv("LDAP_POOL_SIZE", 4))
+LDAP_POOL_TIMEOUT_SECONDS = float(os.getenv("LDAP_POOL_TIMEOUT_SECONDS", 2))
+LDAP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LDAP_CONNECT_TIMEOUT_SECONDS", 3))
+LDAP_RECEIVE_TIMEOUT_SECONDS = float(os.getenv("LDAP_RECEIVE_TIMEOUT_SECONDS", 5))
+LDAP_CACHE_TTL_SECONDS = float(os.getenv("LDAP_CACHE_TTL_SECONDS", 300))
+LDAP_NEGATIVE_CACHE_TTL_SECONDS = float(os.getenv("LDAP_NEGATIVE_CACHE_TTL_SECONDS", 30))  # not-found lookups
+LDAP_CACHE_MAX_ENTRIES = int(os.getenv("LDAP_CACHE_MAX_ENTRIES", 10000))
+LDAP_FAILURE_THRESHOLD = int(os.getenv("LDAP_FAILURE_THRESHOLD", 5))
+LDAP_RESET_SECONDS = float(os.getenv("LDAP_RESET_SECONDS", 30))
+
+LDAP_REQUESTS = Counter(
+    "vega_ldap_requests_total",
+    "LDAP operations by result (ok, invalid, not_found, error, circuit_open)",
+    ["operation", "result"]
+)
+LDAP_LATENCY = Histogram(
+    "vega_ldap_seconds",
+    "LDAP operation latency, including the wait for a pooled connection",
+    ["operation"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+
+
+class LDAPUnavailable(Exception):
+    """The directory could not be reached in time (or the circuit breaker is open)"""
+
+
+def _load_ldap_config() -> Dict[str, Any]:
+    """
+    ldap section of config.yaml with environment overrides. Optional keys and defaults:
+    use_ssl (false), user_search_base (base_dn), user_filter ("(uid={username})"), email_attribute ("mail"),
+    group_attribute ("isMemberOf"), group_roles ({group DN: role}), default_role ("user", null rejects
+    users in no mapped group).
+    """
+    config = {}
+    config_path = os.path.join(os.path.dirname(__file__), "..", "config.yaml")
+    try:
+        if os.path.exists(config_path):
+            with open(config_path, 'r') as f:
+                config = dict((yaml.safe_load(f) or {}).get("ldap") or {})
+    except Exception as e:
+        print(f"Error loading ldap settings from config.yaml: {e}")
+    for key, env in (("host", "LDAP_HOST"), ("port", "LDAP_PORT"), ("bind_dn", "LDAP_BIND_DN"), ("bind_password", "LDAP_BIND_PASSWORD")):
+        if os.getenv(env):
+            config[key] = os.getenv(env)
+    return config
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; after `reset_seconds` one trial call is let through"""
+
+    def __init__(self, threshold: int = LDAP_FAILURE_THRESHOLD, reset_seconds: float = LDAP_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+    def allow(self) -> bool:
+        """Whether a call may go to the directory now"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                # A failed trial keeps the circuit open for another reset period
+                self.opened_at = time.monotonic()
+
+
+class LDAPConnectionPool:
+    """Fixed-size pool of persistent connections, opened lazily and replaced after errors"""
+
+    def __init__(self, factory, size: int = LDAP_POOL_SIZE, timeout: float = LDAP_POOL_TIMEOUT_SECONDS):
+        self.factory = factory
+        self.size = size
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[Optional[Connection]]" = queue.LifoQueue()
+        for _ in range(size):
+            self._idle.put(None)  # Slot without an open connection yet
+        self.in_use = 0
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Borrow a connection; it is discarded (and reopened on next use) if the block raises an LDAP error"""
+        try:
+            connection = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise LDAPUnavailable(f"No LDAP connection available within {self.timeout:.1f}s")
+        with self._lock:
+            self.in_use += 1
+        try:
+            if connection is None or connection.closed:
+                connection = self.factory()
+            yield connection
+        except LDAPException:
+            if connection is not None:
+                with contextlib.suppress(Exception):
+                    connection.unbind()
+            connection = None
+            raise
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._idle.put(connection)
+
+    def close(self):
+        """Unbind the idle connections"""
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if connection is not None:
+                with contextlib.suppress(Exception):
+                    connection.unbind()
+        for _ in range(self.size):
+            self._idle.put(None)
+
+
+class LDAPBackend:
+    """Directory lookups and password checks with pooled connections, a short-lived user cache and a circuit breaker"""
+
+    def __init__(self, config: Dict[str, Any], server: Server = None, client_strategy=SYNC, connection_class=Connection):
+        self.config = config
+        self.base_dn = config.get("user_search_base") or config.get("base_dn", "")
+        self.user_filter = config.get("user_filter", "(uid={username})")
+        self.email_attribute = config.get("email_attribute", "mail")
+        self.group_attribute = config.get("group_attribute", "isMemberOf")
+        self.group_roles = {dn.lower(): role for dn, role in (config.get("group_roles") or {}).items()}
+        self.default_role = config.get("default_role", "user")
+        self.cache_ttl = float(config.get("cache_ttl_seconds", LDAP_CACHE_TTL_SECONDS))
+        self.negative_cache_ttl = float(config.get("negative_cache_ttl_seconds", LDAP_NEGATIVE_CACHE_TTL_SECONDS))
+        self.cache_max_entries = int(config.get("cache_max_entries", LDAP_CACHE_MAX_ENTRIES))
+        self.server = server or Server(
+            config.get("host", "localhost"),
+            port=int(config.get("port", 389)),
+            use_ssl=bool(config.get("use_ssl", False)),
+            connect_timeout=LDAP_CONNECT_TIMEOUT_SECONDS
+        )
+        self.client_strategy = client_strategy
+        self.connection_class = connection_class
+        pool_size = int(config.get("pool_size", LDAP_POOL_SIZE))
+        self.search_pool = LDAPConnectionPool(self._service_connection, pool_size)
+        self.auth_pool = LDAPConnectionPool(self._auth_connection, pool_size)
+        self.breaker = CircuitBreaker(
+            int(config.get("failure_threshold", LDAP_FAILURE_THRESHOLD)),
+            float(config.get("reset_seconds", LDAP_RESET_SECONDS))
+        )
+        # username -> (entry or None, expires_at); bounded, since any caller can make up usernames
+        self._users: "OrderedDict[str, Tuple[Optional[Dict[str, Any]], float]]" = OrderedDict()
+        self._next_sweep = 0.0
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evictions = 0
+
+    @classmethod
+    def from_config(cls) -> "LDAPBackend":
+        return cls(_load_ldap_config())
+
+    def _service_connection(self) -> Connection:
+        connection = self.connection_class(
+            self.server,
+            user=self.config.get("bind_dn"),
+            password=self.config.get("bind_password"),
+            client_strategy=self.client_strategy,
+            receive_timeout=LDAP_RECEIVE_TIMEOUT_SECONDS
+        )
+        connection.open()
+        if not connection.bind():
+            raise LDAPBindError(f"Service account bind failed: {connection.result.get('description')}")
+        return connection
+
+    def _auth_connection(self) -> Connection:
+        connection = self.connection_class(self.server, client_strategy=self.client_strategy, receive_timeout=LDAP_RECEIVE_TIMEOUT_SECONDS)
+        connection.open()
+        return connection
+
+    def _call(self, operation: str, fn):
+        """Run fn() unless the circuit is open; LDAP/pool errors count as directory failures"""
+        if not self.breaker.allow():
+            LDAP_REQUESTS.labels(operation, "circuit_open").inc()
+            raise LDAPUnavailable("LDAP circuit breaker is open")
+        started = time.perf_counter()
+        try:
+            result = fn()
+        except (LDAPException, LDAPUnavailable, OSError) as e:
+            self.breaker.record_failure()
+            LDAP_REQUESTS.labels(operation, "error").inc()
+            raise LDAPUnavailable(f"LDAP {operation} failed: {type(e).__name__}: {e}") from e
+        finally:
+            LDAP_LATENCY.labels(operation).observe(time.perf_counter() - started)
+        self.breaker.record_success()
+        return result
+
+    def role_for(self, groups: List[str]) -> Optional[str]:
+        """Role from group membership: admin wins over other mapped roles, else default_role"""
+        roles = [self.group_roles[group.lower()] for group in groups if group.lower() in self.group_roles]
+        if "admin" in roles:
+            return "admin"
+        return roles[0] if roles else self.default_role
+
+    def _search_user(self, username: str) -> Optional[Dict[str, Any]]:
+        with self.search_pool.connection() as connection:
+            connection.search(
+                self.base_dn,
+                self.user_filter.format(username=escape_filter_chars(username)),
+                attributes=[self.email_attribute, self.group_attribute],
+                size_limit=2,
+                time_limit=int(LDAP_RECEIVE_TIMEOUT_SECONDS)
+            )
+            entries = [entry for entry in (connection.response or []) if entry.get("type", "searchResEntry") == "searchResEntry"]
+        if len(entries) != 1:
+            return None
+        attributes = entries[0].get("attributes") or {}
+        email = attributes.get(self.email_attribute)
+        groups = attributes.get(self.group_attribute) or []
+        return {
+            "dn": entries[0]["dn"],
+            "email": (email[0] if isinstance(email, list) and email else email) or None,
+            "groups": [groups] if isinstance(groups, str) else list(groups),
+            "role": self.role_for([groups] if isinstance(groups, str) else list(groups))
+        }
+
+    def lookup_user(self, username: str) -> Optional[Dict[str, Any]]:
+        """
+        {"dn", "email", "groups", "role"} of a directory user (cached for cache_ttl), None when not found
+        (cached for negative_cache_ttl, so local-only users and unknown names don't search on every login)
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._users.get(username)
+            if cached and cached[1] > now:
+                self._users.move_to_end(username)
+                self.cache_hits += 1
+                return cached[0]
+            if cached:
+                del self._users[username]
+            self.cache_misses += 1
+        entry = self._call("search", lambda: self._search_user(username))
+        ttl = self.cache_ttl if entry is not None else self.negative_cache_ttl
+        if ttl > 0:
+            with self._lock:
+                self._remember(username, entry, now, ttl)
+        return entry
+
+    def _remember(self, username: str, entry: Optional[Dict[str, Any]], now: float, ttl: float):
+        """
+        Cache a lookup result (caller holds the lock). Expired entries are swept at most once per TTL,
+        and the least recently used entries are evicted beyond cache_max_entries.
+        """
+        if now >= self._next_sweep:
+            for key in [key for key, (_, expires_at) in self._users.items() if expires_at <= now]:
+                del self._users[key]
+            self._next_sweep = now + min(self.cache_ttl, self.negative_cache_ttl or self.cache_ttl)
+        self._users[username] = (entry, now + ttl)
+        self._users.move_to_end(username)
+        while len(self._users) > self.cache_max_entries:
+            self._users.popitem(last=False)
+            self.cache_evictions += 1
+
+    def _check_password(self, dn: str, password: str) -> bool:
+        with self.auth_pool.connection() as connection:
+            try:
+                return bool(connection.rebind(user=dn, password=password))
+            except LDAPBindError:
+                if connection.closed:
+                    raise
+                return False
+
+    def authenticate(self, username: str, password: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Verify credentials against the directory. Returns ("ok", entry), ("invalid", None) or ("not_found", None)
+        (also for users in no mapped group when default_role is null); raises LDAPUnavailable.
+        """
+        entry = self.lookup_user(username)
+        if entry is None or entry["role"] is None:
+            LDAP_REQUESTS.labels("authenticate", "not_found").inc()
+            return "not_found", None
+        # An empty password would be an anonymous bind, which directories accept
+        if not password or not self._call("bind", lambda: self._check_password(entry["dn"], password)):
+            LDAP_REQUESTS.labels("authenticate", "invalid").inc()
+            return "invalid", None
+        LDAP_REQUESTS.labels("authenticate", "ok").inc()
+        return "ok", entry
+
+    def invalidate(self, username: str = None):
+        """Drop cached directory entries (one user or all)"""
+        with self._lock:
+            if username is None:
+                self._users.clear()
+            else:
+                self._users.pop(username, None)
+
+    def close(self):
+        self.search_pool.close()
+        self.auth_pool.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return circuit state, pool usage and user cache counters"""
+        return {
+            "circuit_open": int(self.breaker.state != "closed"),
+            "consecutive_failures": self.breaker.failures,
+            "connections_in_use": self.search_pool.in_use + self.auth_pool.in_use,
+            "cached_users": len(self._users),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_evictions": self.cache_evictions
+        }
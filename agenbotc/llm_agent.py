@@ -1,80 +1,25 @@
-import openai
+import os
 import json
-from typing import Dict, Any, List
+from typing import Dict, Any, List, AsyncIterator, Optional
+import time
 import asyncio
 import chatbot
 from tomcat_monitor import TomcatMonitor
 # from knowledge_base import KnowledgeBase
-from vector_store import vector_store
+from vector_store import vector_store, embeddings
+from answer_cache import answer_cache, ANSWER_CACHE_ENABLED, split_mode_tag, normalize_question
+from retrieval_cache import retrieval_cache
+from avatar_store import avatar_store
+from llm_client import get_async_client, record_llm_usage, OVERLOAD_ERRORS
+from model_cascade import create_for_stage, client_for, model_for, router_check, check_avatar, check_not_empty
+from coalesce import SingleFlight, coalesce_key
+from intent_router import intent_router, mode_tag, INTENT_ROUTER_ENABLED
+from tracing import stage, log, observe_stage, register_stats, TIME_TO_FIRST_TOKEN
 from fastapi import FastAPI, UploadFile, File
+from openai.types.chat import ChatCompletionMessage
 
-class LLMAgent:
-    def __init__(self, api_key: str = None):
-        # Initialize OpenAI client (Change here if we need to use some other System like Claude etc.)
-        self.client = openai.AsyncOpenAI(
-           # this may not work and Open AI expect a key. In that case Export from outside. 
-            api_key=api_key 
-        )
-        self.tomcat_monitor = TomcatMonitor() # Initialize Tomcat monitor class file. To add more Modules of operation we can Initilize here. Like Ping Directory Monitoring...
-        self.vector_store = vector_store
-        
-
-        # Define available tools For now only Tomcat monitor and move to Our Knowledge base to Check. 
-        self.tools = [
-            # {
-            #     "type": "function",
-            #     "function": {
-            #         "name": "check_tomcat_status",
-            #         "description": "Check the status of Tomcat server including health, memory usage, and running processes",
-            #         "parameters": {
-            #             "type": "object",
-            #             "properties": {
-            #                 "detailed": {
-            #                     "type": "boolean",
-            #                     "description": "Whether to return detailed status information",
-            #                     "default": False
-            #                 }
-            #             }
-            #         }
-            #     }
-            # },
-            {
-                "type": "function",
-                "function": {
-                    "name": "search_knowledge_base",
-                    "description": "Search the knowledge base for information on topics other than Tomcat server status",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "query": {
-                                "type": "string",
-                                "description": "The search query for the knowledge base"
-                            },
-                            "limit": {
-                                "type": "integer",
-                                "description": "Maximum number of results to return",
-                                "default": 5
-                            }
-                        },
-                        "required": ["query"]
-                    }
-                }
-            }
-        ]
-
-    async def process_query(self, user_query: str, chat_history: dict = None) -> str:
-        """Process user query and route to appropriate tool"""
-        if chat_history is None:
-            chat_history = {}
-        
-        # Store chat_history for use in tool functions
-        self.current_chat_history = chat_history
-        try:
-            #  LLM decides which tool to use
-            messages = [
-                {
-                    "role": "system",
-                    "content": """Your name is Vega, an expert IAM (Authenion) support assistant. 
+# Prompt used by the router call to decide between a direct reply and a knowledge base search
+ROUTER_PROMPT = """Your name is Vega, an expert IAM (Authenion) support assistant. 
 
                     GREETING/CASUAL MESSAGE HANDLING:
                     - If the user sends a greeting (hello, hi, thanks, etc.) or casual message unrelated to IAM/Authenion, DO NOT call any tools, just respond directly to the query with the best of your abilities.
@@ -100,43 +45,9 @@ class LLMAgent:
                     - For greetings/casual messages: Respond directly without tool calls
                     - For technical queries: Your reply MUST be a single function call to search_knowledge_base with arguments: { "query": "<rewritten question (with optional mode tag)>", "limit": 5 }. Do not include any free-form text.
                         """
-                },
-                {
-                    "role": "user", 
-                    "content": f"Current User Query: {user_query}; Chat History: {chat_history}"
-                }
-            ]
 
-            Initialresponse = await self.client.chat.completions.create(
-                model="gpt-4o-mini",# this is used for chat completion.
-                temperature=0.2,
-                messages=messages,
-                tools=self.tools,
-                tool_choice="auto"
-            )
-            print(f"\n\n######################LLM Initial response: {Initialresponse}")
-            # Check if the LLM wants to call the tool or KB.
-            if Initialresponse.choices[0].message.tool_calls:
-                # Extract tool call details
-                tool_call = Initialresponse.choices[0].message.tool_calls[0]
-                function_name = tool_call.function.name
-                function_args = json.loads(tool_call.function.arguments)
-                
-                # Execute the appropriate tool
-                if function_name == "check_tomcat_status":
-                    print(f"\n#################Calling tool: {function_name} with args: {function_args}")
-                    tool_result = await self._check_tomcat_status(**function_args)
-                    print(f"\n#################Tomcat server check Tool result with type: {type(tool_result)} - {tool_result}")
-                elif function_name == "search_knowledge_base":
-                    print(f"\n#################Calling Knowledge Base: {function_name} with args: {function_args}")
-                    tool_result = await self._search_knowledge_base(**function_args)
-                    print(f"\n#################Knowledge Base search tool_result with type: {type(tool_result)} - {tool_result}")
-
-                else:
-                    tool_result = "Unknown function called"
-                    print("\n#####################Unknown function called")
-
-                FINALIZER_PROMPT = """
+# Mode-aware prompt used to produce the final answer from the tool/KB result
+FINALIZER_PROMPT = """
                 
                 You are Vega. Produce the final answer grounded ONLY in the tool/KB snippets provided in this thread.
 
@@ -171,43 +82,9 @@ class LLMAgent:
                     PRIVACY
                     - Never output addresses, phone numbers, or client names; replace with “[REDACTED_*]”.
                 """
-                
-                final_messages = [
-                    # 1) Finalizer system prompt (mode-aware; includes EXPLAIN/HOWTO)
-                    {"role": "system", "content": FINALIZER_PROMPT},
-
-                    # 2) Pass through the assistant message that made the tool call
-                    {
-                        "role": "assistant",
-                        "content": None,
-                        "tool_calls": Initialresponse.choices[0].message.tool_calls
-                    },
-
-                    # 3) Provide the tool result with its NAME so the model grounds on it
-                    {
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "name": function_name,       # <-- keep this; critical for grounding
-                        "content": str(tool_result)  # <-- the KB/RAG answer text
-                    }
-                ]
-
-
-                # print(f"\n\n#################Final messages to model: {final_messages}")
-
-                final_response = await self.client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    temperature=0.1,
-                    messages=final_messages
-                )
 
-                print(f"\n\n#################Final response from model: {final_response}")
-
-
-                # Get avatar-friendly response
-                avatar_messages = [
-                    {"role": "system",
-                    "content": """
+# Text-to-speech rephrase of a grounded (tool) answer
+AVATAR_TOOL_PROMPT = """
 
                     You are Vega’s voice. Rephrase the prior assistant message for text-to-speech. Do not add or remove information; only compress and humanize.
 
@@ -221,32 +98,10 @@ class LLMAgent:
                     - Preserve placeholders like [REDACTED_*] by saying “redacted.” Never voice phone numbers, addresses, or client names.
                     - Avoid meta talk (“according to…”, “the KB says…”).
                     
-                    """},
-
-                    {"role": "user",
-                    "content": final_response.choices[0].message.content}
-                    #  "content": tool_result }
-                ]
-                
-                avatar_response = await self.client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    temperature=0.4,
-                    messages=avatar_messages
-                )
-
-                return {
-                    "verbose": final_response.choices[0].message.content,
-                    # "verbose": tool_result,
-                    "avatar": avatar_response.choices[0].message.content
-                }
-            
+                    """
 
-            else: #if there is no tool call, this is the else block which is entered
-                print(f"\n#################No tool call found")
-                avatar_messages = [
-                {
-                    "role": "system",
-                    "content": """
+# Text-to-speech rephrase of a direct (no tool) reply
+AVATAR_DIRECT_PROMPT = """
                     
                     You are Vega’s voice. Rephrase the previous assistant message for text-to-speech. Do not add, remove, or infer new information; only compress and humanize.
 
@@ -263,43 +118,688 @@ class LLMAgent:
 
 
                     """
-                },
-                {
-                    "role": "user",
-                    "content": Initialresponse.choices[0].message.content
+
+# Rolls older conversation turns into a running summary (server-side sessions)
+SUMMARY_PROMPT = """Update the running summary of a support conversation between a user and Vega (Authenion/IAM assistant).
+Merge the previous summary with the new turns into at most 120 words.
+Keep product names, versions, error codes, ports, config keys, and what was already answered or tried.
+Drop greetings and pleasantries. Never include addresses, phone numbers, or client names.
+Return only the summary."""
+
+# Short direct reply for messages the local intent router classified as casual (replaces the router call)
+CASUAL_PROMPT = """Your name is Vega, an expert IAM (Authenion) support assistant.
+The user sent a casual message. Reply briefly (2-3 sentences) and professionally.
+Do not answer technical questions from memory; invite the user to ask their Authenion/IAM question instead."""
+
+ERROR_AVATAR_TEXT = "I encountered an error while processing your question. Please try again."
+BUSY_MESSAGE = "Vega is handling a lot of questions right now. Please try again in a moment."
+
+# Answer pipeline for knowledge base questions:
+# "standard" → router → condense + QA (chatbot) → finalizer → avatar (5 sequential calls)
+# "fast"     → router → QA on the router's rewritten question → avatar (3 sequential calls).
+#              The router already makes the question standalone and QA_PROMPT is mode-aware,
+#              so the condense step and the finalizer are skipped.
+PIPELINE_MODES = ("standard", "fast")
+LLM_PIPELINE_MODE = os.getenv("LLM_PIPELINE_MODE", "standard").lower()
+
+# How the avatar (text-to-speech) text is delivered:
+# "inline"   → generated before the response is returned (previous behaviour)
+# "deferred" → generated in the background, fetched later by response_id
+# "none"     → not generated (text-only clients and API integrations)
+AVATAR_MODES = ("inline", "deferred", "none")
+
+# Batch answering (answer_batch): questions per batch and LLM calls in flight per batch
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", 50))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+
+
+class LLMAgent:
+    def __init__(self, api_key: str = None, pipeline_mode: str = None):
+        # Shared pooled OpenAI client with deadlines and retries (see llm_client.py; LLM_BASE_URL switches providers/mock)
+        # api_key may be None, then OPENAI_API_KEY is taken from the environment.
+        self.client = get_async_client(api_key)
+        self.tomcat_monitor = TomcatMonitor() # Initialize Tomcat monitor class file. To add more Modules of operation we can Initilize here. Like Ping Directory Monitoring...
+        self.vector_store = vector_store
+        self.answer_cache = answer_cache if ANSWER_CACHE_ENABLED else None
+        self.avatar_store = avatar_store
+        # Coalesces concurrent identical questions (and avatar rephrases of the same answer)
+        self.single_flight = SingleFlight()
+        register_stats("single_flight", self.single_flight.stats)
+        # Local casual/technical classifier that lets clear cases skip the LLM routing call
+        self.intent_router = intent_router if INTENT_ROUTER_ENABLED else None
+        self.pipeline_mode = (pipeline_mode or LLM_PIPELINE_MODE).lower()
+        if self.pipeline_mode not in PIPELINE_MODES:
+            raise ValueError(f"Unknown pipeline mode: {self.pipeline_mode} (expected one of {PIPELINE_MODES})")
+        
+
+        # Define available tools For now only Tomcat monitor and move to Our Knowledge base to Check. 
+        self.tools = [
+            # {
+            #     "type": "function",
+            #     "function": {
+            #         "name": "check_tomcat_status",
+            #         "description": "Check the status of Tomcat server including health, memory usage, and running processes",
+            #         "parameters": {
+            #             "type": "object",
+            #             "properties": {
+            #                 "detailed": {
+            #                     "type": "boolean",
+            #                     "description": "Whether to return detailed status information",
+            #                     "default": False
+            #                 }
+            #             }
+            #         }
+            #     }
+            # },
+            {
+                "type": "function",
+                "function": {
+                    "name": "search_knowledge_base",
+                    "description": "Search the knowledge base for information on topics other than Tomcat server status",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "query": {
+                                "type": "string",
+                                "description": "The search query for the knowledge base"
+                            },
+                            "limit": {
+                                "type": "integer",
+                                "description": "Maximum number of results to return",
+                                "default": 5
+                            }
+                        },
+                        "required": ["query"]
+                    }
                 }
+            }
+        ]
+        self.tool_names = [tool["function"]["name"] for tool in self.tools]
+
+    def _is_technical(self, user_query: str) -> bool:
+        """Whether the local rules consider a message technical (router direct replies to it are escalated)"""
+        decision = intent_router.classify_rules(user_query)
+        return bool(decision and decision["intent"] == "technical")
+
+    def _build_router_messages(self, user_query: str, chat_history: dict) -> List[Dict[str, Any]]:
+        """Build the messages for the routing call"""
+        return [
+            {"role": "system", "content": ROUTER_PROMPT},
+            {
+                "role": "user", 
+                "content": f"Current User Query: {user_query}; Chat History: {chatbot.format_history_for_prompt(chat_history)}"
+            }
+        ]
+
+    async def _classify_intent(self, user_query: str) -> Optional[Dict[str, Any]]:
+        """Local intent decision (see intent_router.py), None when the intent router is disabled"""
+        if not self.intent_router:
+            return None
+        # The embedding fallback runs the local model, keep it off the event loop
+        with stage("intent"):
+            decision = await asyncio.to_thread(self.intent_router.classify, user_query)
+        log(f"\n#################Local intent: {decision['intent']} ({decision['source']}, score {decision['score']:.2f})")
+        return decision
+
+    def _local_tool_call(self, query: str):
+        """Router-equivalent message calling search_knowledge_base with an already standalone question"""
+        mode = mode_tag(query)
+        if mode:
+            # The tag the router/question rewrite would have added, which the QA and finalizer prompts follow
+            query = f"[MODE: {mode}] {query}"
+        return ChatCompletionMessage.model_validate({
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{
+                "id": f"call_local_{os.urandom(6).hex()}",
+                "type": "function",
+                "function": {"name": "search_knowledge_base", "arguments": json.dumps({"query": query, "limit": 5})}
+            }]
+        })
+
+    async def _casual_reply(self, user_query: str):
+        """Direct reply to a casual message with a short prompt and no tools"""
+        with stage("casual_reply"):
+            response = await create_for_stage(
+                "casual_reply",
+                self.client,
+                check=check_not_empty,
+                temperature=0.2,
+                messages=[
+                    {"role": "system", "content": CASUAL_PROMPT},
+                    {"role": "user", "content": user_query}
                 ]
-                avatar_response = await self.client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    temperature=0.4,
-                    messages=avatar_messages
-                )
+            )
+        return response.choices[0].message
+
+    async def _route(self, user_query: str, chat_history: dict, decision: Optional[Dict[str, Any]] = None):
+        """LLM decides whether to answer directly or which tool to use (skipped when the local intent is clear)"""
+        if decision and decision["intent"] == "casual":
+            return await self._casual_reply(user_query)
+        if decision and decision["intent"] == "technical" and not chat_history:
+            # Without history the question is already standalone, which is all the router call adds
+            return self._local_tool_call(user_query)
+        with stage("router"):
+            Initialresponse = await create_for_stage(
+                "router",
+                self.client,
+                check=router_check(user_query, self.tool_names, self._is_technical),
+                temperature=0.2,
+                messages=self._build_router_messages(user_query, chat_history),
+                tools=self.tools,
+                tool_choice="auto"
+            )
+        message = Initialresponse.choices[0].message
+        log(f"\n\n######################LLM Initial response: tool_calls={[call.function.name for call in message.tool_calls or []]}, usage={Initialresponse.usage}")
+        return message
+
+    async def _execute_tool(self, function_name: str, function_args: Dict[str, Any], chat_history: dict = None):
+        """Execute a tool call, returns (tool_result, grounding_doc_ids)"""
+        grounding_doc_ids = None
+        if function_name == "check_tomcat_status":
+            log(f"\n#################Calling tool: {function_name} with args: {function_args}")
+            with stage("tomcat_check"):
+                tool_result = await self._check_tomcat_status(**function_args)
+            log(f"\n#################Tomcat server check Tool result with type: {type(tool_result)} - {tool_result}")
+        elif function_name == "search_knowledge_base":
+            log(f"\n#################Calling Knowledge Base: {function_name} with args: {function_args}")
+            with stage("kb_search"):
+                kb_result = await self._search_knowledge_base(**function_args, history=chat_history)
+            tool_result = kb_result["answer"]
+            grounding_doc_ids = kb_result.get("doc_ids")
+            log(f"\n#################Knowledge Base search tool_result with type: {type(tool_result)} - {tool_result}")
+        else:
+            tool_result = "Unknown function called"
+            log("\n#####################Unknown function called")
+        return tool_result, grounding_doc_ids
+
+    def _build_final_messages(self, router_message, tool_call, function_name: str, tool_result) -> List[Dict[str, Any]]:
+        """Build the finalizer messages that ground the answer on the tool result"""
+        return [
+            # 1) Finalizer system prompt (mode-aware; includes EXPLAIN/HOWTO)
+            {"role": "system", "content": FINALIZER_PROMPT},
+
+            # 2) Pass through the assistant message that made the tool call
+            {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": router_message.tool_calls
+            },
 
-                return {
-                    "verbose": Initialresponse.choices[0].message.content,
-                    "avatar": avatar_response.choices[0].message.content
-                }
+            # 3) Provide the tool result with its NAME so the model grounds on it
+            {
+                "role": "tool",
+                "tool_call_id": tool_call.id,
+                "name": function_name,       # <-- keep this; critical for grounding
+                "content": str(tool_result)  # <-- the KB/RAG answer text
+            }
+        ]
+
+    async def _prepare_final_messages(
+        self,
+        router_message,
+        tool_call,
+        function_name: str,
+        function_args: Dict[str, Any],
+        chat_history: dict = None
+    ):
+        """Run the tool step for the configured pipeline mode, returns (final_messages, grounding_doc_ids)"""
+        if self.pipeline_mode == "fast" and function_name == "search_knowledge_base":
+            # Retrieve on the router's standalone question and answer with the mode-aware QA prompt directly
+            query = function_args.get("query", "")
+            log(f"\n#################Fast pipeline retrieval for query: {query}")
+            with stage("retrieval"):
+                docs = await asyncio.to_thread(chatbot.retrieve_documents, query)
+            with stage("context"):
+                qa_prompt = await asyncio.to_thread(chatbot.build_qa_prompt, query, docs)
+            final_messages = [{"role": "user", "content": qa_prompt}]
+            return final_messages, chatbot.extract_doc_ids(docs)
+
+        tool_result, grounding_doc_ids = await self._execute_tool(function_name, function_args, chat_history)
+        return self._build_final_messages(router_message, tool_call, function_name, tool_result), grounding_doc_ids
+
+    def _final_stage(self, function_name: str) -> str:
+        """Trace stage name of the final answer call (the QA call itself in fast mode)"""
+        return "qa" if self.pipeline_mode == "fast" and function_name == "search_knowledge_base" else "finalizer"
+
+    async def _generate_avatar(self, text: str, prompt: str = AVATAR_TOOL_PROMPT) -> str:
+        """Get avatar-friendly (text-to-speech) version of an answer"""
+        avatar_messages = [
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": text}
+        ]
+        with stage("avatar"):
+            avatar_response = await create_for_stage(
+                "avatar",
+                self.client,
+                check=check_avatar,
+                temperature=0.4,
+                messages=avatar_messages
+            )
+        return avatar_response.choices[0].message.content
+
+    async def _lookup_cache(self, question: str):
+        """Return a cached {verbose, avatar} answer for a standalone question, or None"""
+        if not self.answer_cache:
+            return None
+        # Lookups embed the question locally, keep that off the event loop
+        with stage("cache_lookup"):
+            cached = await asyncio.to_thread(self.answer_cache.lookup, question)
+        if cached:
+            log(f"\n#################Answer cache hit (similarity {cached['similarity']:.3f}) for: {question}")
+            return cached
+        return None
+
+    async def _store_cache(self, question: str, verbose_text: str, avatar_text: Optional[str], grounding_doc_ids):
+        """Cache a grounded answer, returns the cache key (None when not cached)"""
+        # Only answers from a successful KB search are cached (errors carry no doc_ids)
+        if not self.answer_cache or grounding_doc_ids is None:
+            return None
+        return await asyncio.to_thread(self.answer_cache.store, question, verbose_text, avatar_text, grounding_doc_ids)
+
+    async def _generate_avatar_for(self, verbose_text: str, avatar_prompt: str, cache_key=None) -> str:
+        """Generate avatar text (once per identical answer in flight) and fill it into the cached answer"""
+        avatar_text = await self.single_flight.do(
+            coalesce_key(verbose_text, None, "avatar", avatar_prompt),
+            lambda: self._generate_avatar(verbose_text, avatar_prompt)
+        )
+        if cache_key is not None and self.answer_cache:
+            self.answer_cache.fill_avatar(cache_key, avatar_text)
+        return avatar_text
+
+    async def _complete_answer(
+        self,
+        verbose_text: str,
+        avatar_prompt: str,
+        avatar_mode: str,
+        owner: Optional[str] = None,
+        avatar_text: Optional[str] = None,
+        cache_key=None
+    ) -> Dict[str, Any]:
+        """Attach the avatar text according to avatar_mode: generated inline, deferred to the avatar store or skipped"""
+        result = {"verbose": verbose_text, "avatar": avatar_text}
+        if avatar_mode == "none":
+            return result
+        if avatar_mode == "deferred":
+            if avatar_text is not None:
+                result["response_id"] = self.avatar_store.put(avatar_text, owner)
+            else:
+                result["response_id"] = self.avatar_store.submit(
+                    self._generate_avatar_for(verbose_text, avatar_prompt, cache_key), owner
+                )
+            return result
+        if avatar_text is None:
+            result["avatar"] = await self._generate_avatar_for(verbose_text, avatar_prompt, cache_key)
+        return result
+
+    async def process_query(
+        self,
+        user_query: str,
+        chat_history: dict = None,
+        avatar_mode: str = "inline",
+        owner: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Process user query and route to appropriate tool.
+        Returns {"verbose", "avatar"} plus "response_id" when avatar_mode is "deferred"
+        (owner is the username allowed to fetch the deferred avatar text).
+        Concurrent identical questions (same normalized question and history) share one pipeline run.
+        """
+        if chat_history is None:
+            chat_history = {}
+        if avatar_mode not in AVATAR_MODES:
+            raise ValueError(f"Unknown avatar mode: {avatar_mode} (expected one of {AVATAR_MODES})")
+        
+        try:
+            answer = await self.single_flight.do(
+                coalesce_key(user_query, chat_history),
+                lambda: self._answer(user_query, chat_history)
+            )
+            return await self._complete_answer(
+                answer["verbose"], answer["avatar_prompt"], avatar_mode, owner, answer["avatar"], answer["cache_key"]
+            )
+        except OVERLOAD_ERRORS as e:
+            log(f"\n#################LLM overloaded: {type(e).__name__}: {str(e)}")
+            return {"verbose": BUSY_MESSAGE, "avatar": BUSY_MESSAGE, "error": True}
         except Exception as e:
             error_message = f"Error processing query: {str(e)}"
+            log(f"\n#################{error_message}")
             return {
                 "verbose": error_message,
-                "avatar": "I encountered an error while processing your question. Please try again."
+                "avatar": ERROR_AVATAR_TEXT,
+                "error": True
+            }
+
+    async def _answer(self, user_query: str, chat_history: dict) -> Dict[str, Any]:
+        """
+        Produce the verbose answer (everything except the avatar step).
+        Returns {"verbose", "avatar" (cached text or None), "avatar_prompt", "cache_key"}.
+        """
+        # Whole-message small talk ("hi", "thanks") gets a canned reply without any LLM call
+        decision = await self._classify_intent(user_query)
+        if decision and decision["reply"]:
+            return {"verbose": decision["reply"], "avatar": decision["reply"], "avatar_prompt": AVATAR_DIRECT_PROMPT, "cache_key": None}
+
+        # Without history the user query is already standalone, so a cached answer can skip every LLM call
+        if not chat_history:
+            cached = await self._lookup_cache(user_query)
+            if cached:
+                return {"verbose": cached["verbose"], "avatar": cached["avatar"], "avatar_prompt": AVATAR_TOOL_PROMPT, "cache_key": cached["key"]}
+
+        #  LLM decides which tool to use
+        router_message = await self._route(user_query, chat_history, decision)
+
+        # Check if the LLM wants to call the tool or KB.
+        if router_message.tool_calls:
+            # Extract tool call details
+            tool_call = router_message.tool_calls[0]
+            function_name = tool_call.function.name
+            function_args = json.loads(tool_call.function.arguments)
+            
+            # The router already rewrote the question into a standalone one, check the cache again
+            if function_name == "search_knowledge_base":
+                cached = await self._lookup_cache(function_args.get("query", ""))
+                if cached:
+                    return {"verbose": cached["verbose"], "avatar": cached["avatar"], "avatar_prompt": AVATAR_TOOL_PROMPT, "cache_key": cached["key"]}
+            
+            # Execute the appropriate tool
+            final_messages, grounding_doc_ids = await self._prepare_final_messages(
+                router_message, tool_call, function_name, function_args, chat_history
+            )
+
+            final_stage = self._final_stage(function_name)
+            with stage(final_stage):
+                final_response = await create_for_stage(
+                    final_stage,
+                    self.client,
+                    check=check_not_empty,
+                    temperature=0.1,
+                    messages=final_messages
+                )
+
+            log(f"\n\n#################Final response from model: usage={final_response.usage}")
+
+            verbose_text = final_response.choices[0].message.content
+            cache_key = await self._store_cache(function_args.get("query", ""), verbose_text, None, grounding_doc_ids)
+            return {"verbose": verbose_text, "avatar": None, "avatar_prompt": AVATAR_TOOL_PROMPT, "cache_key": cache_key}
+
+        else: #if there is no tool call, this is the else block which is entered
+            log(f"\n#################No tool call found")
+            return {"verbose": router_message.content, "avatar": None, "avatar_prompt": AVATAR_DIRECT_PROMPT, "cache_key": None}
+
+    async def stream_query(
+        self,
+        user_query: str,
+        chat_history: dict = None,
+        avatar_mode: str = "inline"
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of process_query.
+        Yields events: {"event": "token", "data": str} for each finalizer token as it arrives,
+        {"event": "answer", "data": str} with the full verbose answer,
+        {"event": "avatar", "data": str} once the avatar text is generated (not sent when avatar_mode is "none"),
+        {"event": "error", "data": str} on failure and finally {"event": "done"}.
+        The avatar is always sent after the answer, so "deferred" behaves like "inline" here.
+        """
+        if chat_history is None:
+            chat_history = {}
+
+        try:
+            async for event in self._stream_events(user_query, chat_history, avatar_mode != "none", time.perf_counter()):
+                yield event
+        except OVERLOAD_ERRORS as e:
+            log(f"\n#################LLM overloaded: {type(e).__name__}: {str(e)}")
+            yield {"event": "error", "data": BUSY_MESSAGE}
+            if avatar_mode != "none":
+                yield {"event": "avatar", "data": BUSY_MESSAGE}
+        except Exception as e:
+            yield {"event": "error", "data": f"Error processing query: {str(e)}"}
+            if avatar_mode != "none":
+                yield {"event": "avatar", "data": ERROR_AVATAR_TEXT}
+        yield {"event": "done", "data": ""}
+
+    async def _cached_events(self, cached: Dict[str, Any], with_avatar: bool) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the stream events for a cached answer"""
+        yield {"event": "token", "data": cached["verbose"]}
+        yield {"event": "answer", "data": cached["verbose"]}
+        if with_avatar:
+            avatar_text = cached["avatar"]
+            if avatar_text is None:
+                avatar_text = await self._generate_avatar_for(cached["verbose"], AVATAR_TOOL_PROMPT, cached["key"])
+            yield {"event": "avatar", "data": avatar_text}
+
+    async def _stream_events(
+        self,
+        user_query: str,
+        chat_history: dict,
+        with_avatar: bool,
+        started: float
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Run the pipeline and yield stream_query events (errors propagate to the caller)"""
+        decision = await self._classify_intent(user_query)
+        if decision and decision["reply"]:
+            yield {"event": "token", "data": decision["reply"]}
+            yield {"event": "answer", "data": decision["reply"]}
+            if with_avatar:
+                yield {"event": "avatar", "data": decision["reply"]}
+            return
+
+        cached = (await self._lookup_cache(user_query)) if not chat_history else None
+        if cached:
+            async for event in self._cached_events(cached, with_avatar):
+                yield event
+            return
+
+        router_message = await self._route(user_query, chat_history, decision)
+
+        if not router_message.tool_calls:
+            # Direct reply: the router already produced the whole answer
+            log(f"\n#################No tool call found")
+            yield {"event": "token", "data": router_message.content}
+            yield {"event": "answer", "data": router_message.content}
+            if with_avatar:
+                avatar_text = await self._generate_avatar(router_message.content, AVATAR_DIRECT_PROMPT)
+                yield {"event": "avatar", "data": avatar_text}
+            return
+
+        tool_call = router_message.tool_calls[0]
+        function_name = tool_call.function.name
+        function_args = json.loads(tool_call.function.arguments)
+
+        if function_name == "search_knowledge_base":
+            cached = await self._lookup_cache(function_args.get("query", ""))
+            if cached:
+                async for event in self._cached_events(cached, with_avatar):
+                    yield event
+                return
+
+        final_messages, grounding_doc_ids = await self._prepare_final_messages(
+            router_message, tool_call, function_name, function_args, chat_history
+        )
+
+        # Timed by hand: a stage() block must not stay open across the yields below
+        final_stage = self._final_stage(function_name)
+        stage_started = time.perf_counter()
+        error = None
+        parts = []
+        # Streamed tokens reach the client as they arrive, so this call is never escalated
+        final_model = model_for(final_stage)
+        try:
+            stream = await client_for(final_stage, self.client).chat.completions.create(
+                model=final_model,
+                temperature=0.1,
+                messages=final_messages,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            async for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    record_llm_usage(chunk.usage, final_model, final_stage)
+                if not chunk.choices:
+                    continue
+                token = chunk.choices[0].delta.content
+                if token:
+                    if not parts:
+                        TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - started)
+                    parts.append(token)
+                    yield {"event": "token", "data": token}
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            observe_stage(final_stage, time.perf_counter() - stage_started, error)
+
+        verbose_text = "".join(parts)
+        yield {"event": "answer", "data": verbose_text}
+        cache_key = await self._store_cache(function_args.get("query", ""), verbose_text, None, grounding_doc_ids)
+
+        if with_avatar:
+            avatar_text = await self._generate_avatar_for(verbose_text, AVATAR_TOOL_PROMPT, cache_key)
+            yield {"event": "avatar", "data": avatar_text}
+
+    async def summarize_history(self, previous_summary: str, turns: List[tuple]) -> str:
+        """Fold conversation turns into the running summary (session history compaction)"""
+        transcript = "\n".join(f"User: {question}\nAssistant: {answer}" for question, answer in turns)
+        with stage("summary"):
+            response = await create_for_stage(
+                "summary",
+                self.client,
+                check=check_not_empty,
+                temperature=0.1,
+                messages=[
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": f"Previous summary: {previous_summary or '(none)'}\n\nNew turns:\n{transcript}"}
+                ]
+            )
+        return response.choices[0].message.content.strip()
+
+    def _prepare_batch(self, questions: List[str]) -> Dict[str, Any]:
+        """
+        Embed a batch of standalone questions in one call, check the answer cache, retrieve the context of
+        the uncached ones with a single vector query and build their QA prompts (runs in a worker thread).
+        """
+        search_texts = [retrieval_cache.search_text(question) for question in questions]
+        unique_texts = list(dict.fromkeys(text for text in search_texts if text))
+        vectors = dict(zip(unique_texts, embeddings.embed_documents(unique_texts))) if unique_texts else {}
+
+        cached = [
+            self.answer_cache.lookup(question, vectors.get(text)) if self.answer_cache else None
+            for question, text in zip(questions, search_texts)
+        ]
+        # A question that is only a mode tag has nothing to search for; answer_batch reports it as an error
+        pending = [index for index, hit in enumerate(cached) if not hit and search_texts[index]]
+        documents = retrieval_cache.retrieve_many(
+            [questions[index] for index in pending], **chatbot.RETRIEVAL_SEARCH_KWARGS, query_embeddings=vectors
+        )
+        retrieved = dict(zip(pending, documents))
+        return {
+            "vectors": [vectors.get(text) for text in search_texts],
+            "cached": cached,
+            "empty": {index for index, text in enumerate(search_texts) if not text},
+            "doc_ids": {index: chatbot.extract_doc_ids(docs) for index, docs in retrieved.items()},
+            "prompts": {index: chatbot.build_qa_prompt(questions[index], docs) for index, docs in retrieved.items()},
+            "chunks": sum(len(docs) for docs in documents),
+            "unique_chunks": len({doc.page_content for docs in documents for doc in docs})
+        }
+
+    async def _answer_batch_question(self, prompt: str, semaphore: asyncio.Semaphore, priority: str) -> str:
+        """QA call for one batch question, at most BATCH_CONCURRENCY per batch at a time"""
+        async with semaphore:
+            with stage("qa"):
+                response = await create_for_stage(
+                    "qa",
+                    self.client,
+                    check=check_not_empty,
+                    priority=priority,
+                    temperature=0.1,
+                    messages=[{"role": "user", "content": prompt}]
+                )
+        return response.choices[0].message.content.strip()
+
+    async def answer_batch(
+        self,
+        questions: List[str],
+        concurrency: int = BATCH_CONCURRENCY,
+        priority: str = "background"
+    ) -> Dict[str, Any]:
+        """
+        Answer a list of standalone questions (no history, no avatar text) with shared retrieval:
+        duplicate questions are answered once, the answer cache and vector search see the whole batch
+        at once, and the mode-aware QA call (as in the fast pipeline) runs with bounded concurrency.
+        Returns {"results": [{"question", "answer", "doc_ids", "cached", "seconds", "error"?}], "timing": {...}}.
+        """
+        started = time.perf_counter()
+        # Exact duplicates (same mode tag and normalized text) share one answer
+        groups: Dict[tuple, List[int]] = {}
+        for index, question in enumerate(questions):
+            mode, text = split_mode_tag(question)
+            groups.setdefault((mode, normalize_question(text)), []).append(index)
+        unique_questions = [questions[indexes[0]] for indexes in groups.values()]
+
+        with stage("batch_retrieval"):
+            prepared = await asyncio.to_thread(self._prepare_batch, unique_questions)
+        retrieval_seconds = time.perf_counter() - started
+
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def answer(index: int) -> Dict[str, Any]:
+            question = unique_questions[index]
+            cached = prepared["cached"][index]
+            if cached:
+                return {"question": question, "answer": cached["verbose"], "doc_ids": None, "cached": True, "seconds": 0.0}
+            if index in prepared["empty"]:
+                return {"question": question, "answer": "Empty question", "doc_ids": None, "cached": False, "seconds": 0.0, "error": True}
+            question_started = time.perf_counter()
+            result = {"question": question, "doc_ids": prepared["doc_ids"][index], "cached": False}
+            try:
+                result["answer"] = await self._answer_batch_question(prepared["prompts"][index], semaphore, priority)
+                if self.answer_cache:
+                    self.answer_cache.store(question, result["answer"], None, result["doc_ids"], prepared["vectors"][index])
+            except OVERLOAD_ERRORS as e:
+                log(f"\n#################LLM overloaded in batch: {type(e).__name__}: {str(e)}")
+                result.update(answer=BUSY_MESSAGE, error=True)
+            except Exception as e:
+                log(f"\n#################Error answering batch question: {str(e)}")
+                result.update(answer=f"Error processing query: {str(e)}", error=True)
+            result["seconds"] = time.perf_counter() - question_started
+            return result
+
+        llm_started = time.perf_counter()
+        answers = await asyncio.gather(*(answer(index) for index in range(len(unique_questions))))
+        llm_seconds = time.perf_counter() - llm_started
+
+        results: List[Dict[str, Any]] = [None] * len(questions)
+        for indexes, result in zip(groups.values(), answers):
+            for index in indexes:
+                results[index] = {**result, "question": questions[index]}
+        return {
+            "results": results,
+            "timing": {
+                "total_seconds": time.perf_counter() - started,
+                "retrieval_seconds": retrieval_seconds,
+                "llm_seconds": llm_seconds,
+                "questions": len(questions),
+                "unique_questions": len(unique_questions),
+                "cache_hits": sum(1 for result in answers if result["cached"]),
+                "chunks_retrieved": prepared["chunks"],
+                "unique_chunks": prepared["unique_chunks"]
             }
+        }
 
     async def _check_tomcat_status(self, detailed: bool = False) -> str:
         """Tool function to check Tomcat status"""
-        print(f"\n########################Checking Tomcat status with detailed={detailed}")
+        log(f"\n########################Checking Tomcat status with detailed={detailed}")
         return await self.tomcat_monitor.get_status(detailed)
 
-    async def _search_knowledge_base(self, query: str, limit: int = 5) -> Dict[str, Any]:
-        """Tool function to search knowledge base"""
+    async def _search_knowledge_base(self, query: str, limit: int = 5, history: dict = None) -> Dict[str, Any]:
+        """Tool function to search knowledge base, returns the answer and its grounding doc IDs"""
         
-        # Use the stored chat history
-        history = getattr(self, 'current_chat_history', {})
-        print(f"\n#########################Agent Searching knowledge base with query: {query}, \nhistory: {history}")
-        result = chatbot.get_chatbot_response(query, history=history)
+        # Chat history is passed per request (not stored on the shared agent) so concurrent chats don't mix
+        history = history or {}
+        log(f"\n#########################Agent Searching knowledge base with query: {query}, \nhistory: {history}")
+        result = await chatbot.aget_chatbot_response(query, history=history, client=self.client)
 
-        # Extract the answer from the result
+        # Extract the answer and grounding documents from the result
         if isinstance(result, dict) and "answer" in result:
-            return result["answer"]
-        return str(result)
\ No newline at end of file
+            return {"answer": result["answer"], "doc_ids": result.get("doc_ids")}
+        return {"answer": str(result), "doc_ids": None}
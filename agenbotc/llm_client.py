@@ -0,0 +1,473 @@
+"""
+Shared LLM client layer.
+One pooled OpenAI-compatible client used by the LLM agent and the chatbot, with keep-alive
+connection limits, per-call deadlines, jittered retries under a global retry budget,
+429 backoff (honouring Retry-After) and a pluggable base URL (e.g. the local mock server).
+Every attempt first goes through the scheduler: requests- and tokens-per-minute buckets shared
+by all concurrent requests, with interactive calls served before background ones.
+"""
+
+import os
+import json
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import threading
+from collections import deque
+from typing import Optional
+import httpx
+import openai
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+from prometheus_client import Counter, Histogram
+from tracing import record_usage, register_stats, current_stage, log
+from usage_meter import usage_meter
+from session_store import count_tokens
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(dotenv_path=os.path.join(current_dir, '.env'))
+
+# Configuration
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or os.getenv("OPENAI_BASE_URL")  # None → api.openai.com
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 60))  # per-call deadline, across retries
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", 5))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 100))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 20))
+LLM_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("LLM_KEEPALIVE_EXPIRY_SECONDS", 30))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+LLM_RETRY_BASE_DELAY_SECONDS = float(os.getenv("LLM_RETRY_BASE_DELAY_SECONDS", 0.5))
+LLM_RETRY_MAX_DELAY_SECONDS = float(os.getenv("LLM_RETRY_MAX_DELAY_SECONDS", 8))
+LLM_RETRY_BUDGET_RATIO = float(os.getenv("LLM_RETRY_BUDGET_RATIO", 0.2))  # retries allowed per request
+LLM_RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("LLM_RETRY_BUDGET_MIN_PER_SECOND", 1))
+LLM_RETRY_BUDGET_WINDOW_SECONDS = float(os.getenv("LLM_RETRY_BUDGET_WINDOW_SECONDS", 10))
+# Provider rate limits shared by all outbound calls (0 → unlimited); set them a little below the account's limits
+LLM_RATE_LIMIT_RPM = float(os.getenv("LLM_RATE_LIMIT_RPM", 0))
+LLM_RATE_LIMIT_TPM = float(os.getenv("LLM_RATE_LIMIT_TPM", 0))
+LLM_EXPECTED_COMPLETION_TOKENS = int(os.getenv("LLM_EXPECTED_COMPLETION_TOKENS", 400))  # reserved when max_tokens is unset
+# Pipeline stages whose calls yield to interactive ones (avatar rephrase, history summaries)
+LLM_BACKGROUND_STAGES = {name.strip() for name in os.getenv("LLM_BACKGROUND_STAGES", "avatar,summary").split(",") if name.strip()}
+
+PRIORITIES = {"interactive": 0, "background": 1}
+
+LLM_QUEUE_WAIT = Histogram(
+    "vega_llm_queue_wait_seconds",
+    "Time LLM calls wait for the rate limit scheduler",
+    ["priority"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+)
+LLM_SCHEDULER_REJECTIONS = Counter(
+    "vega_llm_scheduler_rejections_total",
+    "LLM calls failed by the scheduler because their deadline could not be met",
+    ["priority"]
+)
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,  # includes APITimeoutError
+    openai.InternalServerError,
+)
+
+
+class LLMDeadlineExceeded(Exception):
+    """Raised when an LLM call cannot complete before its deadline"""
+    pass
+
+
+# Errors meaning the provider (or our rate limit) is saturated rather than the request being wrong
+OVERLOAD_ERRORS = (LLMDeadlineExceeded, openai.RateLimitError)
+
+
+class RetryBudget:
+    """
+    Global retry budget: within a sliding window, retries may not exceed
+    min_per_second * window + ratio * requests. Keeps retries from multiplying load during an outage.
+    """
+
+    def __init__(
+        self,
+        ratio: float = LLM_RETRY_BUDGET_RATIO,
+        min_per_second: float = LLM_RETRY_BUDGET_MIN_PER_SECOND,
+        window_seconds: float = LLM_RETRY_BUDGET_WINDOW_SECONDS
+    ):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window_seconds = window_seconds
+        self._requests = deque()
+        self._retries = deque()
+        self._lock = threading.Lock()
+        self.exhausted = 0
+        self.retries = 0
+
+    def _trim(self, now: float):
+        """Forget events that left the window (caller holds the lock)"""
+        for events in (self._requests, self._retries):
+            while events and now - events[0] > self.window_seconds:
+                events.popleft()
+
+    def record_request(self):
+        """Record a first attempt"""
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            self._requests.append(now)
+
+    def try_acquire_retry(self) -> bool:
+        """Take a retry from the budget, False when the budget is spent"""
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            allowed = self.min_per_second * self.window_seconds + self.ratio * len(self._requests)
+            if len(self._retries) >= allowed:
+                self.exhausted += 1
+                return False
+            self._retries.append(now)
+            self.retries += 1
+            return True
+
+    def stats(self):
+        """Return retry counters"""
+        return {"retries": self.retries, "exhausted": self.exhausted}
+
+
+retry_budget = RetryBudget()
+register_stats("llm_retry", retry_budget.stats)
+
+
+class _TokenBucket:
+    """Refills rate_per_minute / 60 per second up to a minute's worth (rate 0 → unlimited)"""
+
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60
+        self.capacity = rate_per_minute
+        self.level = rate_per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        if self.rate:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available (amount is capped at the capacity so huge calls still run)"""
+        if not self.rate:
+            return 0.0
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float):
+        if self.rate:
+            self.level -= min(amount, self.capacity)
+
+
+class LLMScheduler:
+    """
+    Admission control for outbound LLM calls: requests-per-minute and tokens-per-minute token buckets,
+    a priority queue (interactive before background, FIFO within a class), a pause after provider 429s,
+    and fail-fast rejection of calls that could not be admitted before their deadline.
+    Runs on the application's event loop.
+    """
+
+    def __init__(self, requests_per_minute: float = LLM_RATE_LIMIT_RPM, tokens_per_minute: float = LLM_RATE_LIMIT_TPM):
+        self.requests = _TokenBucket(requests_per_minute)
+        self.tokens = _TokenBucket(tokens_per_minute)
+        self._queue = []  # (priority, sequence, future, tokens, deadline)
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._wakeup = None
+        self._dispatcher = None
+        self._loop = None
+        self.rejected = 0
+        self.throttled = 0
+
+    def _wait_time(self, tokens: float, now: float) -> float:
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        return max(self._paused_until - now, self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def _queued_ahead(self, priority: int):
+        """Requests and tokens already queued that will be served before a call of this priority"""
+        ahead = [entry for entry in self._queue if entry[0] <= priority and not entry[2].done()]
+        return len(ahead), sum(entry[3] for entry in ahead)
+
+    def _estimated_wait(self, tokens: float, priority: int, now: float) -> float:
+        requests_ahead, tokens_ahead = self._queued_ahead(priority)
+        wait = self._wait_time(tokens, now)
+        if self.requests.rate:
+            wait = max(wait, (requests_ahead + 1 - self.requests.level) / self.requests.rate)
+        if self.tokens.rate:
+            wait = max(wait, (tokens_ahead + min(tokens, self.tokens.capacity) - self.tokens.level) / self.tokens.rate)
+        return wait
+
+    def _reject(self, priority_name: str, message: str):
+        self.rejected += 1
+        LLM_SCHEDULER_REJECTIONS.labels(priority_name).inc()
+        raise LLMDeadlineExceeded(message)
+
+    async def acquire(self, tokens: float, priority_name: str = "interactive", deadline: float = None):
+        """Wait for a request slot and `tokens` tokens; raises LLMDeadlineExceeded when the deadline cannot be met"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Queue state belongs to one event loop (a new loop, e.g. in tests, starts afresh)
+            self._loop, self._queue, self._dispatcher = loop, [], None
+            self._wakeup = asyncio.Event()
+        priority = PRIORITIES[priority_name]
+        now = time.monotonic()
+        started = now
+        if not self._queue and self._wait_time(tokens, now) == 0:
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            LLM_QUEUE_WAIT.labels(priority_name).observe(0)
+            return
+        if deadline is not None and now + self._estimated_wait(tokens, priority, now) >= deadline:
+            self._reject(priority_name, "LLM rate limit: call cannot be admitted before its deadline")
+
+        self.throttled += 1
+        future = loop.create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), future, tokens, deadline))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = loop.create_task(self._dispatch())
+        self._wakeup.set()
+        try:
+            await future
+        except LLMDeadlineExceeded:
+            self.rejected += 1
+            LLM_SCHEDULER_REJECTIONS.labels(priority_name).inc()
+            raise
+        finally:
+            if not future.done():
+                future.cancel()  # caller cancelled: the dispatcher skips cancelled entries
+        waited = time.monotonic() - started
+        LLM_QUEUE_WAIT.labels(priority_name).observe(waited)
+        if waited > 1:
+            log(f"LLM scheduler: {priority_name} call waited {waited:.2f}s for the rate limit")
+
+    async def _dispatch(self):
+        """Admit queued calls in priority order as the buckets refill"""
+        while self._queue:
+            now = time.monotonic()
+            priority, _, future, tokens, deadline = self._queue[0]
+            if future.done():
+                heapq.heappop(self._queue)
+                continue
+            if deadline is not None and now >= deadline:
+                heapq.heappop(self._queue)
+                future.set_exception(LLMDeadlineExceeded("LLM rate limit: deadline passed while queued"))
+                continue
+            wait = self._wait_time(tokens, now)
+            if wait == 0:
+                heapq.heappop(self._queue)
+                self.requests.take(1)
+                self.tokens.take(tokens)
+                future.set_result(None)
+                continue
+            if deadline is not None:
+                wait = min(wait, deadline - now)
+            # Woken early when a higher priority call arrives or a 429 pause changes the schedule
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(wait, 0.001))
+            except asyncio.TimeoutError:
+                pass
+
+    def settle(self, reserved: float, used: float):
+        """Correct the tokens bucket once a call's actual token usage is known"""
+        if self.tokens.rate and used:
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + reserved - used)
+
+    def pause(self, seconds: float):
+        """Stop admitting calls for a while after the provider answered 429"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def stats(self):
+        """Return queue depth per priority and throttling counters"""
+        queued = {name: 0 for name in PRIORITIES}
+        names = {value: name for name, value in PRIORITIES.items()}
+        for entry in list(self._queue):
+            if not entry[2].done():
+                queued[names[entry[0]]] += 1
+        return {
+            "queued_interactive": queued["interactive"],
+            "queued_background": queued["background"],
+            "throttled": self.throttled,
+            "rejected": self.rejected
+        }
+
+
+scheduler = LLMScheduler()
+register_stats("llm_scheduler", scheduler.stats)
+
+
+def estimate_tokens(kwargs) -> int:
+    """Tokens a chat completion call will consume: its messages and tools plus the expected completion"""
+    prompt = sum(count_tokens(message.get("content") or "") if isinstance(message, dict) else 0 for message in kwargs.get("messages") or [])
+    if kwargs.get("tools"):
+        prompt += count_tokens(json.dumps(kwargs["tools"]))
+    return prompt + (kwargs.get("max_tokens") or LLM_EXPECTED_COMPLETION_TOKENS)
+
+
+def call_priority() -> str:
+    """Priority class of a call made from the current pipeline stage"""
+    return "background" if current_stage() in LLM_BACKGROUND_STAGES else "interactive"
+
+
+def record_llm_usage(usage, model: str, stage_name: str = None):
+    """Attribute an LLM call's token usage to the running trace stage and to the request's user"""
+    record_usage(usage, model, stage_name)
+    usage_meter.record(usage, model)
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Backoff before the next attempt: Retry-After when the server sends one, else full-jitter exponential"""
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(float(retry_after), LLM_RETRY_MAX_DELAY_SECONDS)
+            except ValueError:
+                pass
+    return random.uniform(0, min(LLM_RETRY_MAX_DELAY_SECONDS, LLM_RETRY_BASE_DELAY_SECONDS * (2 ** attempt)))
+
+
+class _SettlingStream:
+    """Streamed response that corrects the scheduler's token estimate from the usage in its last chunk"""
+
+    def __init__(self, stream, reserved: float):
+        self._stream = stream
+        self._reserved = reserved
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            usage = getattr(chunk, "usage", None)
+            if usage is not None:
+                scheduler.settle(self._reserved, getattr(usage, "total_tokens", 0))
+            yield chunk
+
+
+async def call_with_retries(create, timeout: Optional[float] = None, priority: Optional[str] = None, **kwargs):
+    """
+    Run an OpenAI create() call with a per-call deadline (timeout seconds, across all attempts)
+    and jittered retries on 429/5xx/connection errors, limited by the global retry budget.
+    Every attempt is admitted by the rate limit scheduler first (priority defaults from the trace stage).
+    """
+    if kwargs.get("stream"):
+        # Streams only report usage when asked to, and the scheduler settles from it
+        kwargs.setdefault("stream_options", {"include_usage": True})
+    deadline = time.monotonic() + (timeout or LLM_TIMEOUT_SECONDS)
+    priority = priority or call_priority()
+    tokens = estimate_tokens(kwargs) if scheduler.tokens.rate else 0
+    retry_budget.record_request()
+    attempt = 0
+    while True:
+        await scheduler.acquire(tokens, priority, deadline)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMDeadlineExceeded("LLM call deadline exceeded")
+        try:
+            response = await create(timeout=remaining, **kwargs)
+            if kwargs.get("stream"):
+                return _SettlingStream(response, tokens)
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                scheduler.settle(tokens, getattr(usage, "total_tokens", 0))
+            return response
+        except RETRYABLE_ERRORS as e:
+            delay = _retry_delay(e, attempt)
+            if isinstance(e, openai.RateLimitError):
+                # The provider is over its limit for everyone, hold back all calls, not just this one
+                scheduler.pause(delay)
+            if attempt >= LLM_MAX_RETRIES:
+                raise
+            if time.monotonic() + delay >= deadline:
+                raise LLMDeadlineExceeded(f"LLM call deadline exceeded after {attempt + 1} attempts: {str(e)}") from e
+            if not retry_budget.try_acquire_retry():
+                log(f"LLM retry budget exhausted, not retrying: {str(e)}")
+                raise
+            attempt += 1
+            log(f"LLM call failed ({type(e).__name__}), retry {attempt}/{LLM_MAX_RETRIES} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+
+class _ResilientCompletions:
+    """chat.completions facade whose create() goes through call_with_retries"""
+
+    def __init__(self, client: AsyncOpenAI):
+        self._client = client
+
+    async def create(self, timeout: Optional[float] = None, **kwargs):
+        response = await call_with_retries(self._client.chat.completions.create, timeout=timeout, **kwargs)
+        if not kwargs.get("stream"):
+            # Token usage is attributed to the running pipeline stage and user (streams report it in their last chunk)
+            record_llm_usage(getattr(response, "usage", None), kwargs.get("model"))
+        return response
+
+
+class _ResilientChat:
+    def __init__(self, client: AsyncOpenAI):
+        self.completions = _ResilientCompletions(client)
+
+
+class ResilientAsyncClient:
+    """
+    Drop-in replacement for openai.AsyncOpenAI for chat completions:
+    client.chat.completions.create(...) accepts the usual arguments plus timeout (per-call deadline).
+    """
+
+    def __init__(self, client: AsyncOpenAI):
+        self.raw = client
+        self.chat = _ResilientChat(client)
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY_SECONDS
+    )
+
+
+_async_http_client = None
+_async_clients = {}
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Shared keep-alive pooled async HTTP client"""
+    global _async_http_client
+    if _async_http_client is None:
+        _async_http_client = httpx.AsyncClient(limits=_limits(), timeout=_timeout())
+    return _async_http_client
+
+
+def get_async_client(api_key: str = None, base_url: str = None) -> ResilientAsyncClient:
+    """Shared resilient async client (one per API key and base URL) on the pooled HTTP client"""
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    base_url = base_url or LLM_BASE_URL
+    if (api_key, base_url) not in _async_clients:
+        raw = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=get_async_http_client(),
+            max_retries=0  # retries are handled by call_with_retries
+        )
+        _async_clients[(api_key, base_url)] = ResilientAsyncClient(raw)
+    return _async_clients[(api_key, base_url)]
+
+
+async def aclose():
+    """Close the pooled HTTP client (application shutdown)"""
+    global _async_http_client
+    if _async_http_client is not None:
+        await _async_http_client.aclose()
+        _async_http_client = None
+    _async_clients.clear()
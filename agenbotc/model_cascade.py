@@ -0,0 +1,152 @@
+"""
+Per-stage model selection with escalation.
+Each pipeline stage (router, casual_reply, condense, qa, finalizer, avatar, summary) gets its model from
+LLM_MODEL_<STAGE> (default LLM_DEFAULT_MODEL), and optionally its own OpenAI-compatible endpoint from
+LLM_BASE_URL_<STAGE> (e.g. a local model server as a stand-in for the cheap stages).
+When LLM_ESCALATION_MODEL_<STAGE> is set, a response that fails the stage's validation check
+(or a failed call to the cheap model) is retried once with the escalation model on the default endpoint.
+"""
+
+import os
+import re
+import json
+from typing import Optional, Dict, Any, Callable
+import openai
+from prometheus_client import Counter
+from llm_client import get_async_client, ResilientAsyncClient, LLMDeadlineExceeded, OVERLOAD_ERRORS
+from tracing import log
+
+# Configuration
+LLM_DEFAULT_MODEL = os.getenv("LLM_DEFAULT_MODEL", "gpt-4o-mini")
+CONDENSE_MAX_CHARS = int(os.getenv("CONDENSE_MAX_CHARS", 600))
+AVATAR_MAX_WORDS = int(os.getenv("AVATAR_MAX_WORDS", 140))
+
+MODEL_ESCALATIONS = Counter(
+    "vega_model_escalations_total",
+    "LLM calls retried with the stage's escalation model",
+    ["stage", "reason"]
+)
+
+# Exact technical entities (ports, error codes, versions, dotted keys, paths) a rewrite must keep
+ENTITY_PATTERN = re.compile(r"\b\d{2,5}\b|\b[A-Za-z]+[-_]\d+\b|\b\w+(?:\.\w+){2,}\b|/[\w\-./]+|\bv?\d+\.\d+(?:\.\d+)?\b")
+MARKDOWN_PATTERN = re.compile(r"```|^\s*([-*•]|\d+\.)\s|^#+\s|\*\*|https?://", re.MULTILINE)
+
+
+def _stage_env(prefix: str, stage_name: str) -> Optional[str]:
+    return os.getenv(f"{prefix}_{stage_name.upper()}") or None
+
+
+def stage_models(stage_name: str) -> Dict[str, Optional[str]]:
+    """{"model", "escalation", "base_url"} configured for a stage"""
+    return {
+        "model": _stage_env("LLM_MODEL", stage_name) or LLM_DEFAULT_MODEL,
+        "escalation": _stage_env("LLM_ESCALATION_MODEL", stage_name),
+        "base_url": _stage_env("LLM_BASE_URL", stage_name)
+    }
+
+
+def model_for(stage_name: str) -> str:
+    """Model used first for a stage"""
+    return stage_models(stage_name)["model"]
+
+
+def client_for(stage_name: str, client: ResilientAsyncClient) -> ResilientAsyncClient:
+    """The caller's client, or the pooled client for the stage's own endpoint when LLM_BASE_URL_<STAGE> is set"""
+    base_url = stage_models(stage_name)["base_url"]
+    if not base_url:
+        return client
+    api_key = _stage_env("LLM_API_KEY", stage_name) or client.raw.api_key
+    return get_async_client(api_key, base_url=base_url)
+
+
+def _content(response) -> str:
+    return (response.choices[0].message.content or "").strip()
+
+
+def check_not_empty(response) -> Optional[str]:
+    """Reason to escalate an empty answer, else None"""
+    return None if _content(response) else "empty"
+
+
+def router_check(user_query: str, tool_names, is_technical: Callable[[str], bool]) -> Callable:
+    """
+    Router validation: a tool call must name a known tool and carry a non-empty query;
+    a direct reply must not be empty, nor answer a question the local rules consider technical.
+    """
+    def check(response) -> Optional[str]:
+        message = response.choices[0].message
+        if message.tool_calls:
+            call = message.tool_calls[0]
+            if call.function.name not in tool_names:
+                return "unknown_tool"
+            try:
+                arguments = json.loads(call.function.arguments or "{}")
+            except ValueError:
+                return "bad_arguments"
+            if not isinstance(arguments, dict) or not str(arguments.get("query", "")).strip():
+                return "bad_arguments"
+            return None
+        if not (message.content or "").strip():
+            return "empty"
+        if is_technical(user_query):
+            return "missed_tool_call"
+        return None
+    return check
+
+
+def condense_check(question: str) -> Callable:
+    """Condense validation: a short standalone question that keeps the follow-up's exact entities"""
+    entities = set(ENTITY_PATTERN.findall(question))
+
+    def check(response) -> Optional[str]:
+        rewritten = _content(response)
+        if not rewritten:
+            return "empty"
+        if len(rewritten) > max(CONDENSE_MAX_CHARS, 2 * len(question)):
+            return "too_long"
+        if any(entity not in rewritten for entity in entities):
+            return "lost_entity"
+        return None
+    return check
+
+
+def check_avatar(response) -> Optional[str]:
+    """Avatar validation: plain speech (no markdown, code or URLs) of a speakable length"""
+    text = _content(response)
+    if not text:
+        return "empty"
+    if MARKDOWN_PATTERN.search(text):
+        return "markdown"
+    if len(text.split()) > AVATAR_MAX_WORDS:
+        return "too_long"
+    return None
+
+
+async def create_for_stage(
+    stage_name: str,
+    client: ResilientAsyncClient,
+    check: Optional[Callable[[Any], Optional[str]]] = None,
+    **kwargs
+):
+    """
+    chat.completions.create() with the stage's model (and endpoint).
+    With an escalation model configured, a failed call or a response for which check() returns a reason
+    is retried once with the escalation model; without one the first response is returned as is.
+    """
+    models = stage_models(stage_name)
+    escalation = models["escalation"] if models["escalation"] != models["model"] or models["base_url"] else None
+    try:
+        response = await client_for(stage_name, client).chat.completions.create(model=models["model"], **kwargs)
+    except (openai.APIError, LLMDeadlineExceeded) as e:
+        # An overloaded shared endpoint would not serve the escalation model either
+        if not escalation or (isinstance(e, OVERLOAD_ERRORS) and not models["base_url"]):
+            raise
+        reason = "error"
+        log(f"Stage {stage_name}: {models['model']} failed ({type(e).__name__}), escalating to {escalation}")
+    else:
+        reason = check(response) if check and escalation else None
+        if not reason:
+            return response
+        log(f"Stage {stage_name}: {models['model']} response failed validation ({reason}), escalating to {escalation}")
+    MODEL_ESCALATIONS.labels(stage_name, reason).inc()
+    return await client.chat.completions.create(model=escalation, **kwargs)
@@ -0,0 +1,138 @@
+"""
+Anonymized log of the standalone questions sent to retrieval, with frequencies.
+Questions are normalized (see answer_cache.normalize_question) and stripped of personal or secret
+values (emails, IPs, long numbers, IDs, tokens) before they are counted; no user or session is recorded.
+Counts are kept in memory and flushed to a local SQLite file; the most frequent recent questions are
+what the cache warm-up (warmup.py) replays after a deploy or restart.
+"""
+
+import os
+import re
+import time
+import sqlite3
+import asyncio
+import threading
+from typing import Dict, Any, List
+from answer_cache import split_mode_tag, normalize_question
+from tracing import register_stats
+
+# Configuration
+QUERY_LOG_ENABLED = os.getenv("QUERY_LOG_ENABLED", "true").lower() == "true"
+QUERY_LOG_DB_PATH = os.getenv("QUERY_LOG_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_log.db"))
+QUERY_LOG_FLUSH_INTERVAL_SECONDS = float(os.getenv("QUERY_LOG_FLUSH_INTERVAL_SECONDS", 30))
+QUERY_LOG_RETENTION_DAYS = int(os.getenv("QUERY_LOG_RETENTION_DAYS", 30))
+QUERY_LOG_MAX_CHARS = int(os.getenv("QUERY_LOG_MAX_CHARS", 300))
+
+# Replaced before a question is counted (order matters: emails before URLs/paths, UUIDs before numbers)
+REDACTIONS = [
+    (re.compile(r"[\w.+-]+@[\w-]+(\.[\w-]+)+"), "<email>"),
+    (re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b"), "<id>"),
+    (re.compile(r"\b\d{1,3}(\.\d{1,3}){3}\b"), "<ip>"),
+    (re.compile(r"\b(password|passwd|pwd|secret|token|api[_-]?key)\s*[:=]\s*\S+"), r"\1=<secret>"),
+    (re.compile(r"\b(?=[a-z0-9_-]*\d)(?=[a-z0-9_-]*[a-z])[a-z0-9_-]{20,}\b"), "<token>"),
+    (re.compile(r"\b\d{6,}\b"), "<number>"),
+]
+
+
+def anonymize(question: str) -> str:
+    """Normalized question with personal/secret values replaced by placeholders (a [MODE: ...] tag is kept)"""
+    mode, text = split_mode_tag(question)
+    text = normalize_question(text)[:QUERY_LOG_MAX_CHARS]
+    for pattern, replacement in REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return f"[MODE: {mode}] {text}" if mode and text else text
+
+
+class QueryLog:
+    """Question frequency counter with SQLite persistence"""
+
+    def __init__(self, db_path: str = QUERY_LOG_DB_PATH, enabled: bool = QUERY_LOG_ENABLED):
+        self.db_path = db_path
+        self.enabled = enabled
+        self._pending: Dict[str, List[float]] = {}  # question -> [count, last_seen] not yet flushed
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self.recorded = 0
+        if enabled:
+            self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_path, timeout=5)
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    def _init_db(self):
+        with self._db_lock, self._connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS query_log (
+                    question TEXT PRIMARY KEY,
+                    count INTEGER NOT NULL DEFAULT 0,
+                    last_seen REAL NOT NULL
+                ) WITHOUT ROWID
+            """)
+
+    def record(self, question: str):
+        """Count one standalone question sent to retrieval"""
+        if not self.enabled:
+            return
+        text = anonymize(question)
+        if not text:
+            return
+        with self._lock:
+            entry = self._pending.setdefault(text, [0, 0.0])
+            entry[0] += 1
+            entry[1] = time.time()
+            self.recorded += 1
+
+    def flush(self):
+        """Add pending counts to SQLite and drop questions not seen within the retention period"""
+        if not self.enabled:
+            return
+        with self._lock:
+            rows = [(question, int(count), last_seen) for question, (count, last_seen) in self._pending.items()]
+            self._pending.clear()
+        try:
+            with self._db_lock, self._connect() as connection:
+                if rows:
+                    connection.executemany("""
+                        INSERT INTO query_log (question, count, last_seen) VALUES (?, ?, ?)
+                        ON CONFLICT (question) DO UPDATE SET
+                            count = count + excluded.count,
+                            last_seen = MAX(last_seen, excluded.last_seen)
+                    """, rows)
+                connection.execute("DELETE FROM query_log WHERE last_seen < ?", (time.time() - QUERY_LOG_RETENTION_DAYS * 86400,))
+        except Exception as e:
+            print(f"Error saving query log: {e}")
+            with self._lock:
+                for question, count, last_seen in rows:
+                    entry = self._pending.setdefault(question, [0, 0.0])
+                    entry[0] += count
+                    entry[1] = max(entry[1], last_seen)
+
+    async def run_flusher(self, interval: float = QUERY_LOG_FLUSH_INTERVAL_SECONDS):
+        """Flush periodically off the event loop (started in the app lifespan)"""
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.flush)
+
+    def top(self, limit: int = 50, min_count: int = 1) -> List[Dict[str, Any]]:
+        """Most frequent questions of the retention period, [{"question", "count", "last_seen"}]"""
+        if not self.enabled:
+            return []
+        self.flush()
+        with self._db_lock, self._connect() as connection:
+            rows = connection.execute(
+                "SELECT question, count, last_seen FROM query_log WHERE count >= ? ORDER BY count DESC, last_seen DESC LIMIT ?",
+                (min_count, limit)
+            ).fetchall()
+        return [{"question": question, "count": count, "last_seen": last_seen} for question, count, last_seen in rows]
+
+    def stats(self) -> Dict[str, int]:
+        """Return recorded and unsaved question counts"""
+        with self._lock:
+            return {"recorded": self.recorded, "unsaved_questions": len(self._pending)}
+
+
+# Shared query log instance
+query_log = QueryLog()
+register_stats("query_log", query_log.stats)
@@ -0,0 +1,166 @@
+"""
+Retrieval result cache.
+Many turns condense to the same standalone question even when their final answers differ
+(answer modes, follow-ups), so MMR retrieval results are cached as chunk IDs and distances,
+keyed by the normalized question and the retrieval parameters. Entries are tagged with the
+vector store write generation, so any write makes older results unreachable.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List
+from answer_cache import split_mode_tag, normalize_question
+from vector_store import embeddings, mmr_search_with_scores, mmr_search_batch, get_chunks, get_generation, register_write_listener
+from tracing import register_stats
+
+# Configuration
+RETRIEVAL_CACHE_ENABLED = os.getenv("RETRIEVAL_CACHE_ENABLED", "true").lower() == "true"
+RETRIEVAL_CACHE_MAX_ENTRIES = int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", 2000))
+RETRIEVAL_CACHE_MAX_CHUNKS = int(os.getenv("RETRIEVAL_CACHE_MAX_CHUNKS", 5000))
+
+
+class RetrievalCache:
+    """LRU cache of (chunk IDs, distances) per (generation, question, k, fetch_k, lambda_mult)"""
+
+    def __init__(
+        self,
+        max_entries: int = RETRIEVAL_CACHE_MAX_ENTRIES,
+        max_chunks: int = RETRIEVAL_CACHE_MAX_CHUNKS,
+        enabled: bool = RETRIEVAL_CACHE_ENABLED
+    ):
+        self.max_entries = max_entries
+        self.max_chunks = max_chunks
+        self.enabled = enabled
+        self._entries: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        # Chunk documents shared by all entries (questions often retrieve overlapping chunks)
+        self._chunks: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def search_text(question: str) -> str:
+        """Question text used for retrieval: a leading [MODE: ...] tag only steers the answer format"""
+        return split_mode_tag(question)[1].strip()
+
+    def retrieve(self, question: str, k: int = 8, fetch_k: int = 24, lambda_mult: float = 0.5) -> List[Any]:
+        """MMR-retrieve the context documents for a standalone question, from the cache when possible"""
+        text = self.search_text(question)
+        if not self.enabled:
+            return mmr_search_with_scores(text, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult)[0]
+
+        generation = get_generation()
+        key = (generation, normalize_question(text), k, fetch_k, lambda_mult)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                documents = [self._chunks.get(chunk_id) for chunk_id in entry["ids"]]
+                if all(document is not None for document in documents):
+                    for chunk_id in entry["ids"]:
+                        self._chunks.move_to_end(chunk_id)
+                    self.hits += 1
+                    return documents
+
+        if entry is not None:
+            # Entry still valid but some of its chunks were evicted: fetch them by ID, no search needed
+            fetched = get_chunks(entry["ids"])
+            if len(fetched) == len(entry["ids"]):
+                with self._lock:
+                    self._remember_chunks(fetched)
+                    self.hits += 1
+                return [fetched[chunk_id] for chunk_id in entry["ids"]]
+
+        documents, ids, distances = mmr_search_with_scores(text, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult)
+        with self._lock:
+            self.misses += 1
+            if generation == get_generation():
+                self._entries[key] = {"ids": ids, "distances": distances}
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                self._remember_chunks(dict(zip(ids, documents)))
+        return documents
+
+    def retrieve_many(
+        self,
+        questions: List[str],
+        k: int = 8,
+        fetch_k: int = 24,
+        lambda_mult: float = 0.5,
+        query_embeddings: Dict[str, Any] = None
+    ) -> List[List[Any]]:
+        """
+        retrieve() for many questions: cached ones are served from the cache, the rest are searched
+        together (one embedding batch, one vector query). query_embeddings maps search text to a
+        precomputed embedding. Returns the documents per question, in order.
+        """
+        texts = [self.search_text(question) for question in questions]
+        generation = get_generation()
+        results: List[Any] = [None] * len(questions)
+        missing = []
+        for index, text in enumerate(texts):
+            key = (generation, normalize_question(text), k, fetch_k, lambda_mult)
+            with self._lock:
+                entry = self._entries.get(key) if self.enabled else None
+                if entry is not None:
+                    documents = [self._chunks.get(chunk_id) for chunk_id in entry["ids"]]
+                    if all(document is not None for document in documents):
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        results[index] = documents
+                        continue
+            missing.append(index)
+
+        # Identical search texts in the batch are searched once
+        unique_texts = list(dict.fromkeys(texts[index] for index in missing))
+        embeddings_batch = None
+        if query_embeddings:
+            # Texts without a precomputed embedding (e.g. empty ones) are embedded here
+            unembedded = [text for text in unique_texts if text not in query_embeddings]
+            extra = dict(zip(unembedded, embeddings.embed_documents(unembedded))) if unembedded else {}
+            embeddings_batch = [query_embeddings[text] if text in query_embeddings else extra[text] for text in unique_texts]
+        searched = dict(zip(unique_texts, mmr_search_batch(unique_texts, k, fetch_k, lambda_mult, embeddings_batch)))
+        with self._lock:
+            for text, (documents, ids, distances) in searched.items():
+                self.misses += 1
+                if self.enabled and generation == get_generation():
+                    self._entries[(generation, normalize_question(text), k, fetch_k, lambda_mult)] = {"ids": ids, "distances": distances}
+                    self._remember_chunks(dict(zip(ids, documents)))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        for index in missing:
+            results[index] = searched[texts[index]][0]
+        return results
+
+    def _remember_chunks(self, chunks: Dict[str, Any]):
+        """Add chunk documents to the shared LRU (caller holds the lock)"""
+        for chunk_id, document in chunks.items():
+            self._chunks[chunk_id] = document
+            self._chunks.move_to_end(chunk_id)
+        while len(self._chunks) > self.max_chunks:
+            self._chunks.popitem(last=False)
+
+    def invalidate(self, doc_id=None, action: str = None):
+        """Drop every entry (the write generation already makes them unreachable, this frees the memory)"""
+        with self._lock:
+            self._entries.clear()
+            if action == "delete":
+                self._chunks.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache size, hit/miss counters and the current write generation"""
+        return {
+            "entries": len(self._entries),
+            "chunks": len(self._chunks),
+            "hits": self.hits,
+            "misses": self.misses,
+            "generation": get_generation()
+        }
+
+
+# Shared cache instance, cleared on every vector store write
+retrieval_cache = RetrievalCache()
+register_write_listener(retrieval_cache.invalidate)
+register_stats("retrieval_cache", retrieval_cache.stats)
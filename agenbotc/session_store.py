@@ -0,0 +1,241 @@
+"""
+Server-side conversation session store.
+Keeps chat history per session ID (in-memory LRU with TTL, optionally persisted to local disk)
+and holds it under a token budget by rolling older turns into a running summary.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+
+# Configuration
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", 5000))
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", 24 * 3600))
+SESSION_STORE_DIR = os.getenv("SESSION_STORE_DIR")  # unset → memory only
+SESSION_HISTORY_TOKEN_BUDGET = int(os.getenv("SESSION_HISTORY_TOKEN_BUDGET", 1500))
+SESSION_KEEP_RECENT_TURNS = int(os.getenv("SESSION_KEEP_RECENT_TURNS", 2))
+SESSION_SUMMARY_KEY = "Conversation_summary"
+
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+_encoding = None
+_encoding_loaded = False
+
+
+def count_tokens(text: str) -> int:
+    """Token count of text (tiktoken when available, else ~4 characters per token)"""
+    global _encoding, _encoding_loaded
+    if not text:
+        return 0
+    if not _encoding_loaded:
+        # Loaded lazily: tiktoken may fetch its vocabulary file on first use
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = None
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+class SessionStore:
+    """LRU + TTL map of session ID -> {owner, summary, turns}, with optional JSON persistence"""
+
+    def __init__(
+        self,
+        max_sessions: int = SESSION_MAX_SESSIONS,
+        ttl_seconds: int = SESSION_TTL_SECONDS,
+        persist_dir: Optional[str] = SESSION_STORE_DIR,
+        token_budget: int = SESSION_HISTORY_TOKEN_BUDGET,
+        keep_recent_turns: int = SESSION_KEEP_RECENT_TURNS
+    ):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.persist_dir = persist_dir
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._tasks = set()
+        if self.persist_dir:
+            os.makedirs(self.persist_dir, exist_ok=True)
+
+    @staticmethod
+    def new_session_id() -> str:
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def is_valid_session_id(session_id: str) -> bool:
+        return bool(session_id and SESSION_ID_PATTERN.match(session_id))
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.persist_dir, f"{session_id}.json")
+
+    def _expired(self, session: Dict[str, Any], now: float) -> bool:
+        return now - session["updated_at"] > self.ttl_seconds
+
+    def _load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Load a persisted session from disk"""
+        if not self.persist_dir or not os.path.exists(self._path(session_id)):
+            return None
+        try:
+            with open(self._path(session_id), 'r') as f:
+                session = json.load(f)
+            session["turns"] = [tuple(turn) for turn in session.get("turns", [])]
+            return session
+        except Exception as e:
+            print(f"Error loading session {session_id}: {e}")
+            return None
+
+    def _persist(self, session: Dict[str, Any]):
+        """Atomically write a session to disk (write temp file, then rename)"""
+        if not self.persist_dir:
+            return
+        try:
+            data = {key: value for key, value in session.items() if not key.startswith("_")}
+            fd, temp_path = tempfile.mkstemp(dir=self.persist_dir, suffix=".tmp")
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(temp_path, self._path(session["id"]))
+        except Exception as e:
+            print(f"Error saving session {session['id']}: {e}")
+
+    def _remove_file(self, session_id: str):
+        if self.persist_dir and os.path.exists(self._path(session_id)):
+            try:
+                os.remove(self._path(session_id))
+            except OSError as e:
+                print(f"Error removing session file {session_id}: {e}")
+
+    def get(self, session_id: str, owner: str) -> Optional[Dict[str, Any]]:
+        """Return a live session owned by owner, or None"""
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._load(session_id)
+                if session is not None:
+                    self._sessions[session_id] = session
+            if session is None:
+                return None
+            if self._expired(session, now):
+                del self._sessions[session_id]
+                self._remove_file(session_id)
+                return None
+            if session["owner"] != owner:
+                return None
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def create(self, owner: str, session_id: str = None) -> Dict[str, Any]:
+        """Create a session (evicting the least recently used ones beyond max_sessions)"""
+        session_id = session_id or self.new_session_id()
+        now = time.time()
+        session = {"id": session_id, "owner": owner, "summary": "", "turns": [], "created_at": now, "updated_at": now}
+        with self._lock:
+            self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                # Evicted sessions stay on disk (if persisted) and are reloaded on demand
+                self._sessions.popitem(last=False)
+        self._persist(session)
+        return session
+
+    def get_or_create(self, session_id: str, owner: str) -> Optional[Dict[str, Any]]:
+        """Return the owner's session, creating it if unknown; None if the ID belongs to someone else"""
+        session = self.get(session_id, owner)
+        if session is not None:
+            return session
+        with self._lock:
+            existing = self._sessions.get(session_id) or self._load(session_id)
+        if existing is not None and existing["owner"] != owner and not self._expired(existing, time.time()):
+            return None
+        return self.create(owner, session_id)
+
+    def delete(self, session_id: str, owner: str) -> bool:
+        """Delete a session owned by owner"""
+        if self.get(session_id, owner) is None:
+            return False
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        self._remove_file(session_id)
+        return True
+
+    def history(self, session: Dict[str, Any]) -> Dict[str, str]:
+        """Session history in the /Agentchat history dict format, with the running summary first"""
+        history = {}
+        if session["summary"]:
+            history[SESSION_SUMMARY_KEY] = session["summary"]
+        for number, (question, answer) in enumerate(session["turns"], start=1):
+            history[f"User_message_{number}"] = question
+            history[f"AI_message_{number}"] = answer
+        return history
+
+    def append_turn(self, session: Dict[str, Any], question: str, answer: str):
+        """Record a completed question/answer turn"""
+        session["turns"].append((question, answer))
+        session["updated_at"] = time.time()
+        self._persist(session)
+
+    def history_tokens(self, session: Dict[str, Any]) -> int:
+        """Prompt tokens the session history currently costs"""
+        return count_tokens(session["summary"]) + sum(count_tokens(q) + count_tokens(a) for q, a in session["turns"])
+
+    def needs_compaction(self, session: Dict[str, Any]) -> bool:
+        return len(session["turns"]) > self.keep_recent_turns and self.history_tokens(session) > self.token_budget
+
+    async def compact(
+        self,
+        session: Dict[str, Any],
+        summarizer: Callable[[str, List[tuple]], Awaitable[str]]
+    ):
+        """
+        Roll the oldest turns into the running summary until the history fits the token budget
+        (the most recent keep_recent_turns turns are always kept verbatim).
+        summarizer(previous_summary, turns) returns the new summary; when it fails the history is
+        left uncompacted, to be retried after the next turn.
+        """
+        if session.get("_compacting") or not self.needs_compaction(session):
+            return
+        session["_compacting"] = True
+        try:
+            rolled = []
+            turns = list(session["turns"])
+            while len(turns) > self.keep_recent_turns:
+                rolled.append(turns.pop(0))
+                remaining = count_tokens(session["summary"]) + sum(count_tokens(q) + count_tokens(a) for q, a in turns)
+                if remaining <= self.token_budget * 0.6:
+                    break
+            try:
+                summary = await summarizer(session["summary"], rolled)
+            except Exception as e:
+                # Nothing is dropped: the history stays as it is and the next turn tries again
+                print(f"Error summarizing session {session['id']}, keeping its turns: {e}")
+                return
+            # Turns appended while summarizing are kept (only the rolled prefix is replaced)
+            session["turns"] = session["turns"][len(rolled):]
+            session["summary"] = summary
+            session["updated_at"] = time.time()
+            self._persist(session)
+        finally:
+            session.pop("_compacting", None)
+
+    def schedule_compaction(self, session: Dict[str, Any], summarizer):
+        """Compact in the background so the summary call never adds to response latency"""
+        if self.needs_compaction(session) and not session.get("_compacting"):
+            task = asyncio.create_task(self.compact(session, summarizer))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+
+# Shared store instance
+session_store = SessionStore()
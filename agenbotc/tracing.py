@@ -0,0 +1,182 @@
+"""
+Per-request tracing and Prometheus metrics for the chat pipeline.
+Each request gets a trace ID (taken from the X-Trace-Id / X-Request-ID header or generated),
+every pipeline stage (router, retrieval, condense, QA, finalizer, avatar, ...) records its latency,
+token usage and errors, and log lines are prefixed with the trace ID.
+"""
+
+import os
+import re
+import time
+import uuid
+import contextvars
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Callable, List
+from prometheus_client import Counter, Histogram, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import GaugeMetricFamily
+
+# Configuration
+TRACE_LOG_STAGES = os.getenv("TRACE_LOG_STAGES", "true").lower() == "true"  # one log line per finished stage
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+STAGE_LATENCY = Histogram(
+    "vega_stage_duration_seconds",
+    "Latency of chat pipeline stages",
+    ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+STAGE_ERRORS = Counter(
+    "vega_stage_errors_total",
+    "Chat pipeline stage failures",
+    ["stage", "error"]
+)
+LLM_TOKENS = Counter(
+    "vega_llm_tokens_total",
+    "LLM tokens used per pipeline stage",
+    ["stage", "model", "type"]
+)
+TIME_TO_FIRST_TOKEN = Histogram(
+    "vega_time_to_first_token_seconds",
+    "Time from the start of a streamed query to its first answer token",
+    buckets=LATENCY_BUCKETS
+)
+REQUEST_LATENCY = Histogram(
+    "vega_request_duration_seconds",
+    "HTTP request latency (until the response body is fully sent)",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+
+# Incoming trace IDs are echoed into logs, so only simple tokens are accepted
+TRACE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+_spans = contextvars.ContextVar("trace_spans", default=None)
+_current_stage = contextvars.ContextVar("trace_stage", default=None)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def start_trace(trace_id: str = None) -> str:
+    """Start a trace in the current context (one per request), returns its ID"""
+    if not trace_id or not TRACE_ID_PATTERN.match(trace_id):
+        trace_id = new_trace_id()
+    _trace_id.set(trace_id)
+    _spans.set([])
+    return trace_id
+
+
+def get_trace_id() -> Optional[str]:
+    return _trace_id.get()
+
+
+def current_stage() -> Optional[str]:
+    """Name of the innermost running stage (used to attribute LLM token usage)"""
+    return _current_stage.get()
+
+
+def log(message: str):
+    """print with the current trace ID prefixed"""
+    trace_id = _trace_id.get()
+    if not trace_id:
+        print(message)
+        return
+    # Keep the repo's leading blank lines before the prefix so it stays on the message line
+    text = message.lstrip("\n")
+    print(f"{message[:len(message) - len(text)]}[trace={trace_id}] {text}")
+
+
+def observe_stage(name: str, duration: float, error: Exception = None):
+    """Record a finished stage: latency histogram, error counter and the request's span list"""
+    STAGE_LATENCY.labels(name).observe(duration)
+    if error is not None:
+        STAGE_ERRORS.labels(name, type(error).__name__).inc()
+    spans = _spans.get()
+    if spans is not None:
+        spans.append((name, duration, error is not None))
+    if TRACE_LOG_STAGES:
+        log(f"stage={name} duration_ms={duration * 1000:.0f}" + (f" error={type(error).__name__}" if error is not None else ""))
+
+
+@contextmanager
+def stage(name: str):
+    """Time a pipeline stage (works around awaits; do not hold it across yields of an async generator)"""
+    token = _current_stage.set(name)
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        _current_stage.reset(token)
+        observe_stage(name, time.perf_counter() - start, error)
+
+
+def record_usage(usage, model: str, stage_name: str = None):
+    """Count prompt/completion tokens of an LLM response usage (object or dict) for a stage"""
+    if usage is None:
+        return
+    if not isinstance(usage, dict):
+        usage = {"prompt_tokens": getattr(usage, "prompt_tokens", 0), "completion_tokens": getattr(usage, "completion_tokens", 0)}
+    stage_name = stage_name or current_stage() or "unknown"
+    for kind in ("prompt", "completion"):
+        tokens = usage.get(f"{kind}_tokens") or 0
+        if tokens:
+            LLM_TOKENS.labels(stage_name, model or "unknown", kind).inc(tokens)
+
+
+def trace_spans() -> List[tuple]:
+    """Stages recorded so far in the current trace as (name, seconds, failed)"""
+    return list(_spans.get() or [])
+
+
+def format_spans(spans: List[tuple]) -> str:
+    """One-line stage breakdown for the request summary log"""
+    return " ".join(f"{name}={duration * 1000:.0f}ms" + ("!" if failed else "") for name, duration, failed in spans)
+
+
+class _StatsCollector:
+    """Exports registered stats() dicts (caches, single-flight, ...) as gauges"""
+
+    def __init__(self):
+        self.sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def collect(self):
+        for prefix, fn in list(self.sources.items()):
+            try:
+                stats = fn()
+            except Exception as e:
+                print(f"Error collecting {prefix} stats: {e}")
+                continue
+            for key, value in stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    gauge = GaugeMetricFamily(f"vega_{prefix}_{key}", f"{prefix} {key}")
+                    gauge.add_metric([], value)
+                    yield gauge
+
+
+_stats_collector = _StatsCollector()
+REGISTRY.register(_stats_collector)
+
+
+def register_stats(prefix: str, fn: Callable[[], Dict[str, Any]]):
+    """Expose the numeric values of fn() on /metrics as vega_<prefix>_<key> gauges"""
+    _stats_collector.sources[prefix] = fn
+
+
+def render_metrics():
+    """Prometheus text exposition of all metrics, returns (body, content_type)"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def finish_request(method: str, route: str, status: int, duration: float):
+    """Record a finished HTTP request and log its stage breakdown"""
+    REQUEST_LATENCY.labels(method, route, str(status)).observe(duration)
+    spans = trace_spans()
+    if spans:
+        log(f"request {method} {route} status={status} duration_ms={duration * 1000:.0f} stages: {format_spans(spans)}")
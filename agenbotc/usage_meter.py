@@ -0,0 +1,294 @@
+"""
+Per-user LLM token accounting and usage limits.
+Every LLM call's prompt/completion tokens are attributed to the authenticated user of the request
+and aggregated in hourly buckets. Each process buffers the tokens counted since its last flush and
+adds them to the shared SQLite rows, so several uvicorn workers sum up instead of overwriting each
+other; budgets are checked against the database totals (re-read by every flush, so admission never
+touches SQLite) plus the unflushed tokens.
+Per-user limits (requests per minute, tokens per rolling day, concurrent requests) are checked
+before the first LLM call of a chat request; defaults and per-role/per-user overrides come from
+the usage_limits section of config.yaml.
+"""
+
+import os
+import time
+import sqlite3
+import asyncio
+import threading
+import contextvars
+from collections import deque, defaultdict
+from typing import Optional, Dict, Any, List
+import yaml
+from prometheus_client import Counter
+from tracing import register_stats
+
+# Configuration
+USAGE_DB_PATH = os.getenv("USAGE_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "usage.db"))
+USAGE_FLUSH_INTERVAL_SECONDS = float(os.getenv("USAGE_FLUSH_INTERVAL_SECONDS", 10))
+USAGE_REQUESTS_PER_MINUTE = int(os.getenv("USAGE_REQUESTS_PER_MINUTE", 30))
+USAGE_TOKENS_PER_DAY = int(os.getenv("USAGE_TOKENS_PER_DAY", 500000))
+USAGE_MAX_CONCURRENT = int(os.getenv("USAGE_MAX_CONCURRENT", 4))
+UNATTRIBUTED_USER = "_system"  # LLM calls outside a user request (startup, maintenance)
+
+LIMIT_KEYS = ("requests_per_minute", "tokens_per_day", "max_concurrent")  # 0 → unlimited
+
+USAGE_REJECTIONS = Counter(
+    "vega_usage_rejections_total",
+    "Chat requests rejected by per-user usage limits",
+    ["reason"]
+)
+
+_current_user = contextvars.ContextVar("usage_user", default=None)
+_collectors = contextvars.ContextVar("usage_collectors", default=())
+
+
+class UsageLimitExceeded(Exception):
+    """Raised when a user is over one of their usage limits"""
+
+    def __init__(self, message: str, reason: str, retry_after: int = 60):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def set_user(username: Optional[str]):
+    """Attribute LLM calls made from the current context (request, and tasks it starts) to username"""
+    _current_user.set(username)
+
+
+def current_user() -> Optional[str]:
+    return _current_user.get()
+
+
+def collect_usage() -> List[int]:
+    """
+    Also total the LLM usage recorded from the current context (and tasks it starts) into the returned
+    [calls, prompt_tokens, completion_tokens], e.g. to bill a shared run to every caller (record_shared)
+    """
+    collected = [0, 0, 0]
+    _collectors.set(_collectors.get() + (collected,))
+    return collected
+
+
+def _load_limit_config() -> Dict[str, Any]:
+    """usage_limits section of config.yaml ({} when absent)"""
+    config_path = os.path.join(os.path.dirname(__file__), "..", "config.yaml")
+    try:
+        if os.path.exists(config_path):
+            with open(config_path, 'r') as f:
+                return (yaml.safe_load(f) or {}).get("usage_limits") or {}
+    except Exception as e:
+        print(f"Error loading usage limits from config.yaml: {e}")
+    return {}
+
+
+class UsageMeter:
+    """Hourly per-user token buckets with SQLite persistence, plus admission checks for chat requests"""
+
+    def __init__(self, db_path: str = USAGE_DB_PATH, limit_config: Dict[str, Any] = None):
+        self.db_path = db_path
+        self.limit_config = _load_limit_config() if limit_config is None else limit_config
+        # (username, hour) -> [calls, prompt_tokens, completion_tokens] counted since the last flush
+        self._pending: Dict[tuple, List[int]] = {}
+        self._flushing: Dict[tuple, List[int]] = {}  # being written by the running flush
+        self._saved: Dict[str, int] = {}  # username -> tokens of the last 24 hourly buckets in the database, as of the last flush
+        self._requests = defaultdict(deque)  # username -> admission timestamps of the last minute
+        self._in_flight = defaultdict(int)
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._init_db()
+        with self._db_lock:
+            self._saved = self._load_saved()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_path, timeout=5)
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    def _init_db(self):
+        with self._db_lock, self._connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS token_usage (
+                    username TEXT NOT NULL,
+                    hour INTEGER NOT NULL,
+                    calls INTEGER NOT NULL DEFAULT 0,
+                    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                    completion_tokens INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (username, hour)
+                ) WITHOUT ROWID
+            """)
+
+    @staticmethod
+    def _hour(timestamp: float) -> int:
+        return int(timestamp // 3600)
+
+    def limits_for(self, username: str, role: str = "user") -> Dict[str, int]:
+        """Effective limits: env defaults < config default < config role < config user"""
+        limits = {
+            "requests_per_minute": USAGE_REQUESTS_PER_MINUTE,
+            "tokens_per_day": USAGE_TOKENS_PER_DAY,
+            "max_concurrent": USAGE_MAX_CONCURRENT
+        }
+        config = self.limit_config
+        for overrides in (config.get("default"), (config.get("roles") or {}).get(role), (config.get("users") or {}).get(username)):
+            for key, value in (overrides or {}).items():
+                if key in LIMIT_KEYS:
+                    limits[key] = int(value)
+        return limits
+
+    def record(self, usage, model: str = None, username: str = None):
+        """Add one LLM call's token usage (response usage object or dict) to the current user's bucket"""
+        if usage is None:
+            return
+        if not isinstance(usage, dict):
+            usage = {"prompt_tokens": getattr(usage, "prompt_tokens", 0), "completion_tokens": getattr(usage, "completion_tokens", 0)}
+        self._add(username, [1, usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0])
+
+    def record_shared(self, collected: List[int], username: str = None):
+        """Bill usage totalled by collect_usage (a run shared with other callers) to the current user as well"""
+        if any(collected):
+            self._add(username, list(collected))
+
+    def _add(self, username: Optional[str], counts: List[int]):
+        username = username or _current_user.get() or UNATTRIBUTED_USER
+        key = (username, self._hour(time.time()))
+        with self._lock:
+            for bucket in (self._pending.setdefault(key, [0, 0, 0]), *_collectors.get()):
+                for index, value in enumerate(counts):
+                    bucket[index] += value
+
+    def _load_saved(self) -> Dict[str, int]:
+        """Per-user tokens of the current and previous 23 hourly buckets in the database (all workers)"""
+        try:
+            with self._connect() as connection:
+                rows = connection.execute(
+                    "SELECT username, SUM(prompt_tokens + completion_tokens) FROM token_usage WHERE hour >= ? GROUP BY username",
+                    (self._hour(time.time()) - 23,)
+                ).fetchall()
+        except Exception as e:
+            print(f"Error reading token usage: {e}")
+            return self._saved
+        return dict(rows)
+
+    def tokens_last_day(self, username: str) -> int:
+        """
+        Tokens used by a user in the current and previous 23 hourly buckets: the database totals as of the
+        last flush (all workers) plus this process's unflushed tokens. In memory only, so it is safe to call
+        on the event loop.
+        """
+        since = self._hour(time.time()) - 23
+        with self._lock:
+            unflushed = sum(
+                bucket[1] + bucket[2]
+                for buckets in (self._pending, self._flushing)
+                for (user, hour), bucket in buckets.items()
+                if user == username and hour >= since
+            )
+            return self._saved.get(username, 0) + unflushed
+
+    def admit(self, username: str, role: str = "user"):
+        """
+        Check a chat request against the user's limits before any LLM call and count it as in flight.
+        Raises UsageLimitExceeded; every admitted request must be paired with release(username).
+        """
+        limits = self.limits_for(username, role)
+        now = time.time()
+        with self._lock:
+            if limits["max_concurrent"] and self._in_flight[username] >= limits["max_concurrent"]:
+                self._reject("concurrency", f"Too many concurrent requests (limit {limits['max_concurrent']})", 1)
+            requests = self._requests[username]
+            while requests and now - requests[0] > 60:
+                requests.popleft()
+            if limits["requests_per_minute"] and len(requests) >= limits["requests_per_minute"]:
+                self._reject("rate", f"Rate limit of {limits['requests_per_minute']} requests per minute reached", int(60 - (now - requests[0])) + 1)
+        if limits["tokens_per_day"] and self.tokens_last_day(username) >= limits["tokens_per_day"]:
+            self._reject("tokens", f"Daily token budget of {limits['tokens_per_day']} tokens used up", 3600 - int(now % 3600))
+        with self._lock:
+            self._requests[username].append(now)
+            self._in_flight[username] += 1
+        set_user(username)
+
+    def _reject(self, reason: str, message: str, retry_after: int):
+        USAGE_REJECTIONS.labels(reason).inc()
+        raise UsageLimitExceeded(message, reason, retry_after)
+
+    def release(self, username: str):
+        """End an admitted request"""
+        with self._lock:
+            self._in_flight[username] = max(0, self._in_flight[username] - 1)
+
+    def flush(self):
+        """
+        Add the tokens counted since the last flush to the SQLite buckets (kept for the next flush on error)
+        and refresh the per-user daily totals the budget check reads
+        """
+        with self._db_lock:
+            with self._lock:
+                self._flushing, self._pending = self._pending, {}
+                rows = [(user, hour, *bucket) for (user, hour), bucket in self._flushing.items()]
+            try:
+                if rows:
+                    with self._connect() as connection:
+                        connection.executemany("""
+                            INSERT INTO token_usage (username, hour, calls, prompt_tokens, completion_tokens)
+                            VALUES (?, ?, ?, ?, ?)
+                            ON CONFLICT (username, hour) DO UPDATE SET
+                                calls = calls + excluded.calls,
+                                prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                                completion_tokens = completion_tokens + excluded.completion_tokens
+                        """, rows)
+            except Exception as e:
+                print(f"Error saving token usage: {e}")
+                with self._lock:
+                    for key, bucket in self._flushing.items():
+                        pending = self._pending.setdefault(key, [0, 0, 0])
+                        for index, value in enumerate(bucket):
+                            pending[index] += value
+            finally:
+                saved = self._load_saved()
+                # Swapped together, so the flushed tokens are counted exactly once
+                with self._lock:
+                    self._saved = saved
+                    self._flushing = {}
+
+    async def run_flusher(self, interval: float = USAGE_FLUSH_INTERVAL_SECONDS):
+        """Flush periodically off the event loop (started in the app lifespan)"""
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.flush)
+
+    def summary(self, hours: int = 24, username: str = None) -> List[Dict[str, Any]]:
+        """Per-user totals for the last `hours` hours, heaviest users first"""
+        self.flush()
+        since = self._hour(time.time()) - hours + 1
+        query = """
+            SELECT username, SUM(calls), SUM(prompt_tokens), SUM(completion_tokens)
+            FROM token_usage WHERE hour >= ?
+        """
+        params = [since]
+        if username:
+            query += " AND username = ?"
+            params.append(username)
+        query += " GROUP BY username ORDER BY SUM(prompt_tokens) + SUM(completion_tokens) DESC"
+        with self._connect() as connection:
+            rows = connection.execute(query, params).fetchall()
+        return [
+            {
+                "username": user,
+                "calls": calls,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+            for user, calls, prompt_tokens, completion_tokens in rows
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        """Return in-flight request and unsaved bucket counts"""
+        with self._lock:
+            return {"in_flight": sum(self._in_flight.values()), "unsaved_buckets": len(self._pending)}
+
+
+# Shared meter instance
+usage_meter = UsageMeter()
+register_stats("usage", usage_meter.stats)
@@ -0,0 +1,190 @@
+"""
+SQLite user store.
+Users are rows keyed by username, so logins and token checks are indexed lookups and every change
+(create, update, delete) is a single atomic statement instead of a rewrite of the whole users.json.
+last_login updates are buffered in memory (write-behind) and flushed in one transaction every
+USER_LOGIN_FLUSH_SECONDS; a flush never moves a newer last_login (written by another worker) back.
+On first start an empty database imports the existing users.json (the file is left untouched).
+
+Migrate explicitly (e.g. before switching several workers over):
+    python agenbotc/user_store.py --import users.json
+"""
+
+import os
+import json
+import sqlite3
+import asyncio
+import argparse
+import threading
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+
+# Configuration
+USERS_FILE = os.getenv("USERS_FILE", "users.json")  # legacy JSON store, imported into an empty database
+USERS_DB_PATH = os.getenv("USERS_DB_PATH", "users.db")
+USER_LOGIN_FLUSH_SECONDS = float(os.getenv("USER_LOGIN_FLUSH_SECONDS", 5))
+
+COLUMNS = ("username", "email", "role", "is_active", "created_at", "last_login", "hashed_password")
+DATETIME_COLUMNS = ("created_at", "last_login")
+
+
+def _to_row(user: Dict[str, Any]) -> tuple:
+    values = []
+    for column in COLUMNS:
+        value = user.get(column)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif column == "is_active":
+            value = 1 if value is None else int(bool(value))
+        values.append(value)
+    return tuple(values)
+
+
+def _from_row(row: tuple) -> Dict[str, Any]:
+    user = dict(zip(COLUMNS, row))
+    user["is_active"] = bool(user["is_active"])
+    for column in DATETIME_COLUMNS:
+        if user[column]:
+            user[column] = datetime.fromisoformat(user[column])
+    return user
+
+
+class SQLiteUserStore:
+    """Users table with atomic per-user writes and write-behind last_login updates"""
+
+    def __init__(self, db_path: str = USERS_DB_PATH):
+        self.db_path = db_path
+        self._pending_logins: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread (FastAPI runs sync endpoints in a thread pool)"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def _init_db(self):
+        with self._connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS users (
+                    username TEXT PRIMARY KEY,
+                    email TEXT,
+                    role TEXT NOT NULL DEFAULT 'user',
+                    is_active INTEGER NOT NULL DEFAULT 1,
+                    created_at TEXT,
+                    last_login TEXT,
+                    hashed_password TEXT NOT NULL
+                ) WITHOUT ROWID
+            """)
+
+    def count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def _with_pending_login(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            pending = self._pending_logins.get(user["username"])
+        if pending and (user["last_login"] is None or pending > user["last_login"]):
+            user["last_login"] = pending
+        return user
+
+    def get(self, username: str) -> Optional[Dict[str, Any]]:
+        """User fields by username, or None"""
+        row = self._connect().execute(f"SELECT {', '.join(COLUMNS)} FROM users WHERE username = ?", (username,)).fetchone()
+        return self._with_pending_login(_from_row(row)) if row else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        """All users, by username"""
+        rows = self._connect().execute(f"SELECT {', '.join(COLUMNS)} FROM users ORDER BY username").fetchall()
+        return [self._with_pending_login(_from_row(row)) for row in rows]
+
+    def insert(self, user: Dict[str, Any]) -> bool:
+        """Add a user, False when the username is taken"""
+        try:
+            with self._connect() as connection:
+                connection.execute(f"INSERT INTO users ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", _to_row(user))
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def update(self, username: str, fields: Dict[str, Any]) -> bool:
+        """Set the given columns of one user, False when the user does not exist"""
+        fields = {column: value for column, value in fields.items() if column in COLUMNS and column != "username"}
+        if not fields:
+            return self.get(username) is not None
+        row = dict(zip(COLUMNS, _to_row(fields)))
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._connect() as connection:
+            cursor = connection.execute(f"UPDATE users SET {assignments} WHERE username = ?", [row[column] for column in fields] + [username])
+        if "last_login" in fields:
+            with self._lock:
+                self._pending_logins.pop(username, None)
+        return cursor.rowcount > 0
+
+    def delete(self, username: str) -> bool:
+        """Remove a user, False when the user does not exist"""
+        with self._lock:
+            self._pending_logins.pop(username, None)
+        with self._connect() as connection:
+            cursor = connection.execute("DELETE FROM users WHERE username = ?", (username,))
+        return cursor.rowcount > 0
+
+    def record_login(self, username: str, when: datetime):
+        """Buffer a last_login update (written by the next flush)"""
+        with self._lock:
+            self._pending_logins[username] = when
+
+    def flush(self):
+        """Write buffered last_login updates in one transaction"""
+        with self._lock:
+            pending = self._pending_logins
+            self._pending_logins = {}
+        if not pending:
+            return
+        rows = [(when.isoformat(), username, when.isoformat()) for username, when in pending.items()]
+        try:
+            with self._connect() as connection:
+                connection.executemany(
+                    "UPDATE users SET last_login = ? WHERE username = ? AND (last_login IS NULL OR last_login < ?)", rows
+                )
+        except Exception as e:
+            print(f"Error saving last logins: {e}")
+            with self._lock:
+                for username, when in pending.items():
+                    self._pending_logins.setdefault(username, when)
+
+    async def run_flusher(self, interval: float = USER_LOGIN_FLUSH_SECONDS):
+        """Flush periodically off the event loop (started in the app lifespan)"""
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.flush)
+
+    def import_json(self, users_file: str = USERS_FILE) -> int:
+        """Import users from a users.json file (existing usernames are kept), returns the number imported"""
+        with open(users_file, "r") as f:
+            users_data = json.load(f)
+        rows = [_to_row({**user_data, "username": username}) for username, user_data in users_data.items()]
+        with self._connect() as connection:
+            before = connection.total_changes
+            connection.executemany(f"INSERT OR IGNORE INTO users ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+            return connection.total_changes - before
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of buffered last_login updates"""
+        with self._lock:
+            return {"pending_logins": len(self._pending_logins)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the SQLite user store")
+    parser.add_argument("--import", dest="import_file", metavar="USERS_JSON", help="Import users from a users.json file")
+    parser.add_argument("--db", default=USERS_DB_PATH, help="Database path (USERS_DB_PATH)")
+    args = parser.parse_args()
+    store = SQLiteUserStore(args.db)
+    if args.import_file:
+        print(f"Imported {store.import_json(args.import_file)} users from {args.import_file} into {args.db}")
+    print(f"{store.count()} users in {args.db}")
@@ -5,14 +5,17 @@ warnings.filterwarnings("ignore", message=".*HuggingFaceEmbeddings.*deprecated.*
 warnings.filterwarnings("ignore", message=".*Chroma.*deprecated.*")
 
 import os
+import numpy as np
+from langchain_core.documents import Document
 from langchain_community.vectorstores import Chroma
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
 from langchain_community.embeddings import HuggingFaceEmbeddings
 
 # Initialize embeddings model
 embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
 
 # Initialize or load vector store
-VECTOR_DB_PATH = os.path.join(os.path.dirname(__file__), "vectorstore")
+VECTOR_DB_PATH = os.getenv("VECTOR_DB_PATH", os.path.join(os.path.dirname(__file__), "vectorstore"))
 os.makedirs(VECTOR_DB_PATH, exist_ok=True)
 
 vector_store = Chroma(
@@ -20,11 +23,37 @@ vector_store = Chroma(
     embedding_function=embeddings
 )
 
+# Callbacks notified with (doc_id, action) after every write to the vector store,
+# so in-process caches built on top of it can drop stale entries.
+_write_listeners = []
+# Bumped on every write; results derived from the store are only valid for the generation they were computed in
+_generation = 0
+
+def register_write_listener(callback):
+    """Register a callback invoked as callback(doc_id, action) after vector store writes"""
+    _write_listeners.append(callback)
+
+def get_generation():
+    """Current write generation of the vector store"""
+    return _generation
+
+def _notify_write(doc_id, action):
+    """Bump the write generation and notify registered listeners that a document was added or deleted"""
+    global _generation
+    _generation += 1
+    for callback in _write_listeners:
+        try:
+            callback(doc_id, action)
+        except Exception as e:
+            print(f"Error in vector store write listener: {str(e)}")
+
 def add_to_vector_store(chunks, metadata=None):
     """Add text chunks to the vector store"""
-    metadatas = [metadata for _ in chunks] if metadata else None
+    # chunk_index keeps the chunk order within its document (used when assembling QA context)
+    metadatas = [{**metadata, "chunk_index": index} for index in range(len(chunks))] if metadata else None
     vector_store.add_texts(chunks, metadatas=metadatas)
     vector_store.persist()
+    _notify_write(metadata.get("doc_id") if metadata else None, "add")
     return len(chunks)
 
 def check_document_exists(doc_id):
@@ -40,6 +69,64 @@ def search_vector_store(query, k=4):
     results = vector_store.similarity_search(query, k=k)
     return results
 
+def _mmr_select(embedding, results, row, k, lambda_mult):
+    """MMR selection over one query's row of a collection.query() result, returns (documents, ids, distances)"""
+    if not results["ids"] or not results["ids"][row]:
+        return [], [], []
+    selected = set(maximal_marginal_relevance(
+        np.array(embedding, dtype=np.float32),
+        results["embeddings"][row],
+        k=k,
+        lambda_mult=lambda_mult
+    ))
+    documents, ids, distances = [], [], []
+    for i, chunk_id in enumerate(results["ids"][row]):
+        if i in selected:
+            documents.append(Document(page_content=results["documents"][row][i], metadata=results["metadatas"][row][i] or {}))
+            ids.append(chunk_id)
+            distances.append(float(results["distances"][row][i]))
+    return documents, ids, distances
+
+def mmr_search_with_scores(query, k=8, fetch_k=24, lambda_mult=0.5):
+    """
+    MMR search (same selection as vector_store.as_retriever(search_type="mmr")) that also returns
+    the chunk IDs and query distances (lower is closer) of the selected documents.
+    Returns (documents, ids, distances).
+    """
+    embedding = embeddings.embed_query(query)
+    results = vector_store._collection.query(
+        query_embeddings=[embedding],
+        n_results=fetch_k,
+        include=["metadatas", "documents", "distances", "embeddings"]
+    )
+    return _mmr_select(embedding, results, 0, k, lambda_mult)
+
+def mmr_search_batch(queries, k=8, fetch_k=24, lambda_mult=0.5, query_embeddings=None):
+    """
+    mmr_search_with_scores for many queries: one embedding batch and one collection query for all of them.
+    query_embeddings (same order as queries) skips the embedding step. Returns a list of (documents, ids, distances).
+    """
+    if not queries:
+        return []
+    if query_embeddings is None:
+        query_embeddings = embeddings.embed_documents(list(queries))
+    results = vector_store._collection.query(
+        query_embeddings=[list(embedding) for embedding in query_embeddings],
+        n_results=fetch_k,
+        include=["metadatas", "documents", "distances", "embeddings"]
+    )
+    return [_mmr_select(embedding, results, row, k, lambda_mult) for row, embedding in enumerate(query_embeddings)]
+
+def get_chunks(ids):
+    """Fetch chunk documents by ID (no embedding or similarity search), keyed by ID"""
+    if not ids:
+        return {}
+    results = vector_store._collection.get(ids=list(ids), include=["metadatas", "documents"])
+    return {
+        chunk_id: Document(page_content=results["documents"][i], metadata=results["metadatas"][i] or {})
+        for i, chunk_id in enumerate(results["ids"])
+    }
+
 def delete_from_vector_store(doc_id):
     """Delete all chunks/vectors associated with a document ID from the vector store"""
     try:
@@ -66,6 +153,7 @@ def delete_from_vector_store(doc_id):
             # Delete the documents
             collection.delete(ids=ids_to_delete)
             print(f"Deleted {len(ids_to_delete)} chunks for doc_id: {doc_id}")
+            _notify_write(doc_id, "delete")
             return True
         else:
             print(f"No chunks found to delete for doc_id: {doc_id}")
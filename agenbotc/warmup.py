@@ -0,0 +1,103 @@
+"""
+Cache warm-up after a deploy or restart.
+Replays the most frequent logged questions (query_log.py) through retrieval, which loads the embedding
+model and fills the retrieval cache, and optionally through the QA pipeline (answer_batch, background
+priority) to fill the answer cache. The startup run gates the readiness endpoint (/ready).
+"""
+
+import os
+import time
+import asyncio
+from typing import Dict, Any, Optional
+from query_log import query_log
+from retrieval_cache import retrieval_cache
+from intent_router import intent_router, INTENT_ROUTER_ENABLED
+from session_store import count_tokens
+from vector_store import embeddings
+from chatbot import RETRIEVAL_SEARCH_KWARGS
+from tracing import register_stats, log
+
+# Configuration
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", 50))
+WARMUP_MIN_COUNT = int(os.getenv("WARMUP_MIN_COUNT", 2))  # questions asked once are not replayed
+WARMUP_FULL_PIPELINE = os.getenv("WARMUP_FULL_PIPELINE", "false").lower() == "true"  # spends LLM tokens
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", 120))
+
+
+class CacheWarmer:
+    """Runs warm-ups and tracks whether the startup warm-up has finished"""
+
+    def __init__(self):
+        self.state = "pending" if WARMUP_ON_STARTUP else "ready"  # pending → warming → ready
+        self.last_result: Optional[Dict[str, Any]] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def _warm_retrieval(self, questions) -> int:
+        """Load the local models and retrieve the context of every question (runs in a worker thread)"""
+        if INTENT_ROUTER_ENABLED:
+            intent_router.warm_up()
+        count_tokens("warm up")
+        if not questions:
+            embeddings.embed_query("warm up")
+            return 0
+        documents = retrieval_cache.retrieve_many(questions, **RETRIEVAL_SEARCH_KWARGS)
+        return sum(len(docs) for docs in documents)
+
+    async def run(
+        self,
+        agent=None,
+        top_n: int = WARMUP_TOP_N,
+        full_pipeline: bool = WARMUP_FULL_PIPELINE,
+        min_count: int = WARMUP_MIN_COUNT
+    ) -> Dict[str, Any]:
+        """
+        Replay the top_n most frequent logged questions through retrieval (and through agent.answer_batch
+        when full_pipeline is set). Returns {"questions", "chunks", "answered", "seconds"}.
+        """
+        async with self._lock:
+            started = time.perf_counter()
+            questions = [entry["question"] for entry in await asyncio.to_thread(query_log.top, top_n, min_count)]
+            chunks = await asyncio.to_thread(self._warm_retrieval, questions)
+            answered = 0
+            if full_pipeline and agent is not None and questions:
+                batch = await agent.answer_batch(questions, priority="background")
+                answered = sum(1 for result in batch["results"] if not result.get("error"))
+            self.last_result = {
+                "questions": len(questions),
+                "chunks": chunks,
+                "answered": answered,
+                "seconds": time.perf_counter() - started
+            }
+            log(f"Cache warm-up: {len(questions)} questions, {chunks} chunks, {answered} answers in {self.last_result['seconds']:.2f}s")
+            return self.last_result
+
+    async def run_startup(self, agent=None, timeout: float = WARMUP_TIMEOUT_SECONDS):
+        """Startup warm-up (started in the app lifespan); the instance is ready when it ends, even on failure"""
+        self.state = "warming"
+        try:
+            await asyncio.wait_for(self.run(agent), timeout)
+        except asyncio.TimeoutError:
+            log(f"Cache warm-up did not finish within {timeout:.0f}s, continuing with partially warm caches")
+        except Exception as e:
+            log(f"Error during cache warm-up: {str(e)}")
+        finally:
+            self.state = "ready"
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the warm-up state and the size of the last run"""
+        result = self.last_result or {}
+        return {
+            "ready": int(self.ready),
+            "questions": result.get("questions", 0),
+            "seconds": result.get("seconds", 0.0)
+        }
+
+
+# Shared warmer instance
+cache_warmer = CacheWarmer()
+register_stats("warmup", cache_warmer.stats)
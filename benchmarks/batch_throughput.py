@@ -0,0 +1,105 @@
+"""
+Throughput of /Agentchat/batch compared with the same questions sent one by one to /Agentchat.
+
+Runs the app in-process against the in-process mock LLM server with a temporary vector store
+seeded by load_test.py. Answer and retrieval caches are cleared before each run so both sides
+do the full work.
+
+Usage:
+    python benchmarks/batch_throughput.py --questions 30 --latency-ms 400
+"""
+
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import contextlib
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_DIR, "agenbotc"))
+sys.path.append(os.path.join(ROOT_DIR, "benchmarks"))
+
+import httpx
+from mock_openai_server import MockSettings, create_app
+from load_test import QUESTIONS, ServerThread, free_port, seed_vector_store
+
+
+def clear_caches():
+    from answer_cache import answer_cache
+    from retrieval_cache import retrieval_cache
+    answer_cache.clear()
+    retrieval_cache.invalidate(action="delete")
+
+
+async def run(app, args) -> dict:
+    questions = [question for category in ("conceptual", "howto", "troubleshooting") for question in QUESTIONS[category]]
+    questions = (questions * (args.questions // len(questions) + 1))[:args.questions]
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=600) as client:
+        response = await client.post("/login", json={"username": args.username, "password": args.password})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        clear_caches()
+        start = time.perf_counter()
+        for question in questions:
+            await client.post("/Agentchat", json={"question": question, "avatar_mode": "none"}, headers=headers)
+        serial = time.perf_counter() - start
+
+        clear_caches()
+        start = time.perf_counter()
+        response = await client.post("/Agentchat/batch", json={"questions": questions, "concurrency": args.concurrency}, headers=headers)
+        batch = time.perf_counter() - start
+        return {"questions": len(questions), "serial": serial, "batch": batch, "timing": response.json()["timing"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare /Agentchat/batch with serial /Agentchat calls")
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=400, help="Mock LLM mean latency")
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--seed-documents", type=int, default=40)
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="Testingadminformvp")
+    args = parser.parse_args()
+
+    mock_port = free_port()
+    workdir = tempfile.mkdtemp(prefix="vega_batch_")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-mock")
+    os.environ["LLM_BASE_URL"] = f"http://127.0.0.1:{mock_port}/v1"
+    os.environ["VECTOR_DB_PATH"] = os.path.join(workdir, "vectorstore")
+    os.environ["USAGE_DB_PATH"] = os.path.join(workdir, "usage.db")
+    os.environ["QUERY_LOG_DB_PATH"] = os.path.join(workdir, "query_log.db")
+    # Users are imported from the project's users.json; logins record last_login in the temporary copy
+    os.environ["USERS_DB_PATH"] = os.path.join(workdir, "users.db")
+    os.environ["FILES_DB_PATH"] = os.path.join(workdir, "files.db")
+    os.chdir(ROOT_DIR)
+
+    mock_server = ServerThread(create_app(MockSettings(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=1)), mock_port)
+    mock_server.start()
+    mock_server.wait_started()
+    try:
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            import main as app_module
+            from usage_meter import usage_meter
+            usage_meter.limit_config = {"default": {"requests_per_minute": 0, "tokens_per_day": 0, "max_concurrent": 0}}
+            seed_vector_store(args.seed_documents)
+            result = asyncio.run(run(app_module.app, args))
+    finally:
+        mock_server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    timing = result["timing"]
+    print(f"{result['questions']} questions, mock LLM latency {args.latency_ms:.0f}ms, batch concurrency {args.concurrency}\n")
+    print(f"serial /Agentchat     {result['serial']:>8.2f}s  {result['questions'] / result['serial']:>6.2f} questions/s")
+    print(f"/Agentchat/batch      {result['batch']:>8.2f}s  {result['questions'] / result['batch']:>6.2f} questions/s"
+          f"  ({result['serial'] / result['batch']:.1f}x)")
+    print(f"  retrieval {timing['retrievalSeconds']:.2f}s, LLM {timing['llmSeconds']:.2f}s, "
+          f"{timing['uniqueQuestions']} unique questions, {timing['chunksRetrieved']} chunks ({timing['uniqueChunks']} unique)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+File catalog benchmark: the SQLite catalog (agenbotc/file_catalog.py) against the previous files.json
+store, which re-read and re-parsed the whole file on every call and rewrote it on every change.
+
+Both stores are seeded with the same records (spread over --users uploaders), then each operation
+behind the /files endpoints is timed: add a record, list one user's files, delete a record.
+
+Usage:
+    python benchmarks/file_catalog_bench.py --records 20000 --users 50 --ops 50
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_DIR, "agenbotc"))
+
+from file_catalog import SQLiteFileCatalog
+
+
+class JSONFileStore:
+    """files.json store as main.py used it (whole-file read per call, whole-file rewrite per change)"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _load(self):
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                return json.load(f)
+        return {}
+
+    def _save(self, files_data):
+        with open(self.path, "w") as f:
+            json.dump(files_data, f, indent=2, default=str)
+
+    def import_records(self, records):
+        self._save({record["id"]: record for record in records})
+
+    def add(self, record):
+        files_data = self._load()
+        files_data[record["id"]] = record
+        self._save(files_data)
+
+    def list_by_user(self, username):
+        user_files = [info for info in self._load().values() if info.get("uploadedBy") == username]
+        user_files.sort(key=lambda x: x.get("uploadDate", ""), reverse=True)
+        return user_files
+
+    def delete(self, file_id, username):
+        files_data = self._load()
+        if files_data.get(file_id, {}).get("uploadedBy") != username:
+            return False
+        del files_data[file_id]
+        self._save(files_data)
+        return True
+
+
+class CatalogStore(SQLiteFileCatalog):
+    def import_records(self, records):
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT INTO files (id, name, type, size, status, upload_date, last_modified, uploaded_by, url) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [tuple(record.values()) for record in records]
+            )
+
+
+def make_record(index: int, username: str, when: datetime) -> dict:
+    return {
+        "id": f"pdf_{index:012x}",
+        "name": f"document_{index}.pdf",
+        "type": "PDF",
+        "size": f"{random.uniform(0.05, 5):.2f} MB",
+        "status": "indexed",
+        "uploadDate": when.isoformat(),
+        "lastModified": when.isoformat(),
+        "uploadedBy": username,
+        "url": None
+    }
+
+
+def timed_ms(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def run(store, records, users, ops: int) -> dict:
+    store.import_records(records)
+    start = datetime(2025, 1, 1)
+    new_records = [make_record(len(records) + index, random.choice(users), start + timedelta(days=400, seconds=index)) for index in range(ops)]
+    add = [timed_ms(store.add, record) for record in new_records]
+    listing = [timed_ms(store.list_by_user, random.choice(users)) for _ in range(ops)]
+    delete = [timed_ms(store.delete, record["id"], record["uploadedBy"]) for record in new_records]
+    return {"add": add, "list": listing, "delete": delete}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the SQLite file catalog with the files.json store")
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--ops", type=int, default=50, help="Timed operations of each kind")
+    args = parser.parse_args()
+
+    random.seed(1)
+    users = [f"user{index}" for index in range(args.users)]
+    start = datetime(2025, 1, 1)
+    records = [make_record(index, random.choice(users), start + timedelta(seconds=index * 60)) for index in range(args.records)]
+
+    workdir = tempfile.mkdtemp(prefix="vega_files_")
+    try:
+        results = {
+            "files.json": run(JSONFileStore(os.path.join(workdir, "files.json")), records, users, args.ops),
+            "sqlite": run(CatalogStore(os.path.join(workdir, "files.db")), records, users, args.ops)
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.records} records, {args.users} uploaders, {args.ops} operations of each kind\n")
+    print(f"{'store':<12}{'add p50':>10}{'list p50':>10}{'delete p50':>12}{'add p95':>10}{'list p95':>10}{'delete p95':>12}")
+    for name, timings in results.items():
+        p50 = [statistics.median(timings[op]) for op in ("add", "list", "delete")]
+        p95 = [statistics.quantiles(timings[op], n=20)[-1] for op in ("add", "list", "delete")]
+        print(f"{name:<12}{p50[0]:>8.2f}ms{p50[1]:>8.2f}ms{p50[2]:>10.2f}ms{p95[0]:>8.2f}ms{p95[1]:>8.2f}ms{p95[2]:>10.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
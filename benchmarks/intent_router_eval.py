@@ -0,0 +1,166 @@
+"""
+Accuracy/latency evaluation of the local intent router (agenbotc/intent_router.py).
+
+Classifies a labelled set of casual and technical messages and reports, per layer (rules, embedding)
+and overall: coverage (messages decided locally, i.e. LLM routing calls skipped), accuracy of the
+local decisions, and classification latency. A margin sweep shows the coverage/accuracy trade-off
+of the embedding layer. With --llm the same set also goes through the LLM router call
+(OPENAI_API_KEY / LLM_BASE_URL) for a side-by-side accuracy and latency comparison.
+
+Usage:
+    python benchmarks/intent_router_eval.py
+    python benchmarks/intent_router_eval.py --llm
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import contextlib
+import statistics
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_DIR, "agenbotc"))
+os.environ.setdefault("OPENAI_API_KEY", "sk-mock")
+
+from intent_router import IntentRouter
+
+# Held-out messages (none of them are classifier examples), label: casual | technical
+EVAL_SET = [
+    ("hi", "casual"),
+    ("Hello!", "casual"),
+    ("hey there", "casual"),
+    ("good evening", "casual"),
+    ("thanks!", "casual"),
+    ("ok thanks", "casual"),
+    ("thank you very much", "casual"),
+    ("bye", "casual"),
+    ("see you", "casual"),
+    ("cool", "casual"),
+    ("got it", "casual"),
+    ("how are you?", "casual"),
+    ("what's your name?", "casual"),
+    ("who built you?", "casual"),
+    ("you're very helpful", "casual"),
+    ("that answer was great, appreciate it", "casual"),
+    ("can you tell me something fun?", "casual"),
+    ("good night, talk tomorrow", "casual"),
+    ("is anyone there?", "casual"),
+    ("what kind of things can you help me with?", "casual"),
+    ("haha nice", "casual"),
+    ("hope you're having a good day", "casual"),
+    ("how do I configure SAML SSO?", "technical"),
+    ("set up OIDC login for our portal", "technical"),
+    ("users get a 403 after login", "technical"),
+    ("how to enable MFA for admins", "technical"),
+    ("what is SCIM provisioning?", "technical"),
+    ("LDAP connection times out", "technical"),
+    ("rotate JWT signing keys", "technical"),
+    ("where is the keystore configured?", "technical"),
+    ("how do I upgrade to the latest version?", "technical"),
+    ("explain RBAC in Authenion", "technical"),
+    ("what is the default port?", "technical"),
+    ("redirect loop on the sign in page", "technical"),
+    ("how to change the session timeout", "technical"),
+    ("how do I import users from a CSV file?", "technical"),
+    ("can I federate with Okta?", "technical"),
+    ("why does single sign-on fail for some users?", "technical"),
+    ("how do I add a custom attribute to the user profile?", "technical"),
+    ("what does invalid_grant mean?", "technical"),
+    ("how to back up the database before migrating?", "technical"),
+    ("enable audit logging for admin actions", "technical"),
+    ("how do I whitelist a callback URL?", "technical"),
+    ("users are locked out after three attempts", "technical"),
+]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def evaluate(router: IntentRouter):
+    """Classify EVAL_SET, returns a list of (label, decision, seconds)"""
+    router.warm_up()
+    results = []
+    for message, label in EVAL_SET:
+        start = time.perf_counter()
+        decision = router.classify(message)
+        results.append((label, decision, time.perf_counter() - start))
+    return results
+
+
+def report(results, title: str):
+    decided = [(label, decision) for label, decision, _ in results if decision["intent"]]
+    correct = sum(1 for label, decision in decided if decision["intent"] == label)
+    coverage = len(decided) / len(results)
+    accuracy = correct / len(decided) if decided else 0.0
+    print(f"{title:<22}{len(decided):>5}/{len(results):<5}{coverage:>9.0%}{accuracy:>10.1%}"
+          f"{len(decided) - correct:>8}")
+
+
+def print_latency(results, source: str):
+    latencies = [seconds * 1000 for _, decision, seconds in results if decision["source"] == source]
+    if latencies:
+        print(f"  {source:<10} n={len(latencies):<4} p50={statistics.median(latencies):.2f}ms"
+              f"  p95={percentile(latencies, 0.95):.2f}ms  max={max(latencies):.2f}ms")
+
+
+async def evaluate_llm_router():
+    """Route EVAL_SET through the LLM router call, returns (accuracy, latencies)"""
+    from llm_agent import LLMAgent
+    agent = LLMAgent()
+    correct = 0
+    latencies = []
+    for message, label in EVAL_SET:
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            router_message = await agent._route(message, {})
+        latencies.append(time.perf_counter() - start)
+        intent = "technical" if router_message.tool_calls else "casual"
+        correct += intent == label
+    return correct / len(EVAL_SET), latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the local intent router against a labelled message set")
+    parser.add_argument("--llm", action="store_true", help="Also evaluate the LLM router call (needs an OpenAI-compatible endpoint)")
+    args = parser.parse_args()
+
+    # The embedding layer is measured here even while INTENT_EMBEDDING_ENABLED keeps it off in the app
+    router = IntentRouter(use_embeddings=True)
+    results = evaluate(router)
+    print(f"Local intent router on {len(EVAL_SET)} labelled messages\n")
+    print(f"{'layer':<22}{'decided':>11}{'coverage':>9}{'accuracy':>10}{'wrong':>8}")
+    report(results, "overall")
+    for source in ("rule", "embedding"):
+        report([r for r in results if r[1]["source"] == source], f"  {source}")
+    print("\nLatency per message:")
+    for source in ("rule", "embedding"):
+        print_latency(results, source)
+
+    print("\nEmbedding margin sweep (messages not decided by rules):")
+    print(f"{'margin':<22}{'decided':>11}{'coverage':>9}{'accuracy':>10}{'wrong':>8}")
+    undecided = [(message, label) for message, label in EVAL_SET if router.classify_rules(message) is None]
+    scores = [(label, router.classify_embedding(message)["score"]) for message, label in undecided]
+    for margin in (0.0, 0.04, 0.08, 0.12, 0.16, 0.2):
+        sweep = []
+        for label, score in scores:
+            intent = "technical" if score >= margin else "casual" if score <= -margin else None
+            sweep.append((label, {"intent": intent}, 0.0))
+        report(sweep, f"  {margin:.2f}" + (" (current)" if margin == router.margin else ""))
+
+    print("\nWrong local decisions:")
+    for (message, label), (_, decision, _) in zip(EVAL_SET, results):
+        if decision["intent"] and decision["intent"] != label:
+            print(f"  [{decision['source']}, {decision['score']:+.2f}] {message!r} → {decision['intent']} (expected {label})")
+
+    if args.llm:
+        accuracy, latencies = asyncio.run(evaluate_llm_router())
+        print(f"\nLLM router: accuracy {accuracy:.1%}, p50 {statistics.median(latencies) * 1000:.0f}ms,"
+              f" p95 {percentile(latencies, 0.95) * 1000:.0f}ms per routing call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+"""
+Offline load test of the full chat path.
+
+Runs the real FastAPI app (main.py) in-process on a local port, with the LLM pointed at the mock
+OpenAI server (benchmarks/mock_openai_server.py, also in-process) and a vector store seeded with
+synthetic Authenion/IAM articles in a temporary directory. Virtual users log in through /login and
+replay a weighted mix of greeting, conceptual, how-to and troubleshooting questions against
+/Agentchat and /Agentchat/stream at a fixed concurrency.
+
+Reports throughput, p50/p95/p99 latency per endpoint (and time to first byte for the stream),
+event-loop lag of the app's loop and the process RSS (app, mock and load generator share it).
+
+Usage:
+    python benchmarks/load_test.py --concurrency 20 --requests 400
+    python benchmarks/load_test.py --concurrency 50 --duration 60 --mix greeting=1,conceptual=2,howto=2,troubleshooting=1
+    python benchmarks/load_test.py --latency-file recorded_latencies.json --stream-ratio 0.5 --json report.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import contextlib
+import statistics
+from collections import defaultdict
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_DIR, "agenbotc"))
+sys.path.append(os.path.join(ROOT_DIR, "benchmarks"))
+
+import httpx
+import psutil
+import uvicorn
+from mock_openai_server import MockSettings, create_app, load_latency_samples
+
+QUESTIONS = {
+    "greeting": [
+        "hi",
+        "hello there",
+        "thanks!",
+        "good morning",
+        "ok thanks, bye",
+    ],
+    "conceptual": [
+        "what is SAML single sign-on?",
+        "explain the difference between RBAC and ABAC",
+        "what is SCIM provisioning used for?",
+        "how does OIDC token refresh work?",
+        "what are the benefits of multi-factor authentication?",
+    ],
+    "howto": [
+        "how do I configure SAML SSO with an external IdP?",
+        "how to enable MFA for all administrators",
+        "how do I connect Authenion to an LDAP directory?",
+        "how to change the session timeout",
+        "how do I rotate the token signing certificate?",
+    ],
+    "troubleshooting": [
+        "users get a redirect loop after login",
+        "LDAP bind fails with invalid credentials",
+        "the server returns 500 on startup after the upgrade",
+        "SAML response rejected with invalid signature error",
+        "OIDC login fails with invalid_grant",
+    ],
+}
+DEFAULT_MIX = "greeting=1,conceptual=3,howto=3,troubleshooting=3"
+FOLLOW_UP_HISTORY = {
+    "User_message_1": "We run Authenion 5.2 behind a load balancer",
+    "AI_message_1": "Thanks, how can I help with your Authenion 5.2 deployment?"
+}
+
+SEED_TOPICS = [
+    ("SAML single sign-on", "Admin Console > Federation > SAML", "sso.saml.enabled", 8443),
+    ("OpenID Connect", "Admin Console > Federation > OIDC", "oidc.client.refresh_token_ttl", 8443),
+    ("multi-factor authentication", "Admin Console > Security > MFA", "mfa.enforce_for_admins", 8080),
+    ("LDAP directory integration", "Admin Console > Directories > LDAP", "ldap.bind_dn", 1389),
+    ("session management", "Admin Console > Sessions", "session.timeout_minutes", 8080),
+    ("SCIM provisioning", "Admin Console > Provisioning > SCIM", "scim.bearer_token", 8443),
+    ("role-based access control", "Admin Console > Access > Roles", "rbac.default_role", 8080),
+    ("signing certificates", "Admin Console > Keys > Certificates", "jwt.signing_key_alias", 8443),
+]
+
+
+def seed_article(topic: str, path: str, key: str, port: int, variant: int) -> str:
+    """Synthetic KB article (overview, how-to and troubleshooting sections) for one topic"""
+    return (
+        f"{topic.title()} overview (revision {variant}). Authenion supports {topic} for enterprise identity and access management. "
+        f"It is configured from {path} and takes effect without downtime on port {port}. "
+        f"Typical use cases include central sign-in, consistent policies and audit trails across applications.\n\n"
+        f"How to configure {topic}. Prerequisites: an administrator account and access to {path}. "
+        f"Step 1: open {path}. Step 2: set {key} to the required value and save. "
+        f"Step 3: restart the Authenion service with bin/authenion restart. "
+        f"Verify: sign in with a test user and confirm the event is logged in logs/audit.log.\n\n"
+        f"Troubleshooting {topic}. If users see a redirect loop or error AUTH-{400 + variant % 100}, check that {key} matches "
+        f"the value on the identity provider, that system clocks are in sync and that port {port} is reachable. "
+        f"Invalid signature or invalid_grant errors usually mean an expired certificate: rotate it under Admin Console > Keys. "
+        f"LDAP bind failures with invalid credentials point to a wrong ldap.bind_dn or password.\n"
+    )
+
+
+def seed_vector_store(documents: int) -> int:
+    """Ingest synthetic articles into the (temporary) vector store, returns the number of chunks"""
+    from ingestion import chunk_text
+    from vector_store import add_to_vector_store
+    chunks = 0
+    for index in range(documents):
+        topic, path, key, port = SEED_TOPICS[index % len(SEED_TOPICS)]
+        text = seed_article(topic, path, key, port, index)
+        chunks += add_to_vector_store(chunk_text(text), {"doc_id": f"loadtest_{index:05d}", "source": f"loadtest/{topic}", "type": "text"})
+    return chunks
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ServerThread(threading.Thread):
+    """Runs a uvicorn server on its own event loop in a background thread"""
+
+    def __init__(self, app, port: int):
+        super().__init__(daemon=True)
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+        self.loop = asyncio.new_event_loop()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.server.serve())
+
+    def wait_started(self, timeout: float = 120):
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if not self.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("Server failed to start")
+            time.sleep(0.05)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.join(timeout=30)
+
+
+async def measure_loop_lag(samples: list, stop: threading.Event, interval: float = 0.05):
+    """Record how late the loop wakes up from a fixed sleep (runs on the app's event loop)"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+def sample_rss(samples: list, stop: threading.Event, interval: float = 0.5):
+    process = psutil.Process(os.getpid())
+    while not stop.is_set():
+        samples.append(process.memory_info().rss)
+        stop.wait(interval)
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for item in mix.split(","):
+        category, _, weight = item.partition("=")
+        if category.strip() not in QUESTIONS:
+            raise ValueError(f"Unknown question category: {category} (expected one of {list(QUESTIONS)})")
+        weights[category.strip()] = float(weight or 1)
+    return weights
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+class LoadGenerator:
+    """Virtual users replaying the question mix against the app, recording per-request results"""
+
+    def __init__(self, base_url: str, args):
+        self.base_url = base_url
+        self.args = args
+        self.weights = parse_mix(args.mix)
+        self.random = random.Random(args.seed)
+        self.results = []  # (endpoint, category, ok, seconds, first_byte_seconds)
+        self.started = 0
+        self.deadline = None
+
+    def _next_request(self):
+        """Reserve the next request slot, False when the run is complete"""
+        if self.args.duration:
+            return time.monotonic() < self.deadline
+        if self.started >= self.args.requests + self.args.warmup:
+            return False
+        self.started += 1
+        return True
+
+    async def _login(self, client: httpx.AsyncClient) -> dict:
+        start = time.perf_counter()
+        response = await client.post("/login", json={"username": self.args.username, "password": self.args.password})
+        self.results.append(("/login", "-", response.status_code == 200, time.perf_counter() - start, None))
+        response.raise_for_status()
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def _chat(self, client: httpx.AsyncClient, headers: dict, counted: bool):
+        category = self.random.choices(list(self.weights), weights=list(self.weights.values()))[0]
+        payload = {
+            "question": self.random.choice(QUESTIONS[category]),
+            "history": dict(FOLLOW_UP_HISTORY) if self.random.random() < self.args.history_ratio else {},
+            "avatar_mode": self.args.avatar_mode
+        }
+        stream = self.random.random() < self.args.stream_ratio
+        endpoint = "/Agentchat/stream" if stream else "/Agentchat"
+        start = time.perf_counter()
+        first_byte = None
+        ok = False
+        try:
+            if stream:
+                async with client.stream("POST", endpoint, json=payload, headers=headers) as response:
+                    body = []
+                    async for chunk in response.aiter_text():
+                        if first_byte is None:
+                            first_byte = time.perf_counter() - start
+                        body.append(chunk)
+                ok = response.status_code == 200 and "event: error" not in "".join(body)
+            else:
+                response = await client.post(endpoint, json=payload, headers=headers)
+                data = response.json() if response.status_code == 200 else {}
+                ok = response.status_code == 200 and data.get("status") != "error" \
+                    and not str(data.get("response", "")).startswith("Error processing query")
+        except httpx.HTTPError:
+            ok = False
+        if counted:
+            self.results.append((endpoint, category, ok, time.perf_counter() - start, first_byte))
+
+    async def _user(self, client: httpx.AsyncClient):
+        headers = await self._login(client)
+        while self._next_request():
+            await self._chat(client, headers, counted=self.started > self.args.warmup or bool(self.args.duration))
+
+    async def run(self) -> float:
+        """Run all virtual users, returns the elapsed seconds"""
+        limits = httpx.Limits(max_connections=self.args.concurrency, max_keepalive_connections=self.args.concurrency)
+        timeout = httpx.Timeout(self.args.timeout)
+        async with httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=timeout) as client:
+            start = time.perf_counter()
+            self.deadline = time.monotonic() + (self.args.duration or 0)
+            await asyncio.gather(*(self._user(client) for _ in range(self.args.concurrency)))
+            return time.perf_counter() - start
+
+
+def build_report(results, elapsed: float, lag_samples, rss_samples, rss_baseline: int) -> dict:
+    """Aggregate per-endpoint latency, throughput, loop lag and RSS"""
+    by_endpoint = defaultdict(list)
+    for result in results:
+        by_endpoint[result[0]].append(result)
+    endpoints = {}
+    for endpoint, rows in sorted(by_endpoint.items()):
+        latencies = [row[3] for row in rows]
+        first_bytes = [row[4] for row in rows if row[4] is not None]
+        endpoints[endpoint] = {
+            "requests": len(rows),
+            "errors": sum(1 for row in rows if not row[2]),
+            "throughput_rps": len(rows) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "mean_ms": statistics.mean(latencies) * 1000,
+            "ttfb_p50_ms": percentile(first_bytes, 0.50) * 1000 if first_bytes else None,
+            "ttfb_p95_ms": percentile(first_bytes, 0.95) * 1000 if first_bytes else None,
+        }
+    by_category = defaultdict(list)
+    for endpoint, category, ok, seconds, _ in results:
+        if endpoint != "/login":
+            by_category[category].append(seconds)
+    chat_requests = sum(len(rows) for endpoint, rows in by_endpoint.items() if endpoint != "/login")
+    return {
+        "elapsed_seconds": elapsed,
+        "chat_throughput_rps": chat_requests / elapsed if elapsed else 0.0,
+        "endpoints": endpoints,
+        "categories": {
+            category: {"requests": len(values), "p50_ms": percentile(values, 0.5) * 1000, "p95_ms": percentile(values, 0.95) * 1000}
+            for category, values in sorted(by_category.items())
+        },
+        "loop_lag_ms": {
+            "p50": percentile(lag_samples, 0.50) * 1000,
+            "p99": percentile(lag_samples, 0.99) * 1000,
+            "max": max(lag_samples, default=0.0) * 1000,
+        },
+        "rss_mb": {
+            "before_app": rss_baseline / 2 ** 20,
+            "start": (rss_samples[0] if rss_samples else 0) / 2 ** 20,
+            "peak": max(rss_samples, default=0) / 2 ** 20,
+            "end": (rss_samples[-1] if rss_samples else 0) / 2 ** 20,
+        },
+    }
+
+
+def print_report(report: dict, args):
+    print(f"\nLoad test: concurrency {args.concurrency}, mix {args.mix}, stream ratio {args.stream_ratio:.0%}, "
+          f"history ratio {args.history_ratio:.0%}, avatar {args.avatar_mode}")
+    print(f"Elapsed {report['elapsed_seconds']:.1f}s, chat throughput {report['chat_throughput_rps']:.1f} req/s\n")
+    print(f"{'endpoint':<20}{'requests':>9}{'errors':>8}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'ttfb p50':>10}{'ttfb p95':>10}")
+    for endpoint, row in report["endpoints"].items():
+        ttfb = (f"{row['ttfb_p50_ms']:>10.0f}{row['ttfb_p95_ms']:>10.0f}" if row["ttfb_p50_ms"] is not None else f"{'-':>10}{'-':>10}")
+        print(f"{endpoint:<20}{row['requests']:>9}{row['errors']:>8}{row['throughput_rps']:>8.1f}"
+              f"{row['p50_ms']:>9.0f}{row['p95_ms']:>9.0f}{row['p99_ms']:>9.0f}{ttfb}")
+    print(f"\n{'category':<20}{'requests':>9}{'p50 ms':>9}{'p95 ms':>9}")
+    for category, row in report["categories"].items():
+        print(f"{category:<20}{row['requests']:>9}{row['p50_ms']:>9.0f}{row['p95_ms']:>9.0f}")
+    lag = report["loop_lag_ms"]
+    rss = report["rss_mb"]
+    print(f"\nEvent-loop lag (app loop): p50 {lag['p50']:.1f}ms, p99 {lag['p99']:.1f}ms, max {lag['max']:.1f}ms")
+    print(f"Process RSS: {rss['before_app']:.0f}MB before the app, {rss['start']:.0f}MB at start, "
+          f"peak {rss['peak']:.0f}MB, end {rss['end']:.0f}MB (app, mock server and load generator)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the /Agentchat path in-process against the mock LLM server")
+    parser.add_argument("--concurrency", type=int, default=10, help="Virtual users sending requests back to back")
+    parser.add_argument("--requests", type=int, default=200, help="Measured chat requests (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=0, help="Run for this many seconds instead of a request count")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured chat requests before a --requests run")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Question category weights (default {DEFAULT_MIX})")
+    parser.add_argument("--stream-ratio", type=float, default=0.0, help="Fraction of requests sent to /Agentchat/stream")
+    parser.add_argument("--history-ratio", type=float, default=0.3, help="Fraction of follow-up requests (with chat history)")
+    parser.add_argument("--avatar-mode", default="inline", choices=("inline", "deferred", "none"))
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="Testingadminformvp")
+    parser.add_argument("--keep-usage-limits", action="store_true", help="Enforce the configured per-user usage limits")
+    parser.add_argument("--seed-documents", type=int, default=40, help="Synthetic articles ingested into the temporary vector store")
+    parser.add_argument("--latency-ms", type=float, default=400, help="Mock LLM mean latency")
+    parser.add_argument("--jitter-ms", type=float, default=100, help="Mock LLM latency standard deviation")
+    parser.add_argument("--token-delay-ms", type=float, default=15, help="Mock delay between streamed tokens")
+    parser.add_argument("--latency-file", default=None, help="Recorded mock latencies in ms (see mock_openai_server.py)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Mock HTTP 500 rate")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Mock HTTP 429 rate")
+    parser.add_argument("--timeout", type=float, default=120, help="Client timeout per request (seconds)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", default=None, help="Also write the report to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's request logging on stdout")
+    args = parser.parse_args()
+
+    rss_baseline = psutil.Process(os.getpid()).memory_info().rss
+    mock_port, app_port = free_port(), free_port()
+    workdir = tempfile.mkdtemp(prefix="vega_loadtest_")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-mock")
+    os.environ["LLM_BASE_URL"] = f"http://127.0.0.1:{mock_port}/v1"
+    os.environ["VECTOR_DB_PATH"] = os.path.join(workdir, "vectorstore")
+    os.environ["USAGE_DB_PATH"] = os.path.join(workdir, "usage.db")
+    os.environ["QUERY_LOG_DB_PATH"] = os.path.join(workdir, "query_log.db")
+    # Users are imported from the project's users.json; logins record last_login in the temporary copy
+    os.environ["USERS_DB_PATH"] = os.path.join(workdir, "users.db")
+    os.environ["FILES_DB_PATH"] = os.path.join(workdir, "files.db")
+    os.chdir(ROOT_DIR)  # users.json and config.yaml are read relative to the project root
+
+    settings = MockSettings(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        token_delay_ms=args.token_delay_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed,
+        latency_samples_ms=load_latency_samples(args.latency_file) if args.latency_file else None
+    )
+    mock_app = create_app(settings)
+    mock_server = ServerThread(mock_app, mock_port)
+    mock_server.start()
+    mock_server.wait_started()
+
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    with output:
+        import main as app_module
+        from usage_meter import usage_meter
+        if not args.keep_usage_limits:
+            usage_meter.limit_config = {"default": {"requests_per_minute": 0, "tokens_per_day": 0, "max_concurrent": 0}}
+        chunks = seed_vector_store(args.seed_documents)
+        app_server = ServerThread(app_module.app, app_port)
+        app_server.start()
+        app_server.wait_started()
+
+        stop = threading.Event()
+        lag_samples, rss_samples = [], []
+        lag_probe = asyncio.run_coroutine_threadsafe(measure_loop_lag(lag_samples, stop), app_server.loop)
+        rss_thread = threading.Thread(target=sample_rss, args=(rss_samples, stop), daemon=True)
+        rss_thread.start()
+        try:
+            generator = LoadGenerator(f"http://127.0.0.1:{app_port}", args)
+            elapsed = asyncio.run(generator.run())
+        finally:
+            stop.set()
+            lag_probe.result(timeout=5)
+            rss_thread.join()
+            app_server.stop()
+            mock_server.stop()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"Seeded {args.seed_documents} articles ({chunks} chunks), mock LLM served {mock_app.state.requests} calls")
+    report = build_report(generator.results, elapsed, lag_samples, rss_samples, rss_baseline)
+    print_report(report, args)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
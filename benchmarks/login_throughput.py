@@ -0,0 +1,167 @@
+"""
+Login throughput and its effect on concurrent /Agentchat latency.
+
+Runs the app in-process on a local port (mock LLM server, temporary seeded vector store and user
+database) and, for each password hashing mode, measures /Agentchat latency with chat traffic alone
+and then during a burst of concurrent /login requests:
+  - inline: bcrypt verification on the event loop (how /login worked before the hashing pool),
+  - pool: bcrypt on auth.password_hasher's bounded thread pool (PASSWORD_HASH_WORKERS).
+
+Usage:
+    python benchmarks/login_throughput.py --chat-users 8 --login-users 16 --duration 10
+"""
+
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import threading
+import contextlib
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_DIR, "agenbotc"))
+sys.path.append(os.path.join(ROOT_DIR, "benchmarks"))
+
+import httpx
+from mock_openai_server import MockSettings, create_app
+from load_test import QUESTIONS, ServerThread, free_port, seed_vector_store, measure_loop_lag, percentile
+
+
+class InlineHasher:
+    """bcrypt directly on the calling (event loop) thread"""
+
+    async def hash(self, password: str) -> str:
+        from auth import pwd_context
+        return pwd_context.hash(password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        from auth import pwd_context
+        return pwd_context.verify(plain_password, hashed_password)
+
+
+async def chat_user(client, headers, questions, offset, deadline, latencies):
+    index = offset
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        response = await client.post("/Agentchat", json={"question": questions[index % len(questions)], "avatar_mode": "none"}, headers=headers)
+        if response.status_code == 200:
+            latencies.append(time.perf_counter() - start)
+        index += 1
+
+
+async def login_user(client, credentials, deadline, latencies, failures):
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        response = await client.post("/login", json=credentials)
+        if response.status_code == 200:
+            latencies.append(time.perf_counter() - start)
+        else:
+            failures.append(response.status_code)
+
+
+async def run_phase(base_url: str, args, headers, login_users: int) -> dict:
+    """Chat traffic for args.duration seconds, with login_users concurrent login loops alongside"""
+    questions = [question for category in ("conceptual", "howto", "troubleshooting") for question in QUESTIONS[category]]
+    credentials = {"username": args.username, "password": args.password}
+    chat_latencies, login_latencies, login_failures = [], [], []
+    limits = httpx.Limits(max_connections=args.chat_users + login_users + 1)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        deadline = time.monotonic() + args.duration
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(chat_user(client, headers, questions, index, deadline, chat_latencies) for index in range(args.chat_users)),
+            *(login_user(client, credentials, deadline, login_latencies, login_failures) for _ in range(login_users))
+        )
+        elapsed = time.perf_counter() - started
+    return {
+        "chat_requests": len(chat_latencies),
+        "chat_p50": percentile(chat_latencies, 0.5),
+        "chat_p95": percentile(chat_latencies, 0.95),
+        "logins_per_second": len(login_latencies) / elapsed,
+        "login_p50": percentile(login_latencies, 0.5),
+        "login_p95": percentile(login_latencies, 0.95),
+        "login_failures": len(login_failures)
+    }
+
+
+async def login(base_url: str, args) -> dict:
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        response = await client.post("/login", json={"username": args.username, "password": args.password})
+        response.raise_for_status()
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure login throughput and its impact on /Agentchat latency")
+    parser.add_argument("--chat-users", type=int, default=8)
+    parser.add_argument("--login-users", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per phase")
+    parser.add_argument("--latency-ms", type=float, default=200, help="Mock LLM mean latency")
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--seed-documents", type=int, default=40)
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="Testingadminformvp")
+    args = parser.parse_args()
+
+    mock_port, app_port = free_port(), free_port()
+    workdir = tempfile.mkdtemp(prefix="vega_login_")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-mock")
+    os.environ["LLM_BASE_URL"] = f"http://127.0.0.1:{mock_port}/v1"
+    os.environ["VECTOR_DB_PATH"] = os.path.join(workdir, "vectorstore")
+    os.environ["USAGE_DB_PATH"] = os.path.join(workdir, "usage.db")
+    os.environ["QUERY_LOG_DB_PATH"] = os.path.join(workdir, "query_log.db")
+    os.environ["USERS_DB_PATH"] = os.path.join(workdir, "users.db")
+    os.environ["FILES_DB_PATH"] = os.path.join(workdir, "files.db")
+    os.chdir(ROOT_DIR)
+
+    mock_server = ServerThread(create_app(MockSettings(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=1)), mock_port)
+    mock_server.start()
+    mock_server.wait_started()
+    rows = []
+    try:
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            import main as app_module
+            import auth
+            from usage_meter import usage_meter
+            usage_meter.limit_config = {"default": {"requests_per_minute": 0, "tokens_per_day": 0, "max_concurrent": 0}}
+            seed_vector_store(args.seed_documents)
+            app_server = ServerThread(app_module.app, app_port)
+            app_server.start()
+            app_server.wait_started()
+            base_url = f"http://127.0.0.1:{app_port}"
+            pool_hasher = auth.password_hasher
+            try:
+                for mode, hasher in (("inline", InlineHasher()), ("pool", pool_hasher)):
+                    auth.password_hasher = hasher
+                    headers = asyncio.run(login(base_url, args))
+                    for phase, login_users in (("chat only", 0), ("with logins", args.login_users)):
+                        stop = threading.Event()
+                        lag_samples = []
+                        lag_probe = asyncio.run_coroutine_threadsafe(measure_loop_lag(lag_samples, stop), app_server.loop)
+                        result = asyncio.run(run_phase(base_url, args, headers, login_users))
+                        stop.set()
+                        lag_probe.result(timeout=5)
+                        rows.append({"mode": mode, "phase": phase, "max_lag": max(lag_samples, default=0.0), **result})
+            finally:
+                auth.password_hasher = pool_hasher
+                app_server.stop()
+    finally:
+        mock_server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.chat_users} chat users, {args.login_users} login users, {args.duration:.0f}s per phase, "
+          f"mock LLM latency {args.latency_ms:.0f}ms, {pool_hasher.workers} hashing workers\n")
+    print(f"{'mode':<8}{'phase':<13}{'chat req':>9}{'chat p50':>10}{'chat p95':>10}{'logins/s':>10}{'login p50':>11}{'login p95':>11}{'503s':>6}{'max lag':>9}")
+    for row in rows:
+        logins = row["phase"] != "chat only"
+        print(f"{row['mode']:<8}{row['phase']:<13}{row['chat_requests']:>9}{row['chat_p50'] * 1000:>8.0f}ms{row['chat_p95'] * 1000:>8.0f}ms"
+              + (f"{row['logins_per_second']:>10.1f}{row['login_p50'] * 1000:>9.0f}ms{row['login_p95'] * 1000:>9.0f}ms{row['login_failures']:>6}"
+                 if logins else f"{'-':>10}{'-':>11}{'-':>11}{'-':>6}")
+              + f"{row['max_lag'] * 1000:>7.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
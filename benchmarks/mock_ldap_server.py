@@ -0,0 +1,178 @@
+"""
+In-process LDAP stand-in for the LDAP authentication backend (agenbotc/ldap_backend.py).
+Builds an ldap3 MOCK_SYNC directory (people and groups under dc=example,dc=com) whose connections add
+configurable latency, and can simulate an outage or a directory slower than LDAP_RECEIVE_TIMEOUT_SECONDS.
+create_backend() returns an LDAPBackend wired to it, to use with UserManager(ldap=...).
+
+Run directly for a check of logins, caching, timeouts and circuit breaking:
+    python benchmarks/mock_ldap_server.py --latency-ms 20 --logins 200
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_DIR, "agenbotc"))
+
+from ldap3 import Server, Connection, MOCK_SYNC
+from ldap3.core.exceptions import LDAPSocketOpenError, LDAPResponseTimeoutError
+
+BASE_DN = "dc=example,dc=com"
+SERVICE_DN = "cn=vega-service,ou=services,dc=example,dc=com"
+SERVICE_PASSWORD = "service-password"
+ADMIN_GROUP = "cn=vega-admins,ou=groups,dc=example,dc=com"
+USER_GROUP = "cn=vega-users,ou=groups,dc=example,dc=com"
+DEFAULT_PEOPLE = {
+    # uid: (password, mail, groups)
+    "alice": ("alice-password", "alice@example.com", [ADMIN_GROUP, USER_GROUP]),
+    "bob": ("bob-password", "bob@example.com", [USER_GROUP]),
+    "carol": ("carol-password", "carol@example.com", []),
+    # Same name as the local admin account from config.yaml, which must keep its password and role
+    "admin": ("directory-admin-password", "admin@example.com", [USER_GROUP]),
+}
+
+
+class MockDirectory:
+    """ldap3 mock server with people/groups, latency and failure injection"""
+
+    def __init__(self, people: dict = None, latency_ms: float = 0, receive_timeout: float = None):
+        from ldap_backend import LDAP_RECEIVE_TIMEOUT_SECONDS
+        self.server = Server("mock-directory")
+        self.latency_ms = latency_ms
+        self.receive_timeout = LDAP_RECEIVE_TIMEOUT_SECONDS if receive_timeout is None else receive_timeout
+        self.down = False
+        self.operations = 0
+        self.connections_opened = 0
+        self.connection_class = self._make_connection_class()
+        self._populate(DEFAULT_PEOPLE if people is None else people)
+
+    def _make_connection_class(self):
+        directory = self
+
+        class MockConnection(Connection):
+            """Connection that sleeps like a remote directory and fails while it is down"""
+
+            def _delay(self):
+                directory.operations += 1
+                if directory.down:
+                    raise LDAPSocketOpenError("mock directory is down")
+                latency = directory.latency_ms / 1000
+                if latency > directory.receive_timeout:
+                    time.sleep(directory.receive_timeout)
+                    raise LDAPResponseTimeoutError("mock directory did not answer in time")
+                time.sleep(latency)
+
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                directory.connections_opened += 1
+
+            def bind(self, *args, **kwargs):  # rebind() goes through bind()
+                self._delay()
+                return super().bind(*args, **kwargs)
+
+            def search(self, *args, **kwargs):
+                self._delay()
+                return super().search(*args, **kwargs)
+
+        return MockConnection
+
+    def _populate(self, people: dict):
+        connection = Connection(self.server, client_strategy=MOCK_SYNC)
+        connection.strategy.add_entry(SERVICE_DN, {"objectClass": "person", "cn": "vega-service", "userPassword": SERVICE_PASSWORD})
+        for group in (ADMIN_GROUP, USER_GROUP):
+            members = [f"uid={uid},ou=people,{BASE_DN}" for uid, (_, _, groups) in people.items() if group in groups]
+            connection.strategy.add_entry(group, {"objectClass": "groupOfNames", "member": members or [""]})
+        for uid, (password, mail, groups) in people.items():
+            attributes = {"objectClass": "inetOrgPerson", "uid": uid, "mail": mail, "userPassword": password}
+            if groups:
+                attributes["isMemberOf"] = groups
+            connection.strategy.add_entry(f"uid={uid},ou=people,{BASE_DN}", attributes)
+
+    def config(self, **overrides) -> dict:
+        """ldap settings (as in config.yaml) pointing at this directory"""
+        return {
+            "bind_dn": SERVICE_DN,
+            "bind_password": SERVICE_PASSWORD,
+            "base_dn": BASE_DN,
+            "group_roles": {ADMIN_GROUP: "admin", USER_GROUP: "user"},
+            **overrides
+        }
+
+
+def create_backend(directory: MockDirectory, **config):
+    """LDAPBackend using the mock directory's connections"""
+    from ldap_backend import LDAPBackend
+    return LDAPBackend(directory.config(**config), server=directory.server, client_strategy=MOCK_SYNC, connection_class=directory.connection_class)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the LDAP backend against the in-process directory stand-in")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Directory latency per operation")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--receive-timeout", type=float, default=0.5, help="Simulated LDAP receive timeout (s)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="vega_ldap_")
+    os.environ["USERS_DB_PATH"] = os.path.join(workdir, "users.db")
+    from auth import UserManager, DIRECTORY_PASSWORD
+    directory = MockDirectory(latency_ms=args.latency_ms, receive_timeout=args.receive_timeout)
+    backend = create_backend(directory, failure_threshold=3, reset_seconds=1)
+    manager = UserManager(users_file=os.path.join(workdir, "users.json"), db_path=os.path.join(workdir, "directory_users.db"), ldap=backend)
+
+    print("Credentials")
+    credentials = (
+        ("alice", "alice-password"), ("bob", "bob-password"), ("bob", "wrong"), ("bob", ""), ("carol", "carol-password"),
+        ("nobody", "x"), ("admin", "directory-admin-password"), ("admin", "Testingadminformvp")
+    )
+    for username, password in credentials:
+        user = manager.authenticate_user(username, password)
+        print(f"  {username:<7} {'*' * len(password):<24} -> {f'ok, role {user.role}' if user else 'rejected'}")
+
+    operations = directory.operations
+    for _ in range(20):
+        manager.authenticate_user("nobody", "x")
+    print(f"  20 more logins of an unknown user: {directory.operations - operations} directory operations (not-found lookups are cached)")
+
+    bounded = create_backend(MockDirectory(), cache_max_entries=100)
+    for index in range(1000):
+        bounded.lookup_user(f"random-{index}")
+    stats = bounded.stats()
+    print(f"  1000 made-up usernames: {stats['cached_users']} cached (cache_max_entries 100), {stats['cache_evictions']} evicted")
+
+    latencies = []
+    for index in range(args.logins):
+        _, elapsed = timed(manager.authenticate_user, ("alice", "bob")[index % 2], ("alice-password", "bob-password")[index % 2])
+        latencies.append(elapsed)
+    stats = backend.stats()
+    print(f"\n{args.logins} logins at {args.latency_ms:.0f}ms directory latency: p50 {statistics.median(latencies):.1f}ms, "
+          f"max {max(latencies):.1f}ms; user cache {stats['cache_hits']} hits / {stats['cache_misses']} misses, "
+          f"{directory.connections_opened} connections opened")
+
+    backend.invalidate()
+    directory.latency_ms = args.receive_timeout * 1000 * 2
+    print(f"\nSlow directory (> {args.receive_timeout:.1f}s receive timeout), circuit opens after 3 failures:")
+    for attempt in range(5):
+        user, elapsed = timed(manager.authenticate_user, "bob", "bob-password")
+        print(f"  login {attempt + 1}: {'ok' if user else 'rejected'} in {elapsed:.0f}ms (circuit {backend.breaker.state})")
+    print(f"  local fallback for a directory user: {'ok' if user else 'rejected'} (password hash {DIRECTORY_PASSWORD!r})")
+
+    directory.latency_ms = args.latency_ms
+    time.sleep(backend.breaker.reset_seconds)
+    user, elapsed = timed(manager.authenticate_user, "bob", "bob-password")
+    print(f"\nDirectory recovered: trial login {'ok' if user else 'rejected'} in {elapsed:.0f}ms (circuit {backend.breaker.state})")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
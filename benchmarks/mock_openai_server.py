@@ -0,0 +1,212 @@
+"""
+Local OpenAI-compatible mock server for offline load testing of the chat path.
+Serves POST /v1/chat/completions (streaming and non-streaming) with configurable latency
+(gaussian, or sampled from recorded per-model latencies), server error rate and 429 rate;
+tool-enabled requests get a search_knowledge_base call.
+
+Usage:
+    python benchmarks/mock_openai_server.py --port 8100 --latency-ms 400 --jitter-ms 150 --error-rate 0.01
+    python benchmarks/mock_openai_server.py --port 8100 --latency-file recorded_latencies.json
+    LLM_BASE_URL=http://localhost:8100/v1 OPENAI_API_KEY=sk-mock python main.py
+"""
+
+import re
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+GREETING_PATTERN = re.compile(r"^\W*(hi|hello|hey|thanks|thank you|good (morning|afternoon|evening)|bye)\b", re.IGNORECASE)
+
+
+class MockSettings:
+    """Latency and failure behaviour of the mock server"""
+
+    def __init__(
+        self,
+        latency_ms: float = 400,
+        jitter_ms: float = 100,
+        token_delay_ms: float = 15,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after_seconds: float = 1,
+        seed: int = None,
+        model_latency_ms: dict = None,
+        latency_samples_ms: dict = None
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.token_delay_ms = token_delay_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after_seconds = retry_after_seconds
+        self.random = random.Random(seed)
+        self.model_latency_ms = model_latency_ms or {}  # per-model mean latency overrides (cascade testing)
+        # Recorded latencies in ms, {"default": [...], "<model>": [...]}, sampled instead of the gaussian
+        self.latency_samples_ms = latency_samples_ms or {}
+
+    def sample_latency(self, model: str = None) -> float:
+        """Latency before the response (or first token), in seconds"""
+        samples = self.latency_samples_ms.get(model) or self.latency_samples_ms.get("default")
+        if samples:
+            return self.random.choice(samples) / 1000
+        latency_ms = self.model_latency_ms.get(model, self.latency_ms)
+        return max(0.0, self.random.gauss(latency_ms, self.jitter_ms)) / 1000
+
+
+def load_latency_samples(path: str) -> dict:
+    """Read recorded latencies (ms) from JSON: a list (all models) or {"default": [...], "<model>": [...]}"""
+    with open(path, "r") as f:
+        samples = json.load(f)
+    if isinstance(samples, list):
+        samples = {"default": samples}
+    return {model: [float(ms) for ms in values] for model, values in samples.items()}
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text or "") // 4)
+
+
+def _last_user_content(messages) -> str:
+    """Content of the last user (or tool result) message"""
+    for message in reversed(messages):
+        if message.get("role") in ("user", "tool") and message.get("content"):
+            return message["content"]
+    return ""
+
+
+def _user_query(content: str) -> str:
+    """Extract the user query from the router prompt format 'Current User Query: ...; Chat History: ...'"""
+    match = re.search(r"Current User Query:\s*(.*?);\s*Chat History:", content, re.DOTALL)
+    return (match.group(1) if match else content).strip()
+
+
+def _answer_text(content: str) -> str:
+    question = " ".join(_user_query(content).split())[:80]
+    return (
+        f"Mock answer for: {question}. **Steps** 1. Open the Admin Console. "
+        "2. Update the configuration and save. **Verify** Sign in again and confirm the change."
+    )
+
+
+def create_app(settings: MockSettings = None) -> FastAPI:
+    """Build the mock server app (usable in-process with httpx.ASGITransport)"""
+    settings = settings or MockSettings()
+    app = FastAPI(title="Mock OpenAI API")
+    app.state.settings = settings
+    app.state.requests = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        messages = body.get("messages", [])
+        model = body.get("model", "gpt-4o-mini")
+        content = _last_user_content(messages)
+        prompt_tokens = sum(_estimate_tokens(str(m.get("content"))) for m in messages)
+
+        await asyncio.sleep(settings.sample_latency(model))
+
+        roll = settings.random.random()
+        if roll < settings.rate_limit_rate:
+            return JSONResponse(
+                status_code=429,
+                headers={"retry-after": str(settings.retry_after_seconds)},
+                content={"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error", "code": "rate_limit_exceeded"}}
+            )
+        if roll < settings.rate_limit_rate + settings.error_rate:
+            return JSONResponse(
+                status_code=500,
+                content={"error": {"message": "Internal server error (mock)", "type": "server_error", "code": None}}
+            )
+
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        tool_call = None
+        if body.get("tools") and not GREETING_PATTERN.match(_user_query(content)):
+            tool = body["tools"][0]["function"]
+            tool_call = {
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": tool["name"], "arguments": json.dumps({"query": _user_query(content), "limit": 5})}
+            }
+        text = None if tool_call else _answer_text(content)
+        completion_tokens = _estimate_tokens(text or tool_call["function"]["arguments"])
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+        if body.get("stream"):
+            async def stream():
+                def chunk(delta, finish_reason=None):
+                    data = {
+                        "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+                    }
+                    return f"data: {json.dumps(data)}\n\n"
+
+                yield chunk({"role": "assistant", "content": ""})
+                for word in (text or "").split(" "):
+                    yield chunk({"content": word + " "})
+                    await asyncio.sleep(settings.token_delay_ms / 1000)
+                yield chunk({}, "stop")
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    data = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model, "choices": [], "usage": usage}
+                    yield f"data: {json.dumps(data)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(stream(), media_type="text/event-stream")
+
+        message = {"role": "assistant", "content": text}
+        if tool_call:
+            message["tool_calls"] = [tool_call]
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_call else "stop"}],
+            "usage": usage
+        }
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model", "owned_by": "mock"}]}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible mock server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=400, help="Mean latency before the response/first token")
+    parser.add_argument("--jitter-ms", type=float, default=100, help="Standard deviation of the latency")
+    parser.add_argument("--token-delay-ms", type=float, default=15, help="Delay between streamed tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 429")
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=MS",
+                        help="Mean latency for one model (repeatable), e.g. --model-latency gpt-4.1-nano=150")
+    parser.add_argument("--latency-file", default=None,
+                        help="JSON file of recorded latencies in ms, sampled instead of --latency-ms/--jitter-ms")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    import uvicorn
+    settings = MockSettings(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        token_delay_ms=args.token_delay_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed,
+        model_latency_ms={model: float(ms) for model, ms in (item.split("=", 1) for item in args.model_latency)},
+        latency_samples_ms=load_latency_samples(args.latency_file) if args.latency_file else None
+    )
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Latency comparison of the "standard" and "fast" LLMAgent answer pipelines using a local mock LLM.
+
+Every mock model call waits a fixed round-trip latency and retrieval returns canned documents,
+so the difference between the modes is the number of sequential LLM calls per question.
+
+Usage:
+    python benchmarks/pipeline_latency.py --latency 0.4 --runs 10
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import contextlib
+import statistics
+from types import SimpleNamespace
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_DIR, "agenbotc"))
+os.environ.setdefault("OPENAI_API_KEY", "sk-mock")
+os.environ["ANSWER_CACHE_ENABLED"] = "false"
+# Every question goes through the LLM router, so both modes are compared on the same call sequence
+os.environ["INTENT_ROUTER_ENABLED"] = "false"
+# Benchmark questions must not end up in the warm-up query log
+os.environ["QUERY_LOG_ENABLED"] = "false"
+
+from langchain_core.documents import Document
+import chatbot
+from llm_agent import LLMAgent
+
+MOCK_DOCS = [
+    Document(
+        page_content="To enable SAML SSO, open Admin Console > Federation > SAML and upload the IdP metadata.",
+        metadata={"doc_id": "pdf_mock000001"}
+    ),
+    Document(
+        page_content="Set sso.saml.enabled=true in authenion.properties and restart the server on port 8443.",
+        metadata={"doc_id": "pdf_mock000002"}
+    ),
+]
+ROUTER_QUERY = "[MODE: HOWTO] How do I configure SAML SSO in Authenion?"
+HISTORY = {"User_message_1": "We use Authenion 5.2", "AI_message_1": "Great, how can I help with Authenion 5.2?"}
+
+
+class MockLLM:
+    """Counts calls and sleeps a fixed latency per call; mimics the OpenAI response objects"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if kwargs.get("tools"):
+            tool_call = SimpleNamespace(
+                id="call_mock",
+                type="function",
+                function=SimpleNamespace(
+                    name="search_knowledge_base",
+                    arguments=json.dumps({"query": ROUTER_QUERY, "limit": 5})
+                )
+            )
+            message = SimpleNamespace(content=None, tool_calls=[tool_call])
+        else:
+            message = SimpleNamespace(content="**Steps**\n1. Upload the IdP metadata.\n2. Enable sso.saml.enabled.", tool_calls=None)
+        usage = SimpleNamespace(prompt_tokens=0, completion_tokens=0)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+
+async def run_mode(mode: str, latency: float, runs: int, history: dict):
+    """Run one pipeline mode and return (latencies, calls per question)"""
+    mock = MockLLM(latency)
+    chatbot.retrieve_documents = lambda question: MOCK_DOCS
+
+    agent = LLMAgent(api_key="sk-mock", pipeline_mode=mode)
+    agent.client = mock
+
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        # The pipeline prints every response object, keep the report readable
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            await agent.process_query("how do I set up saml sso?", dict(history))
+        latencies.append(time.perf_counter() - start)
+    return latencies, mock.calls / runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare standard vs fast LLMAgent pipeline latency with a mock LLM")
+    parser.add_argument("--latency", type=float, default=0.4, help="Mock round-trip latency per LLM call (seconds)")
+    parser.add_argument("--runs", type=int, default=10, help="Questions per mode")
+    args = parser.parse_args()
+
+    print(f"Mock LLM latency: {args.latency:.2f}s per call, {args.runs} runs per mode\n")
+    print(f"{'scenario':<14}{'mode':<10}{'calls':>7}{'mean (s)':>11}{'p50 (s)':>10}{'max (s)':>10}")
+    for scenario, history in (("no history", {}), ("with history", HISTORY)):
+        results = {}
+        for mode in ("standard", "fast"):
+            latencies, calls = asyncio.run(run_mode(mode, args.latency, args.runs, history))
+            results[mode] = statistics.mean(latencies)
+            print(f"{scenario:<14}{mode:<10}{calls:>7.1f}{statistics.mean(latencies):>11.3f}"
+                  f"{statistics.median(latencies):>10.3f}{max(latencies):>10.3f}")
+        saved = 1 - results["fast"] / results["standard"]
+        print(f"{'':<14}{'fast saves':<10}{'':>7}{saved:>10.0%}\n")
+
+
+if __name__ == "__main__":
+    main()
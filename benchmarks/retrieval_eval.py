@@ -0,0 +1,298 @@
+"""
+Retrieval quality and latency evaluation.
+
+Runs a labelled set of questions (expected source documents and/or answer snippets) through the
+retriever used by chatbot.py (MMR with RETRIEVAL_SEARCH_KWARGS, then context assembly under
+CONTEXT_TOKEN_BUDGET) and through search_vector_store (plain similarity), for every combination of
+the given parameters, and reports per configuration:
+  - recall@k: share of the expected items (snippets, or documents when no snippets are given) found
+    in the retrieved chunks, averaged over questions,
+  - MRR: mean reciprocal rank of the first relevant chunk,
+  - context tokens before and after assemble_context(), and the recall left after it (grounding
+    that survived merging and trimming),
+  - per-query retrieval latency (query embedding + vector search + MMR) p50/p95.
+
+Without --corpus/--synthetic the configured vector store (VECTOR_DB_PATH) is evaluated as is, so only
+the retrieval parameters can vary. With --corpus (a directory of .txt/.md/.pdf/.docx/.pptx files, doc
+IDs are the relative file paths) or --synthetic (the load-test articles) a temporary store is built for
+every chunk size / overlap / embedding model combination.
+
+Dataset (JSON list or JSONL), one object per question:
+    {"question": "...", "doc_ids": ["guides/saml.pdf"], "texts": ["sso.saml.enabled"]}
+"doc_ids" and "texts" are both optional (at least one is needed). A chunk is relevant when it comes
+from one of doc_ids (if given) and contains one of texts (if given).
+
+Usage:
+    python benchmarks/retrieval_eval.py --synthetic --k 4,8 --lambda 0.3,0.5,1.0 --chunk-size 500,1000
+    python benchmarks/retrieval_eval.py --dataset eval.jsonl --search mmr,similarity --budget 1000,1500
+    python benchmarks/retrieval_eval.py --dataset eval.jsonl --corpus docs/ --embedding-model all-MiniLM-L6-v2,BAAI/bge-small-en-v1.5
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import itertools
+import contextlib
+import statistics
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_DIR, "agenbotc"))
+sys.path.append(os.path.join(ROOT_DIR, "benchmarks"))
+os.environ.setdefault("OPENAI_API_KEY", "sk-mock")
+
+CORPUS_EXTENSIONS = (".txt", ".md", ".pdf", ".docx", ".pptx")
+
+
+def load_dataset(path: str) -> list:
+    """Labelled questions from a JSON list or a JSONL file"""
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read().strip()
+    items = json.loads(content) if content.startswith("[") else [json.loads(line) for line in content.splitlines() if line.strip()]
+    dataset = []
+    for item in items:
+        entry = {"question": item["question"], "doc_ids": list(item.get("doc_ids") or []), "texts": list(item.get("texts") or [])}
+        if not entry["doc_ids"] and not entry["texts"]:
+            raise ValueError(f"No doc_ids or texts for question: {entry['question']}")
+        dataset.append(entry)
+    return dataset
+
+
+def synthetic_corpus(variants: int) -> dict:
+    """The load-test KB articles, `variants` revisions per topic: {doc_id: text}"""
+    from load_test import SEED_TOPICS, seed_article
+    corpus = {}
+    for variant in range(variants):
+        for topic, path, key, port in SEED_TOPICS:
+            corpus[f"{key.split('.')[0]}_{variant}"] = seed_article(topic, path, key, port, variant)
+    return corpus
+
+
+def synthetic_dataset(variants: int) -> list:
+    """Three questions per load-test topic, labelled with the topic's articles and the snippet answering them"""
+    from load_test import SEED_TOPICS
+    dataset = []
+    for topic, path, key, port in SEED_TOPICS:
+        doc_ids = [f"{key.split('.')[0]}_{variant}" for variant in range(variants)]
+        dataset.append({"question": f"How do I configure {topic}?", "doc_ids": doc_ids, "texts": [f"set {key}"]})
+        dataset.append({"question": f"Where in the admin console is {topic} set up?", "doc_ids": doc_ids, "texts": [path]})
+        dataset.append({"question": f"Users hit a redirect loop after enabling {topic}, what should I check?", "doc_ids": doc_ids, "texts": [f"check that {key} matches"]})
+    return dataset
+
+
+def read_corpus(directory: str) -> dict:
+    """Text of every supported file under directory: {relative path: text}"""
+    from ingestion import extract_text_from_pdf, extract_text_from_docx, extract_text_from_ppt
+    extractors = {".pdf": extract_text_from_pdf, ".docx": extract_text_from_docx, ".pptx": extract_text_from_ppt}
+    corpus = {}
+    for folder, _, files in os.walk(directory):
+        for name in sorted(files):
+            extension = os.path.splitext(name)[1].lower()
+            if extension not in CORPUS_EXTENSIONS:
+                continue
+            path = os.path.join(folder, name)
+            if extension in extractors:
+                with contextlib.redirect_stdout(open(os.devnull, "w")):
+                    text = extractors[extension](path)
+            else:
+                with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                    text = f.read()
+            if text and text.strip():
+                corpus[os.path.relpath(path, directory)] = text
+    return corpus
+
+
+def build_store(corpus: dict, embedding_model: str, chunk_size: int, chunk_overlap: int, directory: str):
+    """Chunk and embed the corpus into a new Chroma store, returns (store, embeddings, chunk count)"""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from langchain_community.vectorstores import Chroma
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    embeddings = HuggingFaceEmbeddings(model_name=embedding_model)
+    store = Chroma(collection_name="retrieval_eval", persist_directory=directory, embedding_function=embeddings)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=len)
+    chunks = 0
+    for doc_id, text in corpus.items():
+        texts = splitter.split_text(text)
+        store.add_texts(texts, metadatas=[{"doc_id": doc_id, "source": doc_id, "chunk_index": index} for index in range(len(texts))])
+        chunks += len(texts)
+    return store, embeddings, chunks
+
+
+@contextlib.contextmanager
+def use_store(store, embeddings):
+    """Point vector_store.py's search functions at another store and embedding model"""
+    import vector_store as vector_store_module
+    saved = vector_store_module.vector_store, vector_store_module.embeddings
+    vector_store_module.vector_store, vector_store_module.embeddings = store, embeddings
+    try:
+        yield
+    finally:
+        vector_store_module.vector_store, vector_store_module.embeddings = saved
+
+
+def _relevant(document, item: dict) -> bool:
+    doc_id = (document.metadata or {}).get("doc_id")
+    if item["doc_ids"] and doc_id not in item["doc_ids"]:
+        return False
+    return not item["texts"] or any(text in document.page_content for text in item["texts"])
+
+
+def _recall(documents, item: dict) -> float:
+    """Share of the expected snippets (or documents, when no snippets are labelled) found in documents"""
+    relevant = [document for document in documents if _relevant(document, item)]
+    if item["texts"]:
+        return sum(any(text in document.page_content for document in relevant) for text in item["texts"]) / len(item["texts"])
+    found = {(document.metadata or {}).get("doc_id") for document in relevant}
+    return len(found & set(item["doc_ids"])) / len(item["doc_ids"])
+
+
+def _reciprocal_rank(documents, item: dict) -> float:
+    for rank, document in enumerate(documents, start=1):
+        if _relevant(document, item):
+            return 1 / rank
+    return 0.0
+
+
+def _percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def search_configs(args) -> list:
+    """Retrieval parameter combinations (similarity search ignores fetch_k and lambda_mult)"""
+    configs = []
+    for search, k, fetch_k, lambda_mult, budget in itertools.product(args.search, args.k, args.fetch_k, args.lambda_mult, args.budget):
+        if search == "similarity":
+            config = {"search": search, "k": k, "fetch_k": None, "lambda_mult": None, "budget": budget}
+        else:
+            config = {"search": search, "k": k, "fetch_k": max(fetch_k, k), "lambda_mult": lambda_mult, "budget": budget}
+        if config not in configs:
+            configs.append(config)
+    return configs
+
+
+def evaluate(dataset: list, config: dict) -> dict:
+    """Retrieve and assemble the context for every question with one configuration, returns the aggregated metrics"""
+    from vector_store import mmr_search_with_scores, search_vector_store
+    from context_builder import assemble_context
+
+    def retrieve(question):
+        if config["search"] == "similarity":
+            return search_vector_store(question, k=config["k"])
+        return mmr_search_with_scores(question, k=config["k"], fetch_k=config["fetch_k"], lambda_mult=config["lambda_mult"])[0]
+
+    retrieve(dataset[0]["question"])  # Warm-up: first query loads the index
+    recalls, context_recalls, reciprocal_ranks, latencies, tokens_before, tokens_after = [], [], [], [], [], []
+    for item in dataset:
+        start = time.perf_counter()
+        documents = retrieve(item["question"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            passages, stats = assemble_context(item["question"], documents, token_budget=config["budget"])
+        recalls.append(_recall(documents, item))
+        context_recalls.append(_recall(passages, item))
+        reciprocal_ranks.append(_reciprocal_rank(documents, item))
+        tokens_before.append(stats["tokens_before"])
+        tokens_after.append(stats["tokens_after"])
+    return {
+        "recall": statistics.mean(recalls),
+        "mrr": statistics.mean(reciprocal_ranks),
+        "context_recall": statistics.mean(context_recalls),
+        "tokens_before": statistics.mean(tokens_before),
+        "tokens_after": statistics.mean(tokens_after),
+        "p50_ms": _percentile(latencies, 0.5),
+        "p95_ms": _percentile(latencies, 0.95)
+    }
+
+
+def _int_list(value: str) -> list:
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def _float_list(value: str) -> list:
+    return [float(part) for part in value.split(",") if part.strip()]
+
+
+def _str_list(value: str) -> list:
+    return [part.strip() for part in value.split(",") if part.strip()]
+
+
+def print_report(rows: list, baseline: dict, questions: int):
+    print(f"{questions} questions; * = configuration used by chatbot.py\n")
+    print(f"  {'embedding model':<24} {'chunk':>9} {'search':<10} {'k':>3} {'fetch':>5} {'λ':>4} {'budget':>6}"
+          f" {'recall@k':>8} {'MRR':>5} {'ctx rec':>7} {'tok in':>7} {'tok out':>7} {'p50 ms':>7} {'p95 ms':>7}")
+    for row in rows:
+        chunk = f"{row['chunk_size']}/{row['chunk_overlap']}" if row["chunk_size"] else "store"
+        marker = "*" if all(row.get(key) == value for key, value in baseline.items()) else " "
+        print(f"{marker} {row['embedding_model'][-24:]:<24} {chunk:>9} {row['search']:<10} {row['k']:>3} {row['fetch_k'] or '-':>5}"
+              f" {'-' if row['lambda_mult'] is None else row['lambda_mult']:>4} {row['budget']:>6}"
+              f" {row['recall']:>8.3f} {row['mrr']:>5.3f} {row['context_recall']:>7.3f} {row['tokens_before']:>7.0f}"
+              f" {row['tokens_after']:>7.0f} {row['p50_ms']:>7.2f} {row['p95_ms']:>7.2f}")
+
+
+def main():
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        from chatbot import RETRIEVAL_SEARCH_KWARGS
+        from context_builder import CONTEXT_TOKEN_BUDGET
+
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality and latency across configurations")
+    parser.add_argument("--dataset", help="Labelled questions (JSON list or JSONL)")
+    parser.add_argument("--corpus", help="Directory of documents to re-ingest for every chunking/embedding configuration")
+    parser.add_argument("--synthetic", action="store_true", help="Use the load-test articles and a labelled set built from them")
+    parser.add_argument("--variants", type=int, default=3, help="Synthetic revisions per topic")
+    parser.add_argument("--search", type=_str_list, default=["mmr"], help="mmr and/or similarity")
+    parser.add_argument("--k", type=_int_list, default=[RETRIEVAL_SEARCH_KWARGS["k"]])
+    parser.add_argument("--fetch-k", type=_int_list, default=[RETRIEVAL_SEARCH_KWARGS["fetch_k"]])
+    parser.add_argument("--lambda", dest="lambda_mult", type=_float_list, default=[RETRIEVAL_SEARCH_KWARGS["lambda_mult"]])
+    parser.add_argument("--budget", type=_int_list, default=[CONTEXT_TOKEN_BUDGET], help="Context token budgets")
+    parser.add_argument("--chunk-size", type=_int_list, default=[1000])
+    parser.add_argument("--chunk-overlap", type=_int_list, default=[200])
+    parser.add_argument("--embedding-model", type=_str_list, default=["all-MiniLM-L6-v2"])
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        dataset = load_dataset(args.dataset) if args.dataset else synthetic_dataset(args.variants)
+        corpus = synthetic_corpus(args.variants)
+    elif args.dataset:
+        dataset = load_dataset(args.dataset)
+        corpus = read_corpus(args.corpus) if args.corpus else None
+    else:
+        parser.error("--dataset is required unless --synthetic is given")
+    unknown = set(args.search) - {"mmr", "similarity"}
+    if unknown:
+        parser.error(f"Unknown search type(s): {', '.join(sorted(unknown))}")
+
+    baseline = {"search": "mmr", **RETRIEVAL_SEARCH_KWARGS, "budget": CONTEXT_TOKEN_BUDGET}
+    rows = []
+    if corpus is None:
+        # The configured store: only the retrieval parameters can vary
+        baseline["chunk_size"] = None
+        for config in search_configs(args):
+            rows.append({"embedding_model": "configured", "chunk_size": None, "chunk_overlap": None, "chunks": None, **config, **evaluate(dataset, config)})
+    else:
+        baseline.update({"embedding_model": "all-MiniLM-L6-v2", "chunk_size": 1000, "chunk_overlap": 200})
+        for embedding_model, chunk_size, chunk_overlap in itertools.product(args.embedding_model, args.chunk_size, args.chunk_overlap):
+            if chunk_overlap >= chunk_size:
+                continue
+            directory = tempfile.mkdtemp(prefix="vega_retrieval_eval_")
+            try:
+                store, embeddings, chunks = build_store(corpus, embedding_model, chunk_size, chunk_overlap, directory)
+                with use_store(store, embeddings):
+                    for config in search_configs(args):
+                        rows.append({"embedding_model": embedding_model, "chunk_size": chunk_size, "chunk_overlap": chunk_overlap,
+                                     "chunks": chunks, **config, **evaluate(dataset, config)})
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps({"questions": len(dataset), "baseline": baseline, "results": rows}, indent=2))
+    else:
+        print_report(rows, baseline, len(dataset))
+
+
+if __name__ == "__main__":
+    main()
@@ -41,6 +41,11 @@ declare global {
   }
 }
 
+// Files per /files request (the rest are loaded with "Load more")
+const FILES_PAGE_SIZE = 100
+// Delay before the search box refetches the file list
+const SEARCH_DEBOUNCE_MS = 300
+
 interface UploadedFile {
   id: string
   name: string
@@ -65,11 +70,14 @@ export default function UploadPage() {
   const [typeFilter, setTypeFilter] = useState<string>("all")
   const [statusFilter, setStatusFilter] = useState<string>("all") 
   const [searchTerm, setSearchTerm] = useState("")
+  const [searchPrefix, setSearchPrefix] = useState("")
   const [chatMessage, setChatMessage] = useState("")
   const [isChatOpen, setIsChatOpen] = useState(false)
   const [isAnimating, setIsAnimating] = useState(false)
   const [isEntering, setIsEntering] = useState(false)
   const [isLoadingFiles, setIsLoadingFiles] = useState(true)
+  const [isLoadingMoreFiles, setIsLoadingMoreFiles] = useState(false)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
   
   // URL upload states
   const [websiteUrl, setWebsiteUrl] = useState("")
@@ -114,14 +122,25 @@ export default function UploadPage() {
 
   const API_BASE = import.meta.env.VITE_BACKEND_URL || "http://localhost:8000"
 
-  // Function to fetch files from backend
-  const fetchFiles = async () => {
+  // Function to fetch files from backend (first page, or the page after `cursor` appended to the list)
+  const fetchFiles = async (cursor?: string) => {
     try {
-      setIsLoadingFiles(true)
+      if (cursor) {
+        setIsLoadingMoreFiles(true)
+      } else {
+        setIsLoadingFiles(true)
+      }
       const authToken = localStorage.getItem('authToken')
       const tokenType = localStorage.getItem('tokenType') || 'Bearer'
 
-      const response = await fetch(`${API_BASE}/files`, {
+      // Type, status and the search box (a name prefix) are filtered by the backend
+      const params = new URLSearchParams({ limit: String(FILES_PAGE_SIZE) })
+      if (typeFilter !== "all") params.set('type', typeFilter)
+      if (statusFilter !== "all") params.set('status', statusFilter)
+      if (searchPrefix) params.set('prefix', searchPrefix)
+      if (cursor) params.set('cursor', cursor)
+
+      const response = await fetch(`${API_BASE}/files?${params}`, {
         headers: {
           'Authorization': `${tokenType} ${authToken}`
         }
@@ -148,12 +167,14 @@ export default function UploadPage() {
         lastModified: new Date(file.lastModified || file.uploadDate)
       }))
       
-      setFiles(transformedFiles)
+      setFiles(prevFiles => cursor ? [...prevFiles, ...transformedFiles] : transformedFiles)
+      setNextCursor(data.nextCursor ?? null)
     } catch (error) {
       console.error('Error fetching files:', error)
       showNotification('Failed to load files', 'error')
     } finally {
       setIsLoadingFiles(false)
+      setIsLoadingMoreFiles(false)
     }
   }
 
@@ -192,10 +213,16 @@ export default function UploadPage() {
     }
   }
 
-  // Load files on component mount
+  // Load files on component mount and when the type/status filters or the search prefix change
   useEffect(() => {
     fetchFiles()
-  }, [])
+  }, [typeFilter, statusFilter, searchPrefix])
+
+  // Refetch only once typing pauses
+  useEffect(() => {
+    const timeout = setTimeout(() => setSearchPrefix(searchTerm.trim()), SEARCH_DEBOUNCE_MS)
+    return () => clearTimeout(timeout)
+  }, [searchTerm])
 
   const handleChatToggle = (open: boolean) => {
     if (open) {
@@ -480,7 +507,7 @@ export default function UploadPage() {
   const filteredFiles = files.filter(file => {
     const matchesType = typeFilter === "all" || file.type === typeFilter
     const matchesStatus = statusFilter === "all" || file.status === statusFilter
-    const matchesSearch = file.name.toLowerCase().includes(searchTerm.toLowerCase())
+    const matchesSearch = file.name.toLowerCase().startsWith(searchTerm.trim().toLowerCase())
     return matchesType && matchesStatus && matchesSearch
   })
 
@@ -984,7 +1011,7 @@ export default function UploadPage() {
             <div className="flex flex-col sm:flex-row gap-3">
               <div className="flex-1 min-w-0">
                 <Input
-                  placeholder="Search files..."
+                  placeholder="Search files by name..."
                   value={searchTerm}
                   onChange={(e) => setSearchTerm(e.target.value)}
                 />
@@ -1114,6 +1141,19 @@ export default function UploadPage() {
                     ))
                   )}
                 </div>
+                {!isLoadingFiles && nextCursor && (
+                  <div className="flex justify-center p-3 border-t">
+                    <Button
+                      variant="outline"
+                      size="sm"
+                      onClick={() => fetchFiles(nextCursor)}
+                      disabled={isLoadingMoreFiles}
+                    >
+                      {isLoadingMoreFiles && <RefreshCw className="w-4 h-4 mr-1 animate-spin" />}
+                      Load more
+                    </Button>
+                  </div>
+                )}
               </div>
             </div>
           </CardContent>
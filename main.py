@@ -49,16 +49,20 @@ agenbotc_dir = os.path.join(os.path.dirname(__file__), "agenbotc")
 sys.path.append(os.path.abspath(agenbotc_dir))
 env_path = os.path.join(agenbotc_dir, ".env")
 
-from fastapi import FastAPI, HTTPException, Request, File, Response, UploadFile, Form, Depends
+from fastapi import FastAPI, HTTPException, Request, File, Response, UploadFile, Form, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer
 from pydantic import BaseModel
 import yaml
 import json
 import tempfile
-from typing import List, Optional
+import time
+import asyncio
+from typing import List, Optional, Literal
 from datetime import timedelta, datetime
 import warnings
+from contextlib import asynccontextmanager
 
 # === Load credentials from .env file (place it with content - OPENAI_API_KEY=<your-api-key> within the agenbotc folder)===
 print(f"Loading .env file from: {env_path}")
@@ -79,10 +83,18 @@ else:
     print("WARNING: HEYGEN_API_KEY not found in .env file!")
 
 from ingestion import process_pdf, process_docx, process_ppt, process_website
-from llm_agent import LLMAgent
+from llm_agent import LLMAgent, BATCH_MAX_QUESTIONS, BATCH_CONCURRENCY
 from tomcat_monitor import TomcatMonitor
 from vector_store import delete_from_vector_store, get_document_count
 from readfile import read_file
+import llm_client
+import tracing
+from usage_meter import usage_meter, UsageLimitExceeded
+from session_store import session_store
+from answer_cache import split_mode_tag
+from query_log import query_log
+from file_catalog import SQLiteFileCatalog, FILES_PAGE_SIZE, FILES_MAX_PAGE_SIZE
+from warmup import cache_warmer, WARMUP_ON_STARTUP, WARMUP_TOP_N
 from auth import (
     user_manager, 
     create_access_token, 
@@ -113,38 +125,41 @@ def load_config():
     with open(config_path, "r") as f:
         return yaml.safe_load(f)
 
-app = FastAPI(title="Vega.ai Backend API", version="1.0.0")
-
-# File tracking functionality
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application startup/shutdown"""
+    # Persist per-user token usage periodically
+    usage_flusher = asyncio.create_task(usage_meter.run_flusher())
+    query_log_flusher = asyncio.create_task(query_log.run_flusher())
+    # Write buffered last_login updates of the user store
+    login_flusher = asyncio.create_task(user_manager.store.run_flusher())
+    # Warm the caches with the most frequent logged questions; /ready answers 503 until it is done
+    warmup_task = asyncio.create_task(cache_warmer.run_startup(llm_agent)) if WARMUP_ON_STARTUP else None
+    yield
+    if warmup_task:
+        warmup_task.cancel()
+    usage_flusher.cancel()
+    query_log_flusher.cancel()
+    login_flusher.cancel()
+    usage_meter.flush()
+    query_log.flush()
+    user_manager.store.flush()
+    # Close the pooled LLM HTTP connections
+    await llm_client.aclose()
+
+app = FastAPI(title="Vega.ai Backend API", version="1.0.0", lifespan=lifespan)
+
+# File tracking (SQLite catalog, see file_catalog.py); an empty catalog imports the legacy agenbotc/files.json
 agenbotc_dir = os.path.join(os.path.dirname(__file__), "agenbotc")
 os.makedirs(agenbotc_dir, exist_ok=True)  # Ensure agenbotc directory exists
-FILES_JSON_PATH = os.path.join(agenbotc_dir, "files.json")
-
-def load_files_data():
-    """Load files data from JSON file"""
-    try:
-        if os.path.exists(FILES_JSON_PATH):
-            with open(FILES_JSON_PATH, 'r') as f:
-                return json.load(f)
-        return {}
-    except Exception as e:
-        print(f"Error loading files data: {e}")
-        return {}
-
-def save_files_data(files_data):
-    """Save files data to JSON file"""
-    try:
-        with open(FILES_JSON_PATH, 'w') as f:
-            json.dump(files_data, f, indent=2, default=str)
-    except Exception as e:
-        print(f"Error saving files data: {e}")
+file_catalog = SQLiteFileCatalog()
+file_catalog.import_legacy()
+tracing.register_stats("file_catalog", file_catalog.stats)
 
 def add_file_record(filename, file_type, file_size, username, doc_id=None, url=None):
     """Add a file record to the tracking system"""
-    files_data = load_files_data()
-    
     file_record = {
-        "id": doc_id or f"file_{len(files_data) + 1}_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+        "id": doc_id or f"file_{file_catalog.count() + 1}_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
         "name": filename,
         "type": file_type.upper(),
         "size": file_size,
@@ -155,47 +170,31 @@ def add_file_record(filename, file_type, file_size, username, doc_id=None, url=N
         "url": url  # For website URLs
     }
     
-    files_data[file_record["id"]] = file_record
-    save_files_data(files_data)
+    file_catalog.add(file_record)
     return file_record["id"]
 
 def get_user_files(username):
-    """Get all files uploaded by a specific user"""
-    files_data = load_files_data()
-    user_files = []
-    
-    for file_id, file_info in files_data.items():
-        if file_info.get("uploadedBy") == username:
-            user_files.append(file_info)
-    
-    # Sort by upload date (newest first)
-    user_files.sort(key=lambda x: x.get("uploadDate", ""), reverse=True)
-    return user_files
+    """Get all files uploaded by a specific user (newest first)"""
+    return file_catalog.list_by_user(username)
 
 def delete_file_record(file_id, username):
-    """Delete a file record and its vectors from files.json and ChromaDB"""
-    files_data = load_files_data()
+    """Delete a file record and its vectors from the file catalog and ChromaDB"""
+    # Only the uploader's record is deleted (one atomic statement)
+    if not file_catalog.delete(file_id, username):
+        return False
     
-    if file_id in files_data:
-        file_info = files_data[file_id]
-        if file_info.get("uploadedBy") == username:
-            # Delete from JSON file
-            del files_data[file_id]
-            save_files_data(files_data)
-            
-            # Delete from ChromaDB vector store
-            try:
-                vector_deleted = delete_from_vector_store(file_id)
-                if vector_deleted:
-                    print(f"Successfully deleted vectors for doc_id: {file_id}")
-                else:
-                    print(f"No vectors found to delete for doc_id: {file_id}")
-            except Exception as e:
-                print(f"Error deleting vectors for doc_id {file_id}: {str(e)}")
-                # Don't fail the entire operation if vector deletion fails
-            
-            return True
-    return False
+    # Delete from ChromaDB vector store
+    try:
+        vector_deleted = delete_from_vector_store(file_id)
+        if vector_deleted:
+            print(f"Successfully deleted vectors for doc_id: {file_id}")
+        else:
+            print(f"No vectors found to delete for doc_id: {file_id}")
+    except Exception as e:
+        print(f"Error deleting vectors for doc_id {file_id}: {str(e)}")
+        # Don't fail the entire operation if vector deletion fails
+    
+    return True
 
 # CORS
 app.add_middleware(
@@ -204,8 +203,38 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
 )
 
+# Request tracing: one trace ID per request (echoed in X-Trace-Id and prefixed to pipeline logs),
+# request latency histogram and a per-stage breakdown logged once the response body is sent
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    trace_id = tracing.start_trace(request.headers.get("x-trace-id") or request.headers.get("x-request-id"))
+    started = time.perf_counter()
+
+    def route_path():
+        route = request.scope.get("route")
+        return getattr(route, "path", "unmatched")
+
+    try:
+        response = await call_next(request)
+    except Exception:
+        tracing.finish_request(request.method, route_path(), 500, time.perf_counter() - started)
+        raise
+    response.headers["X-Trace-Id"] = trace_id
+    body_iterator = response.body_iterator
+
+    async def traced_body():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            tracing.finish_request(request.method, route_path(), response.status_code, time.perf_counter() - started)
+
+    response.body_iterator = traced_body()
+    return response
+
 class LoginRequest(BaseModel):
     username: str
     password: str
@@ -223,11 +252,26 @@ async def health_check():
     """Health check endpoint for monitoring"""
     return {"status": "healthy", "timestamp": datetime.now().isoformat(), "memory_usage": get_memory_usage()}
 
+# Readiness: 503 until the startup cache warm-up has finished (see warmup.py)
+@app.get("/ready")
+async def readiness_check():
+    """Readiness endpoint for load balancers"""
+    if not cache_warmer.ready:
+        return Response(content=json.dumps({"status": cache_warmer.state}), status_code=503, media_type="application/json")
+    return {"status": "ready", "warmup": cache_warmer.last_result}
+
+# Prometheus metrics: stage latency histograms, LLM token counters, stage errors, cache/coalescing stats
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint"""
+    body, content_type = tracing.render_metrics()
+    return Response(content=body, media_type=content_type)
+
 # Enhanced authentication system with JWT tokens and secure password hashing
 @app.post("/login", response_model=Token)
 async def login(login_data: UserLogin):
     """Authenticate user and return JWT token"""
-    user = user_manager.authenticate_user(login_data.username, login_data.password)
+    user = await user_manager.aauthenticate_user(login_data.username, login_data.password)
     if not user:
         raise HTTPException(
             status_code=401,
@@ -267,7 +311,7 @@ async def create_user(
     current_user: User = Depends(require_admin)
 ):
     """Create a new user (admin only)"""
-    new_user = user_manager.create_user(user_data)
+    new_user = await user_manager.acreate_user(user_data)
     return User(
         username=new_user.username,
         email=new_user.email,
@@ -333,17 +377,32 @@ async def update_user(
 # -------------------------------------------------------------------------------------------------------------
 # File Management Endpoints
 @app.get("/files")
-async def get_files(current_user: User = Depends(get_current_active_user)):
-    """Get all files uploaded by the current user"""
-    user_files = get_user_files(current_user.username)
-    return {"files": user_files}
+async def get_files(
+    limit: int = Query(FILES_PAGE_SIZE, ge=1, le=FILES_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    file_type: Optional[str] = Query(None, alias="type"),
+    status: Optional[str] = None,
+    prefix: Optional[str] = None,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    One page of the current user's files, newest first. Filter by type, status and name prefix
+    (case-insensitive); pass the returned nextCursor to get the following page (null on the last one).
+    """
+    try:
+        user_files, next_cursor = await asyncio.to_thread(
+            file_catalog.list_page, current_user.username, limit, cursor, file_type, status, prefix
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"files": user_files, "nextCursor": next_cursor}
 
 @app.delete("/files/{file_id}")
 async def delete_file(
     file_id: str,
     current_user: User = Depends(get_current_active_user)
 ):
-    """Delete a file record and its vectors from files.json and ChromaDB"""
+    """Delete a file record and its vectors from the file catalog and ChromaDB"""
     success = delete_file_record(file_id, current_user.username)
     if success:
         return {"status": "success", "message": "File record and vectors deleted successfully"}
@@ -585,6 +644,72 @@ class ChatRequest(BaseModel):
     file_name: Optional[str] = None
     file_content: Optional[str] = None
     file_name: Optional[str] = None
+    # "inline": avatarText in the response, "deferred": fetch it from /Agentchat/avatar/{responseId},
+    # "none": no avatar text is generated
+    avatar_mode: Literal["inline", "deferred", "none"] = "inline"
+    # Server-side conversation session: when set, history is kept by the server and request.history is ignored
+    session_id: Optional[str] = None
+
+def resolve_chat_session(request: ChatRequest, current_user: User):
+    """Get (or create) the server-side session named in a chat request, None when not using sessions"""
+    if not request.session_id:
+        return None
+    if not session_store.is_valid_session_id(request.session_id):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid session id"
+        )
+    session = session_store.get_or_create(request.session_id, current_user.username)
+    if session is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Session not found"
+        )
+    return session
+
+def admit_chat_request(current_user: User):
+    """Enforce the user's usage limits before any LLM call (pair with usage_meter.release)"""
+    try:
+        usage_meter.admit(current_user.username, current_user.role)
+    except UsageLimitExceeded as e:
+        print(f"Usage limit ({e.reason}) hit by user: {current_user.username}")
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+def record_session_turn(session, question: str, answer: str):
+    """Append a turn to a server-side session and compact its history in the background if over budget"""
+    session_store.append_turn(session, question, answer)
+    session_store.schedule_compaction(session, llm_agent.summarize_history)
+
+def process_chat_file(request: ChatRequest):
+    """Run read_file on file content attached to a chat request (errors are logged, not raised)"""
+    if not (request.file_content and request.file_name):
+        return
+    print(f"\n@@@@@@@@@@@File upload detected: {request.file_name}")
+    
+    # Create a temporary file
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8') as temp_file:
+        temp_file.write(request.file_content)
+        temp_file_path = temp_file.name
+    
+    try:
+        # Call the read_file function silently for your workflow
+        print(f"\n@@@@@@@@@@@@Calling read_file function for: {request.file_name}")
+        read_file(temp_file_path)
+        
+        # Clean up the temporary file
+        os.unlink(temp_file_path)
+        print(f"\n@@@@@@@@@@@Temporary file cleaned up: {temp_file_path}")
+        
+    except Exception as file_error:
+        print(f"\n@@@@@@@@@@@Error in read_file function: {str(file_error)}")
+        # Clean up the temporary file in case of error
+        if os.path.exists(temp_file_path):
+            os.unlink(temp_file_path)
+        # Continue with normal processing even if file processing fails
 
 # -------------------------------------------------------------------------------------------------------------
 # Handles advanced chat interactions using the LLM agent for more sophisticated query processing
@@ -595,43 +720,38 @@ async def Agentchat(
 ):
     """Main chat endpoint that routes queries through LLM agent with authentication"""
     print(f"\n@@@@@@@@@@@@@Processing query through LLM agent for user: {current_user.username}")
+    session = resolve_chat_session(request, current_user)
+    admit_chat_request(current_user)
     try:
         # Check if file content is provided and call read_file function silently
-        if request.file_content and request.file_name:
-            print(f"\n@@@@@@@@@@@File upload detected: {request.file_name}")
-            
-            # Create a temporary file
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8') as temp_file:
-                temp_file.write(request.file_content)
-                temp_file_path = temp_file.name
-            
-            try:
-                # Call the read_file function silently for your workflow
-                print(f"\n@@@@@@@@@@@@Calling read_file function for: {request.file_name}")
-                read_file(temp_file_path)
-                
-                # Clean up the temporary file
-                os.unlink(temp_file_path)
-                print(f"\n@@@@@@@@@@@Temporary file cleaned up: {temp_file_path}")
-                
-            except Exception as file_error:
-                print(f"\n@@@@@@@@@@@Error in read_file function: {str(file_error)}")
-                # Clean up the temporary file in case of error
-                if os.path.exists(temp_file_path):
-                    os.unlink(temp_file_path)
-                # Continue with normal processing even if file processing fails
+        process_chat_file(request)
         
         # Process query through LLM agent (same as before for all requests)
-        response_data = await llm_agent.process_query(request.question, request.history)
-        print(f"\n\n\n@@@@@@@@@@@@@ main.py LLM Agent response: {response_data}")
+        history = session_store.history(session) if session else request.history
+        response_data = await llm_agent.process_query(
+            request.question,
+            history,
+            avatar_mode=request.avatar_mode,
+            owner=current_user.username
+        )
+        tracing.log(f"\n\n\n@@@@@@@@@@@@@ main.py LLM Agent response: {response_data}")
         
         # Handle different response formats
         if isinstance(response_data, dict):
             # If response is already a dict with verbose and avatar text
-            return {
+            response = {
                 "response": response_data.get("verbose", str(response_data)),
                 "avatarText": response_data.get("avatar", str(response_data))
             }
+            if response_data.get("response_id"):
+                response["responseId"] = response_data["response_id"]
+            if response_data.get("error"):
+                response["status"] = "error"
+            if session:
+                if not response_data.get("error"):
+                    record_session_turn(session, request.question, response["response"])
+                response["sessionId"] = session["id"]
+            return response
         else:
             # If response is a string, use it as both verbose and avatar text
             response_str = str(response_data)
@@ -646,6 +766,215 @@ async def Agentchat(
             "avatarText": "I encountered an error while processing your request. Please try again.",
             "status": "error"
         }
+    finally:
+        usage_meter.release(current_user.username)
+
+# -------------------------------------------------------------------------------------------------------------
+# Streaming variant of /Agentchat: sends the answer tokens as Server-Sent Events as soon as they arrive
+def format_sse(event: str, data) -> str:
+    """Format a single Server-Sent Event (data is JSON encoded so newlines survive)"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/Agentchat/stream")
+async def Agentchat_stream(
+    request: ChatRequest,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Streaming chat endpoint (text/event-stream).
+    Events: "token" (answer delta), "answer" (full verbose answer), "avatar" (avatar text),
+    "error" (error message) and "done".
+    """
+    print(f"\n@@@@@@@@@@@@@Streaming query through LLM agent for user: {current_user.username}")
+    session = resolve_chat_session(request, current_user)
+    admit_chat_request(current_user)
+    try:
+        history = session_store.history(session) if session else request.history
+        process_chat_file(request)
+    except Exception:
+        usage_meter.release(current_user.username)
+        raise
+
+    async def event_stream():
+        try:
+            if session:
+                yield format_sse("session", session["id"])
+            async for event in llm_agent.stream_query(request.question, history, avatar_mode=request.avatar_mode):
+                if session and event["event"] == "answer":
+                    record_session_turn(session, request.question, event["data"])
+                yield format_sse(event["event"], event.get("data", ""))
+        finally:
+            usage_meter.release(current_user.username)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# -------------------------------------------------------------------------------------------------------------
+# Batch question answering for internal tools (doc validation after upgrades, FAQ pre-generation):
+# one embedding batch and one vector query for all questions, QA calls with bounded concurrency
+class BatchChatRequest(BaseModel):
+    questions: List[str]
+    # LLM calls in flight for this batch (capped at BATCH_CONCURRENCY)
+    concurrency: Optional[int] = None
+
+@app.post("/Agentchat/batch")
+async def Agentchat_batch(
+    request: BatchChatRequest,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Answer a list of standalone questions; returns per-question answers and batch timing"""
+    questions = [question.strip() for question in request.questions]
+    if not questions or not all(split_mode_tag(question)[1].strip() for question in questions):
+        raise HTTPException(status_code=400, detail="questions must be a non-empty list of non-empty strings")
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+    concurrency = min(request.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY)
+    print(f"\n@@@@@@@@@@@@@Batch of {len(questions)} questions for user: {current_user.username}")
+    admit_chat_request(current_user)
+    try:
+        batch = await llm_agent.answer_batch(questions, concurrency=concurrency)
+    finally:
+        usage_meter.release(current_user.username)
+    timing = batch["timing"]
+    return {
+        "results": [
+            {
+                "question": result["question"],
+                "answer": result["answer"],
+                "docIds": result["doc_ids"],
+                "cached": result["cached"],
+                "seconds": round(result["seconds"], 3),
+                **({"status": "error"} if result.get("error") else {})
+            }
+            for result in batch["results"]
+        ],
+        "timing": {
+            "totalSeconds": round(timing["total_seconds"], 3),
+            "retrievalSeconds": round(timing["retrieval_seconds"], 3),
+            "llmSeconds": round(timing["llm_seconds"], 3),
+            "questions": timing["questions"],
+            "uniqueQuestions": timing["unique_questions"],
+            "cacheHits": timing["cache_hits"],
+            "chunksRetrieved": timing["chunks_retrieved"],
+            "uniqueChunks": timing["unique_chunks"]
+        }
+    }
+
+# -------------------------------------------------------------------------------------------------------------
+# Per-user LLM token usage (hourly buckets, see usage_meter.py)
+@app.get("/usage/me")
+async def get_my_usage(
+    hours: int = 24,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Token usage and limits of the current user"""
+    rows = await asyncio.to_thread(usage_meter.summary, hours, current_user.username)
+    return {
+        "usage": rows[0] if rows else {"username": current_user.username, "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        "tokensLastDay": usage_meter.tokens_last_day(current_user.username),
+        "limits": usage_meter.limits_for(current_user.username, current_user.role)
+    }
+
+@app.get("/usage")
+async def get_usage(
+    hours: int = 24,
+    current_user: User = Depends(require_admin)
+):
+    """Per-user token usage over the last `hours` hours, heaviest users first (admin only)"""
+    return {"hours": hours, "users": await asyncio.to_thread(usage_meter.summary, hours)}
+
+# -------------------------------------------------------------------------------------------------------------
+# Cache warm-up from the anonymized query log (see query_log.py, warmup.py)
+class WarmupRequest(BaseModel):
+    top_n: int = WARMUP_TOP_N
+    # Also answer the questions (fills the answer cache, spends LLM tokens)
+    full_pipeline: bool = False
+
+@app.post("/warmup")
+async def warm_up_caches(
+    request: WarmupRequest,
+    current_user: User = Depends(require_admin)
+):
+    """Replay the most frequent logged questions through retrieval (and optionally the QA pipeline) (admin only)"""
+    result = await cache_warmer.run(llm_agent, top_n=request.top_n, full_pipeline=request.full_pipeline)
+    return {
+        "questions": result["questions"],
+        "chunksRetrieved": result["chunks"],
+        "answered": result["answered"],
+        "seconds": round(result["seconds"], 3)
+    }
+
+@app.get("/query-log")
+async def get_query_log(
+    limit: int = 50,
+    current_user: User = Depends(require_admin)
+):
+    """Most frequent anonymized questions of the retention period (admin only)"""
+    return {"questions": await asyncio.to_thread(query_log.top, limit)}
+
+# -------------------------------------------------------------------------------------------------------------
+# Server-side conversation sessions (history kept by the server, older turns rolled into a summary)
+@app.post("/sessions")
+async def create_session(current_user: User = Depends(get_current_active_user)):
+    """Create a chat session; pass its sessionId as session_id to /Agentchat"""
+    session = session_store.create(current_user.username)
+    return {"sessionId": session["id"]}
+
+@app.get("/sessions/{session_id}")
+async def get_session(
+    session_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Get the stored summary and recent turns of a chat session"""
+    session = session_store.get(session_id, current_user.username)
+    if session is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Session not found"
+        )
+    return {
+        "sessionId": session["id"],
+        "summary": session["summary"],
+        "turns": [{"question": q, "answer": a} for q, a in session["turns"]],
+        "historyTokens": session_store.history_tokens(session)
+    }
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(
+    session_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Delete a chat session"""
+    if not session_store.delete(session_id, current_user.username):
+        raise HTTPException(
+            status_code=404,
+            detail="Session not found"
+        )
+    return {"message": "Session deleted successfully"}
+
+# -------------------------------------------------------------------------------------------------------------
+# Fetch avatar text generated in the background for an /Agentchat request sent with avatar_mode="deferred"
+@app.get("/Agentchat/avatar/{response_id}")
+async def get_deferred_avatar(
+    response_id: str,
+    wait: float = 0,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Get deferred avatar text; wait (seconds, max 30) long-polls while it is still being generated"""
+    result = await llm_agent.avatar_store.get(
+        response_id,
+        owner=current_user.username,
+        wait_seconds=min(max(wait, 0), 30)
+    )
+    if result is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Response not found or expired"
+        )
+    return {"responseId": response_id, "status": result["status"], "avatarText": result["avatar"]}
 
 # -------------------------------------------------------------------------------------------------------------
 # Get Heygen API key from env
@@ -0,0 +1,52 @@
+"""
+Test setup: agenbotc modules on the path, their databases in a temporary directory, and a local
+stand-in for the HuggingFace embedding model that vector_store loads at import, so the tests run
+offline (no model download).
+"""
+
+import os
+import sys
+import hashlib
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_DIR, "agenbotc"))
+
+DATA_DIR = tempfile.mkdtemp(prefix="vega_tests_")
+for env, name in (
+    ("VECTOR_DB_PATH", "vectorstore"),
+    ("USERS_DB_PATH", "users.db"),
+    ("USAGE_DB_PATH", "usage.db"),
+    ("QUERY_LOG_DB_PATH", "query_log.db"),
+    ("FILES_DB_PATH", "files.db")
+):
+    os.environ.setdefault(env, os.path.join(DATA_DIR, name))
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import langchain_community.embeddings
+from langchain_core.embeddings import Embeddings
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic bag-of-words vectors in place of all-MiniLM-L6-v2"""
+
+    dimensions = 64
+
+    def __init__(self, **kwargs):
+        pass
+
+    def _embed(self, text: str):
+        vector = [0.0] * self.dimensions
+        for word in text.lower().split():
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dimensions] += 1.0
+        norm = sum(value * value for value in vector) ** 0.5 or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+langchain_community.embeddings.HuggingFaceEmbeddings = HashEmbeddings
@@ -0,0 +1,55 @@
+"""
+Password hashing pool (auth.PasswordHasher) queue accounting.
+
+Usage:
+    python -m pytest tests
+"""
+
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from auth import PasswordHasher
+
+
+def test_cancelled_waiting_login_gives_back_its_queue_slot():
+    hasher = PasswordHasher(workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def scenario():
+        # The only worker is busy, so the second job waits in the queue
+        running = asyncio.ensure_future(hasher._submit("verify", release.wait))
+        while hasher.stats()["running"] == 0:
+            await asyncio.sleep(0.01)
+        waiting = asyncio.ensure_future(hasher._submit("verify", lambda: True))
+        await asyncio.sleep(0.01)
+        assert hasher.stats()["queued"] == 1
+
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert hasher.stats()["queued"] == 0
+
+        # The slot is free again: a new login is queued instead of rejected with 503
+        queued = asyncio.ensure_future(hasher._submit("verify", lambda: True))
+        await asyncio.sleep(0.01)
+        release.set()
+        assert await running is True
+        assert await queued is True
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        release.set()
+    assert hasher.stats() == {"queued": 0, "running": 0, "rejected": 0}
+
+
+def test_full_queue_is_rejected_with_503():
+    hasher = PasswordHasher(workers=1, max_queue=0)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(hasher._submit("verify", lambda: True))
+    assert error.value.status_code == 503
+    assert hasher.stats()["rejected"] == 1
@@ -0,0 +1,75 @@
+"""
+Batch answering (LLMAgent.answer_batch) with the embedding model, vector search and QA call replaced
+by fakes, so only the batching logic runs.
+
+Usage:
+    python -m pytest tests
+"""
+
+import asyncio
+
+import pytest
+from langchain_core.documents import Document
+
+import llm_agent
+import retrieval_cache as retrieval_cache_module
+from llm_agent import LLMAgent
+from retrieval_cache import retrieval_cache
+
+
+@pytest.fixture
+def searches(monkeypatch):
+    """Fake embeddings and vector search; returns the list of search batches"""
+    batches = []
+
+    def embed_documents(texts):
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def mmr_search_batch(queries, k=8, fetch_k=24, lambda_mult=0.5, query_embeddings=None):
+        batches.append(list(queries))
+        return [([Document(page_content=f"About {query}", metadata={"doc_id": f"doc-{query}"})], [f"chunk-{query}"], [0.1]) for query in queries]
+
+    monkeypatch.setattr(llm_agent.embeddings, "embed_documents", embed_documents)
+    monkeypatch.setattr(retrieval_cache_module, "mmr_search_batch", mmr_search_batch)
+    monkeypatch.setattr(retrieval_cache, "enabled", False)
+    return batches
+
+
+@pytest.fixture
+def agent():
+    """LLMAgent without a client or answer cache; the QA call answers with the prompt length"""
+    agent = LLMAgent.__new__(LLMAgent)
+    agent.answer_cache = None
+
+    async def answer_batch_question(prompt, semaphore, priority):
+        return f"answer {len(prompt)}"
+
+    agent._answer_batch_question = answer_batch_question
+    return agent
+
+
+def test_mode_tag_only_question_is_an_error(agent, searches):
+    questions = ["How do I restart the server?", "[MODE: HOWTO]", "[MODE: EXPLAIN] What is a heap dump?"]
+    batch = asyncio.run(agent.answer_batch(questions))
+
+    results = batch["results"]
+    assert [result["question"] for result in results] == questions
+    assert results[1]["error"] and results[1]["answer"] == "Empty question"
+    assert not results[0].get("error") and results[0]["doc_ids"] == ["doc-How do I restart the server?"]
+    assert not results[2].get("error") and results[2]["doc_ids"] == ["doc-What is a heap dump?"]
+    # One vector query for the batch, without the empty search text
+    assert searches == [["How do I restart the server?", "What is a heap dump?"]]
+
+
+def test_duplicates_are_answered_once(agent, searches):
+    batch = asyncio.run(agent.answer_batch(["What is JVM?", "what is jvm", "[MODE: HOWTO]", "[MODE: HOWTO]"]))
+
+    assert batch["timing"]["unique_questions"] == 2
+    assert [result.get("error", False) for result in batch["results"]] == [False, False, True, True]
+    assert searches == [["What is JVM?"]]
+
+
+def test_retrieve_many_embeds_texts_missing_from_query_embeddings(searches):
+    documents = retrieval_cache.retrieve_many(["[MODE: HOWTO]", "Deploy a WAR"], query_embeddings={"Deploy a WAR": [1.0, 1.0]})
+
+    assert [docs[0].page_content for docs in documents] == ["About ", "About Deploy a WAR"]